@@ -64,7 +64,7 @@ import os
 
 from polar2grid.avhrr import readers
 from polar2grid.core import containers, roles
-from polar2grid.core.frontend_utils import ProductDict, GeoPairDict
+from polar2grid.core.frontend_utils import ProductDict, GeoPairDict, TASK_RAW, run_dependent_tasks
 
 LOG = logging.getLogger(__name__)
 
@@ -275,7 +275,10 @@ class Frontend(roles.FrontendRole):
         try:
             data_type = file_reader.get_data_type(file_key)
             fill_value = file_reader.get_fill_value(file_key)
-            shape = file_reader.write_var_to_flat_binary(file_key, filename, dtype=data_type)
+            swath_data = file_reader.get_swath_data(file_key, filename=filename, dtype=data_type)
+            shape = swath_data.shape
+            swath_data.flush()
+            del swath_data
             rows_per_scan = GEO_PAIRS[product_def.get_geo_pair_name(self.available_file_types)].rows_per_scan
         except (OSError, ValueError):
             LOG.error("Could not extract data from file")
@@ -322,8 +325,7 @@ class Frontend(roles.FrontendRole):
         # Needs to be ordered (least-depended product -> most-depended product)
         products_needed = PRODUCTS.dependency_ordered_products(products)
         geo_pairs_needed = PRODUCTS.geo_pairs_for_products(products_needed, self.available_file_types)
-        # both lists below include raw products that need extra processing/masking
-        raw_products_needed = (p for p in products_needed if PRODUCTS.is_raw(p, geo_is_raw=False))
+        # includes raw products that need extra processing/masking
         secondary_products_needed = [p for p in products_needed if PRODUCTS.needs_processing(p)]
         for p in secondary_products_needed:
             if p not in self.secondary_product_functions:
@@ -357,34 +359,36 @@ class Frontend(roles.FrontendRole):
             swath_def = self.create_swath_definition(lon_swath, lat_swath)
             swath_definitions[swath_def["swath_name"]] = swath_def
 
-        # Create each raw products (products that are loaded directly from the file)
-        for product_name in raw_products_needed:
-            if product_name in products_created:
-                # already created
-                continue
-
-            try:
+        # Create raw products (loaded directly from the file) and dependent/special case products (non-raw products or
+        # raw products that need further processing), independent products may be created at the same time
+        def _create_product(task):
+            stage, product_name = task
+            if stage == TASK_RAW:
                 LOG.info("Creating data product '%s'", product_name)
                 swath_def = swath_definitions[PRODUCTS[product_name].get_geo_pair_name(self.available_file_types)]
-                one_swath = products_created[product_name] = self.create_raw_swath_object(product_name, swath_def)
-            except (ValueError, OSError):
-                LOG.error("Could not create raw product '%s'", product_name)
-                if self.exit_on_error:
-                    raise
-                continue
-
-            if product_name in products:
-                # the user wants this product
-                scene[product_name] = one_swath
-
-        # Dependent products and Special cases (i.e. non-raw products that need further processing)
-        for product_name in reversed(secondary_products_needed):
-            product_func = self.secondary_product_functions[product_name]
+                return self.create_raw_swath_object(product_name, swath_def)
+            LOG.info("Creating secondary product '%s'", product_name)
             swath_def = swath_definitions[PRODUCTS[product_name].get_geo_pair_name(self.available_file_types)]
+            return self.secondary_product_functions[product_name](product_name, swath_def, products_created)
+
+        task_dependencies = PRODUCTS.product_task_dependencies(products_needed)
+        for (stage, product_name), future in run_dependent_tasks(task_dependencies, _create_product, self.num_workers):
+            if stage == TASK_RAW:
+                try:
+                    one_swath = products_created[product_name] = future.result()
+                except (ValueError, OSError):
+                    LOG.error("Could not create raw product '%s'", product_name)
+                    if self.exit_on_error:
+                        raise
+                    continue
+
+                if product_name in products:
+                    # the user wants this product
+                    scene[product_name] = one_swath
+                continue
 
             try:
-                LOG.info("Creating secondary product '%s'", product_name)
-                one_swath = product_func(product_name, swath_def, products_created)
+                one_swath = future.result()
             except (ValueError, OSError):
                 LOG.error("Could not create product (unexpected error): '%s'", product_name)
                 LOG.debug("Could not create product (unexpected error): '%s'", product_name, exc_info=True)
@@ -489,6 +493,9 @@ def add_frontend_argument_groups(parser):
                        help="Fraction of day required to produce reflectance products")
     group.add_argument("--sza-threshold", dest="sza_threshold", type=float, default=float(os.environ.get("P2G_SZA_THRESHOLD", 100)),
                        help="Angle threshold of solar zenith angle used when deciding day or night")
+    group.add_argument("--num-workers", dest="num_workers", type=int,
+                       default=int(os.environ.get("P2G_FRONTEND_NUM_WORKERS", 1)),
+                       help="Number of independent products to create at the same time (default: 1)")
     group.add_argument("--list-products", dest="list_products", action="store_true",
                         help="List available frontend products")
     group_title = "Frontend Swath Extraction"
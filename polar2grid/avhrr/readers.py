@@ -557,6 +557,15 @@ class AVHRRSingleFileReader(BaseFileReader):
     def get_swath_data(self, item):
         return self[item]
 
+    def get_swath_shape(self, item):
+        # avoid calibrating/interpolating the data just to find out how big it is
+        known_item = self.file_type_info[item]
+        num_rows = self.file_handle["scnlin"].shape[0]
+        if known_item.calibrate_func is get_band_3_mask:
+            return num_rows, 1
+        # calibrated channels and interpolated geolocation are the full swath width
+        return num_rows, self.file_handle["hrpt"].shape[1]
+
 
 class AVHRRMultiFileReader(BaseMultiFileReader):
     def __init__(self, file_type_info):
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Tests for the AVHRR AAPP L1B file readers.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+
+"""
+__docformat__ = "restructuredtext en"
+
+import os
+import sys
+
+import numpy
+import pytest
+
+from polar2grid.avhrr import readers
+
+
+class _FakeAAPPFile(dict):
+    def __init__(self, filename, start_day, num_rows, scnlinbit):
+        super(_FakeAAPPFile, self).__init__()
+        self.filename = filename
+        self.filepath = os.path.join("/tmp", filename)
+        self.update({
+            "startdatayr": numpy.array([2021]),
+            "startdatady": numpy.array([start_day]),
+            "startdatatime": numpy.array([0]),
+            "enddatayr": numpy.array([2021]),
+            "enddatady": numpy.array([start_day]),
+            "enddatatime": numpy.array([60000]),
+            "satid": numpy.array([7]),
+            "scnlin": numpy.arange(num_rows),
+            "scnlinbit": numpy.array(scnlinbit, dtype=numpy.int16),
+            "hrpt": numpy.zeros((num_rows, 16, 5), dtype=numpy.int16),
+        })
+
+
+@pytest.fixture
+def file_reader():
+    file_reader = readers.AVHRRMultiFileReader(readers.FILE_TYPES[readers.FT_AAPP])
+    file_reader.add_file(_FakeAAPPFile("hrpt_noaa18_2.l1b", 2, 3, [0, 1, 1]))
+    file_reader.add_file(_FakeAAPPFile("hrpt_noaa18_1.l1b", 1, 2, [1, 0]))
+    file_reader.finalize_files()
+    return file_reader
+
+
+class TestAVHRRFileReader(object):
+    def test_swath_shape(self, file_reader):
+        assert file_reader.satellite == "noaa18"
+        assert file_reader.file_readers[0].get_swath_shape(readers.K_BAND1) == (2, 16)
+        assert file_reader.get_swath_shape(readers.K_BAND1) == (5, 16)
+        assert file_reader.get_swath_shape(readers.K_BAND3_MASK) == (5, 1)
+
+    def test_band3_mask(self, tmpdir, file_reader):
+        expected = numpy.array([[True], [False], [False], [True], [True]])
+        band_mask = file_reader.get_swath_data(readers.K_BAND3_MASK)
+        numpy.testing.assert_array_equal(band_mask, expected)
+        filename = str(tmpdir.join("band3_mask.dat"))
+        band_mask = file_reader.get_swath_data(readers.K_BAND3_MASK, filename=filename, dtype=numpy.float32)
+        assert isinstance(band_mask, numpy.memmap)
+        numpy.testing.assert_array_equal(band_mask, expected.astype(numpy.float32))
+
+
+def main():
+    return pytest.main([os.path.realpath(__file__)])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
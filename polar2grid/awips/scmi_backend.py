@@ -88,6 +88,7 @@ import numpy as np
 
 from polar2grid.core import roles
 from polar2grid.core.containers import GriddedScene
+from polar2grid.core.statistics import ProductStatistics, get_statistics
 from configparser import NoSectionError, NoOptionError
 
 
@@ -837,12 +838,20 @@ class Backend(roles.BackendRole):
 
                 LOG.debug("Scaling %s data to fit in netcdf file...", gridded_product["product_name"])
                 bit_depth = gridded_product.setdefault("bit_depth", 16)
+                # the data limits (when needed) and pixel counts come from the same pass over the data
+                stats = get_statistics().start("write", product_name, grid_name)
                 valid_min = gridded_product.get('valid_min')
-                if valid_min is None:
-                    valid_min = np.nanmin(data)
                 valid_max = gridded_product.get('valid_max')
-                if valid_max is None:
-                    valid_max = np.nanmax(data)
+                if valid_min is None or valid_max is None:
+                    # the limits are needed even when statistics aren't being collected
+                    limits = stats if stats is not None else ProductStatistics("write", product_name, grid_name)
+                    limits.update(data.data, ~mask)
+                    valid_min = limits.min if valid_min is None else valid_min
+                    valid_max = limits.max if valid_max is None else valid_max
+                elif stats is not None:
+                    fill_count = np.count_nonzero(mask)
+                    stats.add(mask.size - fill_count, fill_count)
+                get_statistics().finish(stats)
                 pkwargs['valid_min'] = valid_min
                 pkwargs['valid_max'] = valid_max
                 pkwargs['bit_depth'] = bit_depth
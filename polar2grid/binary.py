@@ -41,7 +41,8 @@ import shutil
 
 from polar2grid.core import roles
 from polar2grid.core.dtype import str_to_dtype, clip_to_data_type
-from polar2grid.core.rescale import Rescaler, DEFAULT_RCONFIG
+from polar2grid.core.rescale import Rescaler, DEFAULT_RCONFIG, mask_helper
+from polar2grid.core.statistics import get_statistics
 
 LOG = logging.getLogger(__name__)
 DEFAULT_OUTPUT_PATTERN = "{satellite}_{instrument}_{product_name}_{begin_time}_{grid_name}.dat"
@@ -101,13 +102,16 @@ class Backend(roles.BackendRole):
         else:
             try:
                 LOG.debug("Scaling %s data to fit data type", gridded_product["product_name"])
+                # rescale and write one chunk at a time
                 data = self.rescaler.rescale_product(gridded_product, data_type,
-                                                     inc_by_one=inc_by_one, fill_value=fill_value)
-                data = clip_to_data_type(data, data_type)
+                                                     inc_by_one=inc_by_one, fill_value=fill_value, lazy=True)
+                LOG.info("Saving product %s to binary file %s", gridded_product["product_name"], output_filename)
+                self._store_rescaled(data, gridded_product, output_filename, data_type, fill_value)
             except ValueError:
                 if not self.keep_intermediate and os.path.isfile(output_filename):
                     os.remove(output_filename)
                 raise
+            return output_filename
 
         LOG.info("Saving product %s to binary file %s", gridded_product["product_name"], output_filename)
         data = data.astype(data_type)
@@ -117,6 +121,28 @@ class Backend(roles.BackendRole):
 
         return output_filename
 
+    @staticmethod
+    def _store_rescaled(data, gridded_product, output_filename, data_type, fill_value):
+        """Convert lazily rescaled data to `data_type` and write it to `output_filename` chunk by chunk.
+        """
+        import dask.array as da
+
+        def _convert_block(data_block, input_block):
+            data_block = clip_to_data_type(data_block, data_type)
+            data_block[mask_helper(input_block, gridded_product["fill_value"])] = fill_value
+            return data_block
+
+        input_data = da.from_array(gridded_product.get_data_array(), chunks=data.chunks)
+        data = da.map_blocks(_convert_block, data, input_data, dtype=data_type)
+        out = numpy.memmap(output_filename, dtype=data_type, mode="w+", shape=data.shape)
+        da.store(data, out, lock=False)
+        out.flush()
+        # the rescaler filled in the statistics while the chunks were computed
+        stats = get_statistics().get("rescale", gridded_product["product_name"],
+                                     gridded_product["grid_definition"]["grid_name"])
+        if stats is not None:
+            get_statistics().finish(stats)
+
 
 def add_backend_argument_groups(parser):
     parser.set_defaults(forced_grids=["wgs84_fit"])
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Run-scoped cache of SatPy composite and modifier results.
+
+Composites like ``true_color``, ``false_color``, and ``natural_color`` share
+intermediate datasets (sun zenith corrected bands, rayleigh or CREFL
+corrected bands, sun and satellite angles). SatPy only shares these within one
+`Scene`. Every resampled `Scene` generates its composites again, so a run
+writing to several areas that resolve to the same area definition builds
+the same intermediates in more than one dask graph.
+
+The `CompositeCache` wraps every compositor and modifier of a `Scene` so each
+result is stored by the compositor's dataset ID and the area of its inputs.
+When the same intermediate is asked for again, in the same Scene or in one
+resampled from it, the cached DataArray (and its dask graph) is reused. Hits
+and misses are logged at the end of processing.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+"""
+__docformat__ = "restructuredtext en"
+
+import logging
+from collections import Counter
+
+LOG = logging.getLogger(__name__)
+
+
+def _area_key(data_arr):
+    area = data_arr.attrs.get("area")
+    if area is None:
+        return None
+    try:
+        hash(area)
+    except TypeError:
+        # unhashable geometry, only the same object is the same area
+        return id(area)
+    return area
+
+
+class CachedCompositor(object):
+    """Compositor or modifier wrapper that returns results from a `CompositeCache`.
+
+    Everything other than calling the compositor is passed through to the original object.
+    """
+    def __init__(self, compositor, cache):
+        self.compositor = compositor
+        self.cache = cache
+
+    def __call__(self, projectables, optional_datasets=None, **info):
+        key = self.cache.key(self.compositor, projectables, optional_datasets)
+        return self.cache.get_or_create(key, self.compositor, projectables,
+                                        optional_datasets=optional_datasets, **info)
+
+    def __getattr__(self, name):
+        return getattr(self.compositor, name)
+
+    def __repr__(self):
+        return "<CachedCompositor {!r}>".format(self.compositor)
+
+
+class CompositeCache(object):
+    """Cache of composite and modifier results for one run keyed by dataset ID and area.
+
+    Usage::
+
+        composite_cache = CompositeCache()
+        scn.load(products, generate=False)
+        composite_cache.install(scn)
+        generate_composites(scn)
+
+    """
+    def __init__(self):
+        self._results = {}
+        self.hits = Counter()
+        self.misses = Counter()
+
+    @staticmethod
+    def key(compositor, projectables, optional_datasets=None):
+        """Cache key of a compositor's result: its ID and the areas of its required and optional inputs."""
+        comp_id = getattr(compositor, "id", None)
+        if comp_id is None:
+            comp_id = id(compositor)
+        areas = tuple(_area_key(data_arr) for data_arr in projectables)
+        optional_areas = tuple(_area_key(data_arr) for data_arr in (optional_datasets or []))
+        return comp_id, areas, optional_areas
+
+    def get_or_create(self, key, compositor, projectables, **kwargs):
+        try:
+            result = self._results.get(key)
+        except TypeError:
+            LOG.debug("Can't cache result of unhashable compositor key: %r", key)
+            return compositor(projectables, **kwargs)
+        name = str(key[0])
+        if result is not None:
+            LOG.debug("Using cached composite result for %s", name)
+            self.hits[name] += 1
+            # the Scene updates the attributes of the datasets it holds, share the data and not the attributes
+            return result.copy(deep=False)
+        self.misses[name] += 1
+        result = compositor(projectables, **kwargs)
+        self._results[key] = result
+        return result.copy(deep=False)
+
+    def install(self, scn):
+        """Wrap every compositor and modifier in the dependency tree of `scn`.
+
+        Scenes created from `scn` (ex. by resampling) copy its dependency tree so they use this cache too.
+
+        :returns: number of compositors wrapped
+        """
+        dep_tree = getattr(scn, "_dependency_tree", None) or getattr(scn, "dep_tree", None)
+        if dep_tree is None:
+            LOG.warning("Can't cache composites, unknown SatPy Scene dependency tree")
+            return 0
+        num_wrapped = 0
+        for node in dep_tree.trunk():
+            data = node.data
+            if not isinstance(data, tuple) or not data or not callable(data[0]) or \
+                    isinstance(data[0], CachedCompositor):
+                continue
+            node.data = (CachedCompositor(data[0], self),) + tuple(data[1:])
+            num_wrapped += 1
+        LOG.debug("Caching results of %d compositors and modifiers", num_wrapped)
+        return num_wrapped
+
+    def clear(self):
+        self._results.clear()
+
+    def log_summary(self, level=logging.DEBUG):
+        total_hits = sum(self.hits.values())
+        total_misses = sum(self.misses.values())
+        LOG.log(level, "Composite cache: %d hits, %d misses", total_hits, total_misses)
+        for name, num_hits in self.hits.most_common():
+            LOG.log(level, "Composite cache hits for %s: %d", name, num_hits)
+
+
+def generate_composites(scn, unload=True):
+    """Generate the composites of a Scene loaded with ``generate=False``."""
+    if hasattr(scn, "generate_possible_composites"):
+        return scn.generate_possible_composites(unload)
+    keepables = scn.generate_composites()
+    if unload:
+        scn.unload(keepables=keepables)
@@ -85,15 +85,46 @@ __docformat__ = "restructuredtext en"
 import logging
 import numpy as np
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 from polar2grid.core import roles
 
 LOG = logging.getLogger(__name__)
 
+# Number of grid rows to process at a time and the number of threads to process them with
+DEFAULT_ROWS_PER_BLOCK = int(os.environ.get("P2G_COMPOSITOR_ROWS_PER_BLOCK", 512))
+DEFAULT_NUM_WORKERS = int(os.environ.get("P2G_COMPOSITOR_NUM_WORKERS", 1))
+
+
+def _fill_mask(data, fill_value):
+    """Boolean mask of where `data` is equal to `fill_value` (NaN aware)."""
+    if np.isnan(fill_value):
+        return np.isnan(data)
+    return data == fill_value
+
+
+def _run_row_blocks(func, num_rows, rows_per_block, num_workers=1):
+    """Call `func` with a slice for every block of `rows_per_block` rows.
+
+    Blocks are processed in `num_workers` threads if more than one. `func` must only modify the rows it is given.
+    """
+    blocks = [slice(start, min(start + rows_per_block, num_rows)) for start in range(0, num_rows, rows_per_block)]
+    if num_workers <= 1 or len(blocks) <= 1:
+        for block in blocks:
+            func(block)
+    else:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            # list so exceptions from the threads are raised here
+            list(executor.map(func, blocks))
+
 
 class CreflRGBSharpenCompositor(roles.CompositorRole):
     """Compositor filter that sharpens all other products based on the ratio of a high resolution product to a low
     resolution product.
+
+    Products are modified in place `rows_per_block` grid rows at a time so memory usage depends on the block size
+    and not the size of the grid. Blocks can be processed in parallel with `num_workers` threads.
     """
 
     def __init__(self, lores_products, hires_products, **kwargs):
@@ -101,8 +132,10 @@ class CreflRGBSharpenCompositor(roles.CompositorRole):
         self.share_mask = kwargs.get("share_mask", True)
         self.remove_lores = kwargs.get("remove_lores", True)
         self.apply_scale = kwargs.get("apply_scale", False)
+        self.rows_per_block = int(kwargs.get("rows_per_block", DEFAULT_ROWS_PER_BLOCK))
+        self.num_workers = int(kwargs.get("num_workers", DEFAULT_NUM_WORKERS))
         self.lores_products = lores_products if not isinstance(lores_products, str) else lores_products.split(",")
-        self.hires_products = lores_products if not isinstance(hires_products, str) else hires_products.split(",")
+        self.hires_products = hires_products if not isinstance(hires_products, str) else hires_products.split(",")
 
     def shared_mask(self, gridded_scene, product_names, axis=0):
         return np.any([gridded_scene[pname].get_data_mask() for pname in product_names], axis=axis)
@@ -116,6 +149,50 @@ class CreflRGBSharpenCompositor(roles.CompositorRole):
 
         return None
 
+    @staticmethod
+    def _scale_block(data, mask, clip_max):
+        from polar2grid.core.rescale import lookup_scale
+        if mask is None:
+            np.clip(data, -0.01, clip_max, data)
+            data[:] = lookup_scale(data, 0., 1., -0.01, 1.1)
+        else:
+            # this makes a copy
+            valid_data = data[~mask]
+            np.clip(valid_data, -0.01, clip_max, valid_data)
+            data[~mask] = lookup_scale(valid_data, 0., 1., -0.01, 1.1)
+
+    def sharpen_block(self, block, lores_data, hires_data, other_data, mask_arrays, fill_value):
+        """Sharpen and mask one block of rows of every product.
+
+        :param block: slice of the rows to process
+        :param mask_arrays: list of (data, fill_value) pairs to create the shared mask from or `None` to not
+                            share the mask between products
+        """
+        lores_block = lores_data[block]
+        hires_block = hires_data[block]
+        ratio = hires_block / lores_block
+
+        if mask_arrays is not None:
+            shared_mask = np.zeros(lores_block.shape, dtype=bool)
+            for arr, arr_fill in mask_arrays:
+                shared_mask |= _fill_mask(arr[block], arr_fill)
+            lores_block[shared_mask] = fill_value
+            hires_block[shared_mask] = fill_value
+        else:
+            shared_mask = None
+
+        for data in other_data:
+            other_block = data[block]
+            other_block *= ratio
+            if shared_mask is not None:
+                other_block[shared_mask] = fill_value
+            if self.apply_scale:
+                self._scale_block(other_block, shared_mask, 1.1)
+
+        if self.apply_scale:
+            self._scale_block(lores_block, shared_mask, 1.1)
+            self._scale_block(hires_block, shared_mask, 0.9)
+
     def modify_scene(self, gridded_scene, fill_value=None, **kwargs):
         lores_product_name = self._get_first_available_product(gridded_scene, self.lores_products)
         hires_product_name = self._get_first_available_product(gridded_scene, self.hires_products)
@@ -125,70 +202,33 @@ class CreflRGBSharpenCompositor(roles.CompositorRole):
             fill_value = gridded_scene[hires_product_name]["fill_value"]
 
         try:
-            lores_data = gridded_scene[lores_product_name].get_data_array(mode="r+")
-            hires_data = gridded_scene[hires_product_name].get_data_array(mode="r+")
-            ratio = hires_data / lores_data
-
+            # opening in this mode will do inplace modifications (flushed on object deletion)
+            data_arrays = {pname: gridded_scene[pname].get_data_array(mode="r+") for pname in gridded_scene.keys()}
+            lores_data = data_arrays[lores_product_name]
+            hires_data = data_arrays[hires_product_name]
+            other_data = [data_arrays[pname] for pname in other_product_names]
             if self.share_mask:
                 LOG.debug("Sharing missing value mask between bands and using fill value %r", fill_value)
-                shared_mask = self.shared_mask(gridded_scene, gridded_scene.keys())
-                # mask the hires product then update the product
-                lores_data[shared_mask] = fill_value
-                hires_data[shared_mask] = fill_value
+                mask_arrays = [(data_arrays[pname], gridded_scene[pname]["fill_value"])
+                               for pname in gridded_scene.keys()]
             else:
-                shared_mask = None
+                mask_arrays = None
+            if self.apply_scale:
+                LOG.debug("Applying ratio-sharpened non-linear scaling...")
+
+            LOG.debug("Sharpening products %d rows at a time with %d worker(s)", self.rows_per_block, self.num_workers)
+            sharpen_block = partial(self.sharpen_block, lores_data=lores_data, hires_data=hires_data,
+                                    other_data=other_data, mask_arrays=mask_arrays, fill_value=fill_value)
+            _run_row_blocks(sharpen_block, lores_data.shape[0], self.rows_per_block, self.num_workers)
+            for data in data_arrays.values():
+                data.flush()
 
-            # For each of the other products mask them accordingly
             for pname in other_product_names:
-                # opening in this mode will do inplace modifications (flushed on object deletion)
-                other_data = gridded_scene[pname].get_data_array(mode="r+")
-                other_data *= ratio
-                if shared_mask is not None:
-                    other_data[shared_mask] = fill_value
                 gridded_scene[pname]["sharpened"] = True
-
-                if self.apply_scale:
-                    try:
-                        LOG.debug("Applying ratio-sharpened non-linear scaling...")
-                        from polar2grid.core.rescale import lookup_scale
-                        other_orig = other_data
-                        if shared_mask is not None:
-                            # this makes a copy
-                            other_data = other_data[~shared_mask]
-                        np.clip(other_data, -0.01, 1.1, other_data)
-                        other_data[:] = lookup_scale(other_data, 0., 1., -0.01, 1.1)
-                        if shared_mask is not None:
-                            other_orig[~shared_mask] = other_data
-                        gridded_scene[pname]["valid_min"] = 0.
-                        gridded_scene[pname]["valid_max"] = 1.
-                    except ValueError:
-                        LOG.error("Could not apply ratio-sharpened non-linear scaling")
-                        raise
-
             if self.apply_scale:
-                try:
-                    LOG.debug("Applying ratio-sharpened non-linear scaling...")
-                    from polar2grid.core.rescale import lookup_scale
-                    lores_orig = lores_data
-                    hires_orig = hires_data
-                    if shared_mask is not None:
-                        # this makes a copy
-                        lores_data = lores_data[~shared_mask]
-                        hires_data = hires_data[~shared_mask]
-                    np.clip(lores_data, -0.01, 1.1, lores_data)
-                    np.clip(hires_data, -0.01, 0.9, hires_data)
-                    lores_data[:] = lookup_scale(lores_data, 0., 1., -0.01, 1.1)
-                    hires_data[:] = lookup_scale(hires_data, 0., 1., -0.01, 1.1)
-                    if shared_mask is not None:
-                        hires_orig[~shared_mask] = hires_data
-                        lores_orig[~shared_mask] = lores_data
-                    gridded_scene[lores_product_name]["valid_min"] = 0.
-                    gridded_scene[lores_product_name]["valid_max"] = 1.
-                    gridded_scene[hires_product_name]["valid_min"] = 0.
-                    gridded_scene[hires_product_name]["valid_max"] = 1.
-                except ValueError:
-                    LOG.error("Could not apply ratio-sharpened non-linear scaling")
-                    raise
+                for pname in other_product_names + [lores_product_name, hires_product_name]:
+                    gridded_scene[pname]["valid_min"] = 0.
+                    gridded_scene[pname]["valid_max"] = 1.
 
             if self.remove_lores:
                 del gridded_scene[lores_product_name]
@@ -200,10 +240,17 @@ class CreflRGBSharpenCompositor(roles.CompositorRole):
 
 
 class RGBCompositor(roles.CompositorRole):
+    """Compositor that combines multiple gridded products in to one multi-band product.
+
+    The composite is written directly to a memory mapped output file `rows_per_block` grid rows at a time (in
+    `num_workers` threads) so the full composite is never held in memory.
+    """
     def __init__(self, **kwargs):
         self.composite_name = kwargs.get("composite_name", "rgb_composite")
         self.composite_data_kind = kwargs.get("composite_data_kind", "rgb")
         self.share_mask = kwargs.get("share_mask", True)
+        self.rows_per_block = int(kwargs.get("rows_per_block", DEFAULT_ROWS_PER_BLOCK))
+        self.num_workers = int(kwargs.get("num_workers", DEFAULT_NUM_WORKERS))
         self.composite_products = kwargs.get("composite_products", "")
         if isinstance(self.composite_products, str):
             self.composite_products = self.composite_products.split(",")
@@ -215,6 +262,42 @@ class RGBCompositor(roles.CompositorRole):
     def joined_array(self, gridded_scene, product_names):
         return np.array([gridded_scene[pname].get_data_array() for pname in product_names])
 
+    def write_composite(self, fn, gridded_scene, product_names, fill_value, mask_product_names=None,
+                        lowres_product_name=None, compare_index=None):
+        """Write the products in `product_names` as the bands of a new composite file `fn`.
+
+        :param mask_product_names: Products whose invalid pixels are set to `fill_value` in every band
+                                   (`None` to not share masks)
+        :param lowres_product_name: Product to ratio sharpen the composite with (see `ratio_sharpen`)
+        :returns: shape of the composite array written
+        """
+        band_data = [gridded_scene[pname].get_data_array() for pname in product_names]
+        num_rows, num_cols = band_data[0].shape
+        comp_data = np.memmap(fn, dtype=np.result_type(*band_data), mode="w+",
+                              shape=(len(band_data), num_rows, num_cols))
+        lowres_data = gridded_scene[lowres_product_name].get_data_array() if lowres_product_name else None
+        if mask_product_names is not None:
+            mask_arrays = [(gridded_scene[pname].get_data_array(), gridded_scene[pname]["fill_value"])
+                           for pname in mask_product_names]
+        else:
+            mask_arrays = None
+
+        def _write_block(block):
+            comp_block = comp_data[:, block]
+            for idx, data in enumerate(band_data):
+                comp_block[idx] = data[block]
+            if lowres_data is not None:
+                self.ratio_sharpen(lowres_data[block], comp_block, compare_index=compare_index)
+            if mask_arrays is not None:
+                shared_mask = np.zeros(comp_block.shape[1:], dtype=bool)
+                for arr, arr_fill in mask_arrays:
+                    shared_mask |= _fill_mask(arr[block], arr_fill)
+                comp_block[:, shared_mask] = fill_value
+
+        _run_row_blocks(_write_block, num_rows, self.rows_per_block, self.num_workers)
+        comp_data.flush()
+        return comp_data.shape
+
     def modify_scene(self, gridded_scene, fill_value=None, **kwargs):
         if self.composite_name in gridded_scene:
             LOG.error("Cannot create composite product '%s', it already exists." % (self.composite_name,))
@@ -234,12 +317,9 @@ class RGBCompositor(roles.CompositorRole):
         fn = "grid_{}_{}.dat".format(grid_name, self.composite_name)
 
         try:
-            comp_data = self.joined_array(gridded_scene, self.composite_products)
-
-            if self.share_mask:
-                comp_data[:, self.shared_mask(gridded_scene, self.composite_products)] = fill_value
-
-            comp_data.tofile(fn)
+            mask_product_names = self.composite_products if self.share_mask else None
+            self.write_composite(fn, gridded_scene, self.composite_products, fill_value,
+                                 mask_product_names=mask_product_names)
             gridded_scene[self.composite_name] = self._create_gridded_product(self.composite_name, fn, base_product=base_product,
                                                                               data_kind=self.composite_data_kind)
         except (ValueError, KeyError):
@@ -323,20 +403,22 @@ class TrueColorCompositor(RGBCompositor):
             if sharp_red_product and self.sharpen_rgb:
                 all_products.append(sharp_red_product)
                 LOG.debug("Will attempt to create a true color image using: %s", ",".join(all_products))
-                comp_data = self.joined_array(gridded_scene, (sharp_red_product, green_product, blue_product))
-                self.ratio_sharpen(gridded_scene[red_product].get_data_array(), comp_data)
+                band_products = (sharp_red_product, green_product, blue_product)
+                lowres_product = red_product
             else:
                 LOG.info("No high resolution products were found so true color sharpening will not be done")
                 LOG.debug("Will attempt to create a true color image using: %s", ",".join(all_products))
-                comp_data = self.joined_array(gridded_scene, all_products)
+                band_products = all_products
+                lowres_product = None
 
             if self.share_mask:
                 LOG.debug("Sharing missing value mask between bands and using fill value %r", fill_value)
-                comp_data[:, self.shared_mask(gridded_scene, all_products)] = fill_value
 
-            LOG.debug("True color array has shape %r", comp_data.shape)
             LOG.info("Saving true color image to filename '%s'", fn)
-            comp_data.tofile(fn)
+            comp_shape = self.write_composite(fn, gridded_scene, band_products, fill_value,
+                                              mask_product_names=all_products if self.share_mask else None,
+                                              lowres_product_name=lowres_product)
+            LOG.debug("True color array has shape %r", comp_shape)
             gridded_scene[self.composite_name] = self._create_gridded_product(self.composite_name, fn,
                                                                               base_product=base_product,
                                                                               data_kind=self.composite_data_kind)
@@ -384,22 +466,22 @@ class FalseColorCompositor(TrueColorCompositor):
             all_products = [red_product, green_product, blue_product]
             sharp_green_product = self._get_first_available_product(gridded_scene, self.hires_products)
 
-            if self.sharpen_rgb and not sharp_green_product:
-                LOG.info("No high resolution products were found so false color sharpening will not be done")
-                LOG.debug("Will attempt to create a false color image using: %s", ",".join(all_products))
-                comp_data = self.joined_array(gridded_scene, all_products)
-            elif self.sharpen_rgb:
+            if self.sharpen_rgb and sharp_green_product:
                 all_products.append(sharp_green_product)
                 LOG.debug("Will attempt to create a false color image using: %s", ",".join(all_products))
-                comp_data = self.joined_array(gridded_scene, (red_product, sharp_green_product, blue_product))
-                self.ratio_sharpen(gridded_scene[green_product].get_data_array(), comp_data)
-
-            if self.share_mask:
-                comp_data[:, self.shared_mask(gridded_scene, all_products)] = fill_value
+                band_products = (red_product, sharp_green_product, blue_product)
+                lowres_product = green_product
+            else:
+                LOG.info("No high resolution products were found so false color sharpening will not be done")
+                LOG.debug("Will attempt to create a false color image using: %s", ",".join(all_products))
+                band_products = all_products
+                lowres_product = None
 
-            LOG.debug("False color array has shape %r", comp_data.shape)
             LOG.info("Saving false color image to filename '%s'", fn)
-            comp_data.tofile(fn)
+            comp_shape = self.write_composite(fn, gridded_scene, band_products, fill_value,
+                                              mask_product_names=all_products if self.share_mask else None,
+                                              lowres_product_name=lowres_product)
+            LOG.debug("False color array has shape %r", comp_shape)
             gridded_scene[self.composite_name] = self._create_gridded_product(self.composite_name, fn,
                                                                               base_product=base_product,
                                                                               data_kind=self.composite_data_kind)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Tests for the RGB compositors.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+
+"""
+__docformat__ = "restructuredtext en"
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from polar2grid.core import containers
+from polar2grid.compositors import rgb
+
+ROWS = 50
+COLS = 30
+
+
+def _create_scene(tmpdir, product_names, seed=0):
+    rs = np.random.RandomState(seed)
+    grid_def = containers.GridDefinition(grid_name="test_grid", proj4_definition="+proj=latlong",
+                                         height=ROWS, width=COLS, cell_height=1., cell_width=1.,
+                                         origin_x=0., origin_y=0.)
+    scene = containers.GriddedScene()
+    for pname in product_names:
+        data = rs.uniform(-0.05, 1.2, size=(ROWS, COLS)).astype(np.float32)
+        data[rs.uniform(size=data.shape) < 0.05] = np.nan
+        fn = str(tmpdir.join("grid_test_grid_{}.dat".format(pname)))
+        data.tofile(fn)
+        scene[pname] = containers.GriddedProduct(product_name=pname, satellite="npp", instrument="viirs",
+                                                 begin_time=None, end_time=None, data_type=np.float32,
+                                                 grid_data=fn, grid_definition=grid_def, fill_value=np.nan)
+    return scene
+
+
+def _expected_sharpen(arrays, lores, hires, apply_scale):
+    """Sharpen whole arrays at once the way the compositor used to."""
+    from polar2grid.core.rescale import lookup_scale
+    arrays = {k: v.copy() for k, v in arrays.items()}
+    ratio = arrays[hires] / arrays[lores]
+    mask = np.any([np.isnan(v) for v in arrays.values()], axis=0)
+    arrays[lores][mask] = np.nan
+    arrays[hires][mask] = np.nan
+    for pname, data in arrays.items():
+        if pname not in (lores, hires):
+            data *= ratio
+            data[mask] = np.nan
+    if apply_scale:
+        for pname, data in arrays.items():
+            valid_data = data[~mask]
+            np.clip(valid_data, -0.01, 0.9 if pname == hires else 1.1, valid_data)
+            data[~mask] = lookup_scale(valid_data, 0., 1., -0.01, 1.1)
+    return arrays
+
+
+class TestCreflRGBSharpenCompositor(object):
+    @pytest.mark.parametrize(("rows_per_block", "num_workers", "apply_scale"), [
+        (7, 1, False),
+        (7, 3, True),
+        (512, 1, True),
+    ])
+    def test_blocks_match_whole_grid(self, tmpdir, rows_per_block, num_workers, apply_scale):
+        product_names = ["viirs_crefl01", "viirs_crefl08", "viirs_crefl03", "viirs_crefl04"]
+        scene = _create_scene(tmpdir, product_names)
+        orig_arrays = {pname: np.array(scene[pname].get_data_array()) for pname in product_names}
+        expected = _expected_sharpen(orig_arrays, "viirs_crefl01", "viirs_crefl08", apply_scale)
+
+        comp = rgb.CreflRGBSharpenCompositor("viirs_crefl01", "viirs_crefl08", apply_scale=apply_scale,
+                                             rows_per_block=rows_per_block, num_workers=num_workers)
+        scene = comp.modify_scene(scene)
+        assert "viirs_crefl01" not in scene
+        for pname in product_names[1:]:
+            np.testing.assert_array_equal(scene[pname].get_data_array(), expected[pname])
+        assert scene["viirs_crefl03"]["sharpened"]
+
+
+class TestRGBCompositor(object):
+    @pytest.mark.parametrize(("comp_cls", "compare_index"), [
+        (rgb.TrueColorCompositor, 0),
+        (rgb.FalseColorCompositor, 1),
+    ])
+    def test_sharpened_composite(self, tmpdir, comp_cls, compare_index):
+        product_names = ["red", "green", "blue", "hires"]
+        scene = _create_scene(tmpdir, product_names)
+        arrays = {pname: np.array(scene[pname].get_data_array()) for pname in product_names}
+        band_names = ["red", "green", "blue"]
+        lowres_name = band_names[compare_index]
+        band_names[compare_index] = "hires"
+        expected = np.array([arrays[pname] for pname in band_names])
+        ratio = expected[compare_index] / arrays[lowres_name]
+        ratio[(ratio < 0) | ~np.isfinite(ratio)] = 1.
+        for idx in range(3):
+            if idx != compare_index:
+                expected[idx] *= ratio
+        expected[:, np.any([np.isnan(v) for v in arrays.values()], axis=0)] = np.nan
+
+        with tmpdir.as_cwd():
+            comp = comp_cls("red", "green", "blue", "hires", rows_per_block=8, num_workers=2)
+            scene = comp.modify_scene(scene)
+            comp_product = scene[comp.composite_name]
+            assert os.path.isfile(comp_product["grid_data"])
+            result = np.fromfile(comp_product["grid_data"], dtype=np.float32).reshape((3, ROWS, COLS))
+        np.testing.assert_array_equal(result, expected)
+
+    def test_rgb_composite(self, tmpdir):
+        scene = _create_scene(tmpdir, ["m05", "m07", "m15"])
+        expected = np.array([scene[pname].get_data_array() for pname in ["m05", "m07", "m15"]])
+        expected[:, np.isnan(expected).any(axis=0)] = np.nan
+        with tmpdir.as_cwd():
+            comp = rgb.RGBCompositor(composite_products="m05,m07,m15", rows_per_block="16")
+            scene = comp.modify_scene(scene)
+            result = np.fromfile(scene["rgb_composite"]["grid_data"], dtype=np.float32).reshape((3, ROWS, COLS))
+        np.testing.assert_array_equal(result, expected)
+
+
+def main():
+    return pytest.main([os.path.realpath(__file__)])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
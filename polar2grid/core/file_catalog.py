@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Persistent catalog of input file information for legacy frontends.
+
+Classifying input files requires opening every candidate file which can take
+a long time when a directory holds a full day of granules. The
+`FileCatalog` remembers what a frontend learned about each file (file type,
+instrument, satellite, begin and end time, and variable shapes) in a JSON
+file so later runs over the same files don't have to open them again just
+to sort them. Entries are keyed by the real path of the file and are only
+used if the file's size and modification time have not changed.
+
+Frontends get a catalog by passing ``file_catalog`` to `FrontendRole` or by
+setting the ``P2G_FILE_CATALOG`` environment variable to the catalog's path.
+Files found in the catalog are given to the frontend's file readers as a
+`CatalogFileHandle` which only opens the file once data is read from it.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+"""
+__docformat__ = "restructuredtext en"
+
+import os
+import json
+import logging
+import tempfile
+import threading
+from datetime import datetime
+
+LOG = logging.getLogger(__name__)
+
+CATALOG_VERSION = 1
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+def _file_stat_key(filepath):
+    st = os.stat(filepath)
+    return st.st_size, st.st_mtime
+
+
+def _parse_time(time_str):
+    if time_str is None:
+        return None
+    return datetime.strptime(time_str, TIME_FORMAT)
+
+
+class CatalogFileHandle(object):
+    """File handle for a cataloged file that doesn't open the file until its contents are needed.
+
+    The ``file_type``, ``instrument``, ``satellite``, ``begin_time``, and ``end_time`` attributes come from the
+    catalog entry. Getting an item or any other attribute opens the file by calling ``open_func(filepath)`` (ex.
+    `polar2grid.viirs.io.HDF5Reader`) and passes the request on to the opened file handle.
+    """
+    def __init__(self, filepath, catalog_entry, open_func):
+        self.filename = os.path.basename(filepath)
+        self.filepath = os.path.realpath(filepath)
+        self.file_type = catalog_entry.get("file_type")
+        self.instrument = catalog_entry.get("instrument")
+        self.satellite = catalog_entry.get("satellite")
+        self.begin_time = _parse_time(catalog_entry.get("begin_time"))
+        self.end_time = _parse_time(catalog_entry.get("end_time"))
+        self._open_func = open_func
+        self._file_handle = None
+        self._open_lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._file_handle is not None
+
+    @property
+    def file_handle(self):
+        with self._open_lock:
+            if self._file_handle is None:
+                LOG.debug("Opening cataloged file: %s", self.filepath)
+                self._file_handle = self._open_func(self.filepath)
+        return self._file_handle
+
+    def __getattr__(self, item):
+        if item.startswith("_"):
+            raise AttributeError(item)
+        return getattr(self.file_handle, item)
+
+    def __contains__(self, item):
+        return item in self.file_handle
+
+    def __getitem__(self, item):
+        return self.file_handle[item]
+
+
+class FileCatalog(object):
+    """On-disk catalog of information about previously seen input files.
+
+    Usage::
+
+        catalog = FileCatalog("/path/to/catalog.json")
+        file_handle = catalog.get_file_handle(filepath, HDF5Reader)
+        if file_handle is None:
+            file_handle = HDF5Reader(filepath)
+            file_type = expensive_classification(file_handle)
+            catalog.update(filepath, file_type=file_type)
+        else:
+            file_type = file_handle.file_type
+        catalog.save()
+
+    A ``file_type`` of `None` means the file was seen before and not
+    recognized by the frontend.
+    """
+    def __init__(self, catalog_filename):
+        self.catalog_filename = os.path.realpath(catalog_filename)
+        self._entries = {}
+        self._modified = False
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        if not os.path.isfile(self.catalog_filename):
+            LOG.debug("File catalog '%s' does not exist yet, it will be created", self.catalog_filename)
+            return
+
+        try:
+            with open(self.catalog_filename, "r") as catalog_file:
+                catalog_info = json.load(catalog_file)
+            if catalog_info.get("version") != CATALOG_VERSION:
+                LOG.warning("Ignoring file catalog '%s' created by a different version", self.catalog_filename)
+                return
+            self._entries = catalog_info["files"]
+        except (IOError, ValueError, KeyError):
+            LOG.warning("Could not read file catalog '%s', it will be recreated", self.catalog_filename)
+            LOG.debug("File catalog read error: ", exc_info=True)
+            self._entries = {}
+
+    def save(self):
+        """Write the catalog to disk if anything has changed since it was loaded.
+
+        The catalog is written to a temporary file first and then moved in to place so concurrent runs never see a
+        partially written catalog.
+        """
+        if not self._modified:
+            return
+
+        LOG.debug("Saving file catalog with %d entries to '%s'", len(self._entries), self.catalog_filename)
+        catalog_dir = os.path.dirname(self.catalog_filename)
+        if not os.path.isdir(catalog_dir):
+            os.makedirs(catalog_dir)
+        fd, tmp_filename = tempfile.mkstemp(prefix=".file_catalog_", suffix=".json", dir=catalog_dir)
+        try:
+            with os.fdopen(fd, "w") as catalog_file:
+                json.dump({"version": CATALOG_VERSION, "files": self._entries}, catalog_file)
+            os.replace(tmp_filename, self.catalog_filename)
+        except (IOError, OSError):
+            LOG.warning("Could not save file catalog '%s'", self.catalog_filename)
+            LOG.debug("File catalog write error: ", exc_info=True)
+            if os.path.isfile(tmp_filename):
+                os.remove(tmp_filename)
+            return
+        self._modified = False
+        LOG.debug("File catalog: %d hits, %d misses", self.hits, self.misses)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, filepath):
+        """Get the catalog entry for a file or `None` if the file is unknown or has changed since it was cataloged.
+        """
+        filepath = os.path.realpath(filepath)
+        entry = self._entries.get(filepath)
+        if entry is not None:
+            try:
+                size, mtime = _file_stat_key(filepath)
+            except OSError:
+                size, mtime = None, None
+            if entry["size"] == size and entry["mtime"] == mtime:
+                self.hits += 1
+                return entry
+            LOG.debug("File has changed since it was cataloged: %s", filepath)
+            del self._entries[filepath]
+            self._modified = True
+        self.misses += 1
+        return None
+
+    def get_file_handle(self, filepath, open_func):
+        """Get a `CatalogFileHandle` for a file or `None` if the file is not in the catalog (see `get`).
+        """
+        entry = self.get(filepath)
+        if entry is None:
+            return None
+        return CatalogFileHandle(filepath, entry, open_func)
+
+    def update(self, filepath, **info):
+        """Add or update information for a file.
+        """
+        filepath = os.path.realpath(filepath)
+        size, mtime = _file_stat_key(filepath)
+        entry = self._entries.get(filepath)
+        if entry is None or entry["size"] != size or entry["mtime"] != mtime:
+            entry = self._entries[filepath] = {"size": size, "mtime": mtime, "file_type": None, "shapes": {}}
+        for k, v in info.items():
+            if isinstance(v, datetime):
+                v = v.strftime(TIME_FORMAT)
+            entry[k] = v
+        self._modified = True
+        return entry
+
+    def update_from_reader(self, file_reader, file_type):
+        """Add the basic information known by a `BaseFileReader` instance to the catalog.
+        """
+        return self.update(file_reader.filepath, file_type=file_type,
+                           instrument=getattr(file_reader, "instrument", None),
+                           satellite=getattr(file_reader, "satellite", None),
+                           begin_time=getattr(file_reader, "begin_time", None),
+                           end_time=getattr(file_reader, "end_time", None))
+
+    def get_shape(self, filepath, item):
+        entry = self.get(filepath)
+        if entry is None or item not in entry["shapes"]:
+            return None
+        return tuple(entry["shapes"][item])
+
+    def set_shape(self, filepath, item, shape):
+        filepath = os.path.realpath(filepath)
+        entry = self._entries.get(filepath)
+        if entry is None:
+            entry = self.update(filepath)
+        entry["shapes"][item] = [int(x) for x in shape]
+        self._modified = True
@@ -41,13 +41,37 @@ TODO: Add basic frontend and boiler plate documentation here.
 """
 
 from polar2grid.core.fbf import FileAppender
+from polar2grid.core.file_catalog import CatalogFileHandle
 import numpy
 
 import os
 import logging
+import threading
+from functools import wraps
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 LOG = logging.getLogger(__name__)
 
+# product creation steps used by `ProductDict.product_task_dependencies`
+TASK_RAW = "raw"
+TASK_SECONDARY = "secondary"
+
+# The HDF4 library (pyhdf) is not thread-safe and file handles are shared between the products created at the same
+# time by `run_dependent_tasks`, so only one thread may read from input files at a time (see `file_access`)
+FILE_ACCESS_LOCK = threading.RLock()
+
+
+def file_access(func):
+    """Decorate a file reader method that reads from input files so it holds `FILE_ACCESS_LOCK`.
+
+    Frontends should only read input files through these methods when creating products with more than one worker.
+    """
+    @wraps(func)
+    def _locked_file_access(*args, **kwargs):
+        with FILE_ACCESS_LOCK:
+            return func(*args, **kwargs)
+    return _locked_file_access
+
 
 class ProductDefinition(object):
     """Product definition for polar2grid frontends
@@ -331,6 +355,102 @@ class ProductDict(dict):
 
         return products_needed
 
+    def product_task_dependencies(self, products_needed):
+        """Map each step needed to create `products_needed` to the steps that must finish before it.
+
+        Steps are ``(TASK_RAW, product_name)`` for loading a non-geolocation raw product from the files and
+        ``(TASK_SECONDARY, product_name)`` for running the secondary product function of a product that needs
+        processing (see `needs_processing`). Geolocation products are expected to be created before any of these
+        steps so they are never listed as dependencies.
+
+        :param products_needed: Product names from `dependency_ordered_products`
+        :returns: Ordered dictionary of step -> list of steps, the order matches the frontends' serial creation order
+        """
+        def _final_step(product_name):
+            if self.needs_processing(product_name):
+                return TASK_SECONDARY, product_name
+            if self.is_raw(product_name, geo_is_raw=False):
+                return TASK_RAW, product_name
+            return None
+
+        task_deps = {}
+        for product_name in products_needed:
+            if self.is_raw(product_name, geo_is_raw=False):
+                task_deps[(TASK_RAW, product_name)] = []
+        for product_name in reversed(products_needed):
+            if not self.needs_processing(product_name):
+                continue
+            deps = []
+            if self.is_raw(product_name, geo_is_raw=False):
+                deps.append((TASK_RAW, product_name))
+            for dep_name in self[product_name].dependencies:
+                if dep_name is None or dep_name not in products_needed:
+                    continue
+                dep_step = _final_step(dep_name)
+                if dep_step is not None and dep_step not in deps:
+                    deps.append(dep_step)
+            task_deps[(TASK_SECONDARY, product_name)] = deps
+        return task_deps
+
+
+def run_dependent_tasks(task_dependencies, task_func, num_workers=1):
+    """Run `task_func` for every task once all of the tasks it depends on have finished.
+
+    Tasks are run in the order of `task_dependencies` when `num_workers` is 1 or less. Otherwise independent tasks
+    are run concurrently in a pool of `num_workers` threads and any reading of input files done by `task_func` must
+    go through `file_access` methods. A task is considered finished whether it succeeded or failed, error handling
+    is left to the caller.
+
+    This is a generator yielding ``(task, future)`` in the main thread as each task finishes. Calling
+    ``future.result()`` returns the result of ``task_func(task)`` or re-raises the exception it raised. If the caller
+    stops iterating (ex. by raising an exception), tasks that have not started are not run and running tasks are
+    waited on.
+
+    :param task_dependencies: Dictionary mapping task -> list of tasks (see `ProductDict.product_task_dependencies`)
+    :param task_func: Callable taking one task as its only argument
+    :param num_workers: Maximum number of tasks to run at the same time
+    :raises: RuntimeError if tasks depend on each other in a cycle or, when run in order, a task is listed before
+             a task it depends on
+    """
+    if num_workers is None or num_workers <= 1:
+        finished = set()
+        for task in task_dependencies:
+            if any(dep in task_dependencies and dep not in finished for dep in task_dependencies[task]):
+                raise RuntimeError("Task %r depends on tasks that have not been run" % (task,))
+            finished.add(task)
+            future = Future()
+            try:
+                future.set_result(task_func(task))
+            except Exception as e:
+                future.set_exception(e)
+            yield task, future
+        return
+
+    waiting = dict((task, set(deps) & set(task_dependencies)) for task, deps in task_dependencies.items())
+    running = {}
+    executor = ThreadPoolExecutor(max_workers=num_workers)
+    try:
+        while waiting or running:
+            # only submit what can start right away so nothing is queued if the caller stops early
+            ready_tasks = [t for t, deps in waiting.items() if not deps]
+            for task in ready_tasks[:num_workers - len(running)]:
+                del waiting[task]
+                running[executor.submit(task_func, task)] = task
+            if not running:
+                raise RuntimeError("Circular dependency between tasks: %r" % (list(waiting.keys()),))
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            # report finished tasks in the same relative order they were provided
+            for future in sorted(done, key=lambda f: list(task_dependencies).index(running[f])):
+                task = running.pop(future)
+                for deps in waiting.values():
+                    deps.discard(task)
+                yield task, future
+    finally:
+        for future in running:
+            future.cancel()
+        executor.shutdown(wait=True)
+
 
 class GeoPairDict(dict):
     def __init__(self, base_class=GeoPair):
@@ -383,6 +503,20 @@ class BaseFileReader(object):
         self.filename = file_handle.filename
         self.file_type_info = file_type_info
 
+    def _load_cataloged_info(self):
+        """Get the instrument, satellite, and begin and end time from a
+        `polar2grid.core.file_catalog.CatalogFileHandle` instead of reading them from the file.
+
+        :returns: `True` if the file handle came from a file catalog, `False` if the subclass must read the file
+        """
+        if not isinstance(self.file_handle, CatalogFileHandle):
+            return False
+        self.instrument = self.file_handle.instrument
+        self.satellite = self.file_handle.satellite
+        self.begin_time = self.file_handle.begin_time
+        self.end_time = self.file_handle.end_time
+        return True
+
     def __getitem__(self, item):
         """Basic 'getitem' access that uses the `file_type_info` for matching keys first.
 
@@ -440,6 +574,14 @@ class BaseFileReader(object):
         """
         raise NotImplementedError("Frontend has not implemented this method yet")
 
+    def get_swath_shape(self, item):
+        """Return the shape of the array that `get_swath_data` would return for `item` without loading the data.
+
+        Default version uses the `shape` of the object returned by `__getitem__` (ex. an h5py Dataset). Subclasses
+        whose `get_swath_data` changes the shape of the data (indexing, interpolation, etc.) must override this.
+        """
+        return self[item].shape
+
     def _compare(self, other, method):
         try:
             return method(self.begin_time, other.begin_time)
@@ -488,11 +630,13 @@ class BaseMultiFileReader(object):
         data_shape = file_reader.write_var_to_flat_binary("example_var_key", "my_data.dat")
 
     """
-    def __init__(self, file_type_info, single_class):
+    def __init__(self, file_type_info, single_class, file_catalog=None):
         self.file_readers = []
         self._files_finalized = False
         self.file_type_info = file_type_info
         self.single_class = single_class
+        # optional `polar2grid.core.file_catalog.FileCatalog` to remember swath shapes between runs
+        self.file_catalog = file_catalog
 
     def add_file(self, fn):
         if self._files_finalized:
@@ -545,6 +689,7 @@ class BaseMultiFileReader(object):
     def filepaths(self):
         return [fr.filepath for fr in self.file_readers]
 
+    @file_access
     def __getitem__(self, item):
         """Get multiple variables as one logical item.
 
@@ -568,15 +713,77 @@ class BaseMultiFileReader(object):
         else:
             return individual_items
 
-    def get_swath_data(self, item):
-        return numpy.concatenate([fr.get_swath_data(item) for fr in self.file_readers])
+    @file_access
+    def get_swath_shape(self, item):
+        """Shape of the swath data for `item` when all files are concatenated along the first dimension.
+        """
+        shapes = [self._get_file_swath_shape(fr, item) for fr in self.file_readers]
+        return (sum(s[0] for s in shapes),) + tuple(shapes[0][1:])
+
+    def _get_file_swath_shape(self, file_reader, item):
+        if self.file_catalog is None:
+            return file_reader.get_swath_shape(item)
+        shape = self.file_catalog.get_shape(file_reader.filepath, item)
+        if shape is None:
+            shape = file_reader.get_swath_shape(item)
+            self.file_catalog.set_shape(file_reader.filepath, item, shape)
+        return shape
+
+    @file_access
+    def get_swath_data(self, item, filename=None, dtype=None):
+        """Get the swath data for `item` from every file as one array concatenated along the first dimension.
+
+        The shape of each file's data is queried first so the output array can be allocated once and filled one
+        file at a time. This means only one file's data is in memory at a time in addition to the result.
+
+        :param item: Variable name to retrieve from these files
+        :param filename: If provided, the output is a writable numpy memmap backed by this file (the same flat binary
+                         format as `write_var_to_flat_binary`)
+        :param dtype: Data type of the output array, defaults to the data type of the first file's data
+        """
+        if len(self) == 0:
+            LOG.error("Can't extract swath data, file reader is empty")
+            raise RuntimeError("Empty file reader")
+
+        shapes = [self._get_file_swath_shape(fr, item) for fr in self.file_readers]
+        total_shape = (sum(s[0] for s in shapes),) + tuple(shapes[0][1:])
+        output = None
+        start_idx = 0
+        try:
+            for file_reader, shape in zip(self.file_readers, shapes):
+                single_array = file_reader.get_swath_data(item)
+                if single_array.shape != tuple(shape):
+                    raise ValueError("File '%s' returned data of shape %r for '%s', expected %r" % (
+                        file_reader.filename, single_array.shape, item, tuple(shape)))
+                if output is None:
+                    # the data type is only known for sure after the first file has been read
+                    out_dtype = single_array.dtype if dtype is None else dtype
+                    if filename is not None:
+                        LOG.debug("Writing swath data for '%s' to file '%s'", item, filename)
+                        output = numpy.memmap(filename, dtype=out_dtype, mode="w+", shape=total_shape)
+                    else:
+                        output = numpy.empty(total_shape, dtype=out_dtype)
+                end_idx = start_idx + shape[0]
+                output[start_idx:end_idx] = single_array
+                start_idx = end_idx
+                del single_array
+        except (IOError, ValueError, TypeError):
+            if filename is not None and os.path.isfile(filename):
+                del output
+                os.remove(filename)
+            raise
+
+        return output
 
+    @file_access
     def get_fill_value(self, item):
         return self.file_readers[0].get_fill_value(item)
 
+    @file_access
     def get_data_type(self, item):
         return self.file_readers[0].get_data_type(item)
 
+    @file_access
     def write_var_to_flat_binary(self, item, filename, dtype=numpy.float32):
         """Write multiple variables to disk as one concatenated flat binary file.
 
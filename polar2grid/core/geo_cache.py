@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""On-disk cache of derived (interpolated) geolocation arrays.
+
+Interpolating geolocation to a higher resolution (ex. MODIS 1km to 250m) is
+expensive and produces the same result every time it is done for the same
+geolocation file. The `GeolocationCache` stores the resulting longitude and
+latitude arrays as ``.npy`` files named after a checksum of the contents of
+the source file and the parameters used to create them. Cached arrays are
+returned as read-only memory maps so they are only read from disk as needed.
+
+Because entries are addressed by content, a cache directory can be shared
+between runs, products, and copies of the same file in different locations.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+"""
+__docformat__ = "restructuredtext en"
+
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+
+import numpy
+
+LOG = logging.getLogger(__name__)
+
+# change this when the way cached arrays are created changes so old entries aren't used
+CACHE_VERSION = 1
+CHECKSUM_BLOCK_SIZE = 1024 * 1024
+
+
+class GeolocationCache(object):
+    """Content-addressed cache of longitude and latitude arrays.
+
+    Usage::
+
+        geo_cache = GeolocationCache("/path/to/cache_dir")
+        key = geo_cache.key(geo_filepath, "modis_250m", res_factor=4)
+        cached = geo_cache.get(key)
+        if cached is None:
+            lons, lats = expensive_interpolation(...)
+            lons, lats = geo_cache.put(key, lons, lats)
+        else:
+            lons, lats = cached
+
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = os.path.realpath(cache_dir)
+        self._checksums = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def file_checksum(self, filepath):
+        """SHA-256 checksum of the contents of a file.
+
+        Checksums are remembered for the life of this object as long as the file's size and modification time
+        don't change.
+        """
+        filepath = os.path.realpath(filepath)
+        st = os.stat(filepath)
+        stat_key = (filepath, st.st_size, st.st_mtime)
+        checksum = self._checksums.get(stat_key)
+        if checksum is None:
+            sha = hashlib.sha256()
+            with open(filepath, "rb") as source_file:
+                for block in iter(lambda: source_file.read(CHECKSUM_BLOCK_SIZE), b""):
+                    sha.update(block)
+            checksum = self._checksums[stat_key] = sha.hexdigest()
+        return checksum
+
+    def key(self, filepath, kind, **params):
+        """Cache key for geolocation of type `kind` derived from `filepath` with `params`.
+        """
+        key_parts = ["v{:d}".format(CACHE_VERSION), self.file_checksum(filepath), kind]
+        key_parts.extend("{}={!r}".format(k, params[k]) for k in sorted(params))
+        return hashlib.sha256("|".join(key_parts).encode()).hexdigest()
+
+    def _entry_filenames(self, key):
+        entry_dir = os.path.join(self.cache_dir, key[:2])
+        return os.path.join(entry_dir, key + "_lon.npy"), os.path.join(entry_dir, key + "_lat.npy")
+
+    def get(self, key):
+        """Get read-only memory maps of the cached longitude and latitude arrays or `None` if they aren't cached.
+        """
+        lon_fn, lat_fn = self._entry_filenames(key)
+        try:
+            lons = numpy.load(lon_fn, mmap_mode="r")
+            lats = numpy.load(lat_fn, mmap_mode="r")
+        except (IOError, OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        LOG.debug("Using cached geolocation %s", key)
+        with self._lock:
+            self.hits += 1
+        return lons, lats
+
+    def put(self, key, lons, lats):
+        """Add longitude and latitude arrays to the cache.
+
+        Files are written to a temporary name and then moved in to place so other processes never see partially
+        written arrays. If the arrays can't be written a warning is logged and the original arrays are returned.
+
+        :returns: read-only memory maps of the cached arrays
+        """
+        lon_fn, lat_fn = self._entry_filenames(key)
+        entry_dir = os.path.dirname(lon_fn)
+        try:
+            if not os.path.isdir(entry_dir):
+                os.makedirs(entry_dir, exist_ok=True)
+            for fn, arr in ((lat_fn, lats), (lon_fn, lons)):
+                fd, tmp_fn = tempfile.mkstemp(prefix=".geo_cache_", suffix=".npy", dir=entry_dir)
+                try:
+                    with os.fdopen(fd, "wb") as tmp_file:
+                        numpy.save(tmp_file, arr)
+                    os.replace(tmp_fn, fn)
+                except Exception:
+                    if os.path.isfile(tmp_fn):
+                        os.remove(tmp_fn)
+                    raise
+        except (IOError, OSError):
+            LOG.warning("Could not write geolocation to cache directory '%s'", self.cache_dir)
+            LOG.debug("Geolocation cache write error: ", exc_info=True)
+            return lons, lats
+        LOG.debug("Cached geolocation %s", key)
+        return numpy.load(lon_fn, mmap_mode="r"), numpy.load(lat_fn, mmap_mode="r")
@@ -21,8 +21,14 @@ to it's own module.
 """
 __docformat__ = "restructuredtext en"
 
+import os
 import sys
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import dask
+import dask.array as da
 import numpy
 
 log = logging.getLogger(__name__)
@@ -75,6 +81,119 @@ def histogram_equalization (data, mask_to_equalize,
     
     return out
 
+def histogram_equalization_chunked (data, mask_to_equalize,
+                                    number_of_bins=1000,
+                                    std_mult_cutoff=4.0,
+                                    do_zerotoone_normalization=True,
+                                    valid_data_mask=None,
+                                    clip_limit=None,
+                                    slope_limit=None,
+                                    out=None,
+                                    chunk_rows=1024) :
+    """
+    Perform the same histogram equalization as `histogram_equalization` without
+    loading the whole array (or copies of the masked data) in to memory.
+
+    data and the masks can be numpy arrays, numpy memmaps, or dask arrays. Numpy
+    arrays are processed chunk_rows rows at a time, dask arrays one chunk at a
+    time. The mean, standard deviation, data range, and histogram are calculated
+    by combining the results from each chunk and the equalization is then
+    applied to each chunk separately.
+
+    If out is provided (numpy array or memmap) the equalized data is written to
+    it and it is returned. Otherwise a dask array is returned for dask input or
+    an equalized copy of data for numpy input.
+    """
+
+    is_dask = isinstance(data, da.Array)
+    if not is_dask:
+        data = da.from_array(data, chunks=(chunk_rows,) + data.shape[1:])
+    mask_to_equalize = _chunk_like(mask_to_equalize, data)
+    mask_to_use = mask_to_equalize if valid_data_mask is None else _chunk_like(valid_data_mask, data)
+    data_blocks = data.to_delayed().ravel()
+    mask_blocks = mask_to_use.to_delayed().ravel()
+
+    log.debug("    determining DNB data range for histogram equalization")
+    block_sums = dask.compute(*[dask.delayed(_masked_sum)(d, m) for d, m in zip(data_blocks, mask_blocks)])
+    valid_count = sum(count for count, _ in block_sums)
+    avg = sum(block_sum for _, block_sum in block_sums) / valid_count if valid_count else numpy.nan
+    block_sums = dask.compute(*[dask.delayed(_masked_sum)(d, m, avg) for d, m in zip(data_blocks, mask_blocks)])
+    std = numpy.sqrt(sum(block_sum for _, block_sum in block_sums) / valid_count) if valid_count else numpy.nan
+    if numpy.issubdtype(data.dtype, numpy.floating):
+        avg = data.dtype.type(avg)
+        std = data.dtype.type(std)
+    # limit our range to +/- std_mult_cutoff*std; e.g. the default std_mult_cutoff is 4.0 so about 99.8% of the data
+    upper_limit = avg + std*std_mult_cutoff
+    lower_limit = avg - std*std_mult_cutoff
+
+    block_ranges = dask.compute(*[dask.delayed(_conservative_range)(d, m, lower_limit, upper_limit)
+                                  for d, m in zip(data_blocks, mask_blocks)])
+    block_ranges = [block_range for block_range in block_ranges if block_range[0]]
+    concervative_count = sum(block_range[0] for block_range in block_ranges)
+    if concervative_count:
+        data_range = (min(block_range[1] for block_range in block_ranges),
+                      max(block_range[2] for block_range in block_ranges))
+    else:
+        data_range = None
+
+    log.debug("    running histogram equalization")
+    block_histograms = dask.compute(*[
+        dask.delayed(_conservative_histogram)(d, m, lower_limit, upper_limit, number_of_bins, data_range)
+        for d, m in zip(data_blocks, mask_blocks)])
+    temp_histogram = numpy.sum(block_histograms, axis=0)
+    temp_bins = numpy.histogram_bin_edges(numpy.array(data_range if data_range is not None else [], dtype=data.dtype),
+                                          number_of_bins)
+    cumulative_dist_function = _histograms_to_cdfs(temp_histogram[None, :], numpy.array([concervative_count]),
+                                                   number_of_bins, clip_limit=clip_limit, slope_limit=slope_limit)[0]
+
+    # linearly interpolate using the distribution function to get the new values
+    theoretical_max = number_of_bins if do_zerotoone_normalization else None
+    out_data = data if out is None else _chunk_like(out, data)
+    equalized = da.map_blocks(_equalize_block, data, mask_to_equalize, out_data, dtype=out_data.dtype,
+                              bins=temp_bins[:-1], cumulative_dist_function=cumulative_dist_function,
+                              theoretical_max=theoretical_max)
+    if out is None:
+        return equalized if is_dask else equalized.compute()
+    if isinstance(out, da.Array):
+        return equalized
+    da.store(equalized, out)
+    return out
+
+def _chunk_like (arr, data) :
+    """
+    make arr a dask array with the same chunks as data
+    """
+    if isinstance(arr, da.Array):
+        return arr.rechunk(data.chunks)
+    return da.from_array(arr, chunks=data.chunks)
+
+def _masked_sum (data, mask, avg=None) :
+    """
+    number of masked values and their sum (or the sum of their squared differences from avg)
+    """
+    valid_data = data[mask]
+    if avg is None:
+        return valid_data.size, valid_data.sum(dtype=numpy.float64)
+    return valid_data.size, ((valid_data - avg) ** 2).sum(dtype=numpy.float64)
+
+def _conservative_range (data, mask, lower_limit, upper_limit) :
+    valid_data = data[(data < upper_limit) & (data > lower_limit) & mask]
+    if not valid_data.size:
+        return 0, None, None
+    return valid_data.size, valid_data.min(), valid_data.max()
+
+def _conservative_histogram (data, mask, lower_limit, upper_limit, number_of_bins, data_range) :
+    valid_data = data[(data < upper_limit) & (data > lower_limit) & mask]
+    return numpy.histogram(valid_data, number_of_bins, range=data_range)[0]
+
+def _equalize_block (data, mask, out, bins=None, cumulative_dist_function=None, theoretical_max=None) :
+    out = out.copy()
+    out[mask] = numpy.interp(data[mask], bins, cumulative_dist_function)
+    # same as _linear_normalization_from_0to1 without logging for every chunk
+    if theoretical_max is not None:
+        out[mask] = out[mask] / theoretical_max
+    return out
+
 def local_histogram_equalization (data, mask_to_equalize, valid_data_mask=None, number_of_bins=1000,
                                   std_mult_cutoff=3.0,
                                   do_zerotoone_normalization=True,
@@ -83,17 +202,23 @@ def local_histogram_equalization (data, mask_to_equalize, valid_data_mask=None,
                                   slope_limit=3.0, #0.5,
                                   do_log_scale=True,
                                   log_offset=0.00001, # can't take the log of zero, so the offset may be needed; pass 0.0 if your data doesn't need it
-                                  out=None
+                                  out=None,
+                                  num_threads=None,
+                                  rows_per_band=128,
                                   ) :
     """
     equalize the provided data (in the mask_to_equalize) using adaptive histogram equalization
     tiles of width/height (2 * local_radius_px + 1) will be calculated and results for each pixel will be bilinerarly interpolated from the nearest 4 tiles
     when pixels fall near the edge of the image (there is no adjacent tile) the resultant interpolated sum from the available tiles will be multipled to
     account for the weight of any missing tiles (pixel total interpolated value = pixel available interpolated value / (1 - missing interpolation weight))
-    
+
     if do_zerotoone_normalization is True the data will be scaled so that all data in the mask_to_equalize falls between 0 and 1; otherwise the data
     in mask_to_equalize will all fall between 0 and number_of_bins
-    
+
+    the histograms for every tile are binned together in one pass and the tile blending is done for bands of
+    rows_per_band rows at a time on a pool of num_threads threads (default: number of CPUs); the results match the
+    original tile by tile implementation
+
     returns the equalized data
     """
 
@@ -101,145 +226,105 @@ def local_histogram_equalization (data, mask_to_equalize, valid_data_mask=None,
     # if we don't have a valid mask, use the mask of what we should be equalizing
     if valid_data_mask is None:
         valid_data_mask = mask_to_equalize
-    
+
     # calculate some useful numbers for our tile math
     total_rows = data.shape[0]
     total_cols = data.shape[1]
     tile_size = int((local_radius_px * 2.0) + 1.0)
-    row_tiles = int(total_rows / tile_size) if (total_rows % tile_size is 0) else int(total_rows / tile_size) + 1
-    col_tiles = int(total_cols / tile_size) if (total_cols % tile_size is 0) else int(total_cols / tile_size) + 1
-    
-    # an array of our distribution functions for equalization
-    all_cumulative_dist_functions = [ [ ] ]
-    # an array of our bin information for equalization
-    all_bin_information           = [ [ ] ]
-    
-    # loop through our tiles and create the histogram equalizations for each one
-    for num_row_tile in range(row_tiles) :
-        
-        # make sure we have enough rows available to store info on this next row of tiles
-        if len(all_cumulative_dist_functions) <= num_row_tile :
-            all_cumulative_dist_functions.append( [ ] )
-        if len(all_bin_information)           <= num_row_tile :
-            all_bin_information          .append( [ ] )
-        
-        # go through each tile in this row and calculate the equalization
-        for num_col_tile in range(col_tiles) :
-            
-            # calculate the range for this tile (min is inclusive, max is exclusive)
-            min_row = num_row_tile * tile_size
-            max_row = min_row + tile_size
-            min_col = num_col_tile * tile_size
-            max_col = min_col + tile_size
-            
-            # for speed of calculation, pull out the mask of pixels that should be used to calculate the histogram
-            mask_valid_data_in_tile  = valid_data_mask[min_row:max_row, min_col:max_col]
-            
-            # if we have any valid data in this tile, calculate a histogram equalization for this tile
-            # (note: even if this tile does no fall in the mask_to_equalize, it's histogram may be used by other tiles)
-            cumulative_dist_function, temp_bins = None, None
-            if mask_valid_data_in_tile.any():
-                
-                # use all valid data in the tile, so separate sections will blend cleanly
-                temp_valid_data = data[min_row:max_row, min_col:max_col][mask_valid_data_in_tile]
-                temp_valid_data = temp_valid_data[temp_valid_data >= 0] # TEMP, testing to see if negative data is messing everything up
-                # limit the contrast by only considering data within a certain range of the average
-                if std_mult_cutoff is not None :
-                    avg               = numpy.mean(temp_valid_data)
-                    std               = numpy.std (temp_valid_data)
-                    # limit our range to avg +/- std_mult_cutoff*std; e.g. the default std_mult_cutoff is 4.0 so about 99.8% of the data
-                    concervative_mask = (temp_valid_data < (avg + std*std_mult_cutoff)) & (temp_valid_data > (avg - std*std_mult_cutoff))
-                    temp_valid_data   = temp_valid_data[concervative_mask]
-                
-                # if we are taking the log of our data, do so now
-                if do_log_scale :
-                    temp_valid_data = numpy.log(temp_valid_data + log_offset)
-                
-                # do the histogram equalization and get the resulting distribution function and bin information
-                if temp_valid_data.size > 0 :
-                    cumulative_dist_function, temp_bins = _histogram_equalization_helper (temp_valid_data, number_of_bins, clip_limit=clip_limit, slope_limit=slope_limit)
-            
-            # hang on to our equalization related information for use later
-            all_cumulative_dist_functions[num_row_tile].append(cumulative_dist_function)
-            all_bin_information          [num_row_tile].append(temp_bins)
-    
-    # get the tile weight array so we can use it to interpolate our data
-    tile_weights = _calculate_weights(tile_size)
-    
-    # now loop through our tiles and linearly interpolate the equalized versions of the data
-    for num_row_tile in range(row_tiles) :
-        for num_col_tile in range(col_tiles) :
-            
-            # calculate the range for this tile (min is inclusive, max is exclusive)
-            min_row = num_row_tile * tile_size
-            max_row = min_row + tile_size
+    row_tiles = -(-total_rows // tile_size)
+    col_tiles = -(-total_cols // tile_size)
+    num_threads = num_threads or os.cpu_count() or 1
+
+    def _valid_tile_data(num_row_tile):
+        # the data used to build the histogram for each tile in this row of tiles
+        tile_data = []
+        min_row = num_row_tile * tile_size
+        max_row = min_row + tile_size
+        for num_col_tile in range(col_tiles):
             min_col = num_col_tile * tile_size
             max_col = min_col + tile_size
-            
-            # for convenience, pull some of these tile sized chunks out
-            temp_all_data = data[min_row:max_row, min_col:max_col].copy()
-            temp_mask_to_equalize = mask_to_equalize[min_row:max_row, min_col:max_col]
-            temp_all_valid_data_mask = valid_data_mask[min_row:max_row, min_col:max_col]
-
-            # if we have any data in this tile, calculate our weighted sum
-            if temp_mask_to_equalize.any():
-                if do_log_scale:
-                    temp_all_data[temp_all_valid_data_mask] = numpy.log(temp_all_data[temp_all_valid_data_mask] + log_offset)
-                temp_data_to_equalize = temp_all_data[temp_mask_to_equalize]
-                temp_all_valid_data = temp_all_data[temp_all_valid_data_mask]
-
-                # a place to hold our weighted sum that represents the interpolated contributions
-                # of the histogram equalizations from the surrounding tiles
-                temp_sum = numpy.zeros_like(temp_data_to_equalize)
-
-                # how much weight were we unable to use because those tiles fell off the edge of the image?
-                unused_weight = numpy.zeros(temp_data_to_equalize.shape, dtype=tile_weights.dtype)
-
-                # loop through all the surrounding tiles and process their contributions to this tile
-                for weight_row in range(3):
-                    for weight_col in range(3):
-                        # figure out which adjacent tile we're processing (in overall tile coordinates instead of relative to our current tile)
-                        calculated_row = num_row_tile - 1 + weight_row
-                        calculated_col = num_col_tile - 1 + weight_col
-                        tmp_tile_weights = tile_weights[weight_row, weight_col][numpy.where(temp_mask_to_equalize)]
-                        
-                        # if we're inside the tile array and the tile we're processing has a histogram equalization for us to use, process it
-                        if ( (calculated_row >= 0) and (calculated_row < row_tiles) and
-                             (calculated_col >= 0) and (calculated_col < col_tiles) and
-                             (all_bin_information[calculated_row][calculated_col] is not None) and
-                             (all_cumulative_dist_functions[calculated_row][calculated_col] is not None)) :
-                            
-                            # equalize our current tile using the histogram equalization from the tile we're processing
-                            temp_equalized_data = numpy.interp(temp_all_valid_data,
-                                                               all_bin_information[calculated_row][calculated_col][:-1],
-                                                               all_cumulative_dist_functions[calculated_row][calculated_col])
-                            temp_equalized_data = temp_equalized_data[numpy.where(temp_mask_to_equalize[temp_all_valid_data_mask])]
-                            
-                            # add the contribution for the tile we're processing to our weighted sum
-                            temp_sum += (temp_equalized_data * tmp_tile_weights)
-                            
-                        else : # if the tile we're processing doesn't exist, hang onto the weight we would have used for it so we can correct that later
-                            unused_weight -= tmp_tile_weights
+            temp_valid_data = data[min_row:max_row, min_col:max_col][valid_data_mask[min_row:max_row, min_col:max_col]]
+            temp_valid_data = temp_valid_data[temp_valid_data >= 0]
+            if temp_valid_data.size and std_mult_cutoff is not None:
+                avg = numpy.mean(temp_valid_data)
+                std = numpy.std(temp_valid_data)
+                concervative_mask = (temp_valid_data < (avg + std*std_mult_cutoff)) & (temp_valid_data > (avg - std*std_mult_cutoff))
+                temp_valid_data = temp_valid_data[concervative_mask]
+            if do_log_scale:
+                temp_valid_data = numpy.log(temp_valid_data + log_offset)
+            tile_data.append(temp_valid_data)
+        return tile_data
 
-                # if we have unused weights, scale our values to correct for that
-                if unused_weight.any():
-                    # TODO, if the mask masks everything out this will be a zero!
-                    temp_sum /= unused_weight + 1
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        all_tile_data = [tile_data for tile_row_data in executor.map(_valid_tile_data, range(row_tiles))
+                         for tile_data in tile_row_data]
 
-                # now that we've calculated the weighted sum for this tile, set it in our data array
-                out[min_row:max_row, min_col:max_col][temp_mask_to_equalize] = temp_sum
-                
-                """
-                # TEMP, test without using weights
-                data[min_row:max_row, min_col:max_col][temp_mask_to_equalize] = numpy.interp(temp_data_to_equalize,
-                                                                                             all_bin_information          [num_row_tile  ][num_col_tile][:-1],
-                                                                                             all_cumulative_dist_functions[num_row_tile  ][num_col_tile])
-                """
+        # index in to the per-tile CDF tables for each tile (-1 if the tile has no histogram) with a border of
+        # missing tiles so neighbor lookups never go out of bounds
+        tile_index = numpy.full((row_tiles + 2, col_tiles + 2), -1, dtype=numpy.intp)
+        tiles_with_data = [idx for idx, tile_data in enumerate(all_tile_data) if tile_data.size > 0]
+        tile_index[1:-1, 1:-1].flat[tiles_with_data] = numpy.arange(len(tiles_with_data))
+        if not tiles_with_data:
+            if do_zerotoone_normalization:
+                _linear_normalization_from_0to1(out, mask_to_equalize, number_of_bins)
+            return out
+        all_bins, all_cdfs = _batched_histogram_equalization_helper([all_tile_data[idx] for idx in tiles_with_data],
+                                                                    number_of_bins, clip_limit=clip_limit,
+                                                                    slope_limit=slope_limit)
+        del all_tile_data
+        # interpolation tables, numpy.interp does all of its math in 64-bit floats
+        all_bins = all_bins[:, :-1].astype(numpy.float64)
+        all_slopes = numpy.zeros_like(all_cdfs)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            all_slopes[:, :-1] = numpy.diff(all_cdfs, axis=1) / numpy.diff(all_bins, axis=1)
+
+        tile_weights = _calculate_weights(tile_size)
+
+        def _equalize_band(min_row):
+            num_row_tile = min_row // tile_size
+            max_row = min(min_row + rows_per_band, (num_row_tile + 1) * tile_size, total_rows)
+            band_rows, band_cols = numpy.nonzero(mask_to_equalize[min_row:max_row])
+            if not band_rows.size:
+                return
+            band_rows += min_row
+            temp_data_to_equalize = data[band_rows, band_cols]
+            if do_log_scale:
+                temp_valid = valid_data_mask[band_rows, band_cols]
+                temp_data_to_equalize[temp_valid] = numpy.log(temp_data_to_equalize[temp_valid] + log_offset)
+
+            num_col_tiles = band_cols // tile_size
+            tile_rows = band_rows - num_row_tile * tile_size
+            tile_cols = band_cols - num_col_tiles * tile_size
+
+            temp_sum = numpy.zeros_like(temp_data_to_equalize)
+            unused_weight = numpy.zeros(temp_data_to_equalize.shape, dtype=tile_weights.dtype)
+            for weight_row in range(3):
+                for weight_col in range(3):
+                    tmp_tile_weights = tile_weights[weight_row, weight_col][tile_rows, tile_cols]
+                    # +1 for the border of missing tiles
+                    tmp_tile_index = tile_index[num_row_tile + weight_row, num_col_tiles + weight_col]
+                    has_tile = tmp_tile_index >= 0
+                    unused_weight[~has_tile] -= tmp_tile_weights[~has_tile]
+                    # most pixels only get weight from 4 of the 9 tiles, don't interpolate the rest
+                    has_tile &= tmp_tile_weights != 0
+                    temp_equalized_data = _interp_tiles(temp_data_to_equalize[has_tile], tmp_tile_index[has_tile],
+                                                        all_bins, all_cdfs, all_slopes)
+                    temp_sum[has_tile] += temp_equalized_data * tmp_tile_weights[has_tile]
+            # correct for the weight of tiles that fell off the edge of the image
+            temp_sum /= unused_weight + 1
+            out[band_rows, band_cols] = temp_sum
+
+        # bands never cross a row of tiles
+        band_starts = [band_start for tile_row_start in range(0, total_rows, tile_size)
+                       for band_start in range(tile_row_start, min(tile_row_start + tile_size, total_rows),
+                                               rows_per_band)]
+        for _ in executor.map(_equalize_band, band_starts):
+            pass
 
     # if we were asked to, normalize our data to be between zero and one, rather than zero and number_of_bins
     if do_zerotoone_normalization :
         _linear_normalization_from_0to1 (out, mask_to_equalize, number_of_bins)
-    
+
     return out
 
 def _histogram_equalization_helper (valid_data, number_of_bins, clip_limit=None, slope_limit=None) :
@@ -292,6 +377,117 @@ def _histogram_equalization_helper (valid_data, number_of_bins, clip_limit=None,
     # return what someone else will need in order to apply the equalization later
     return cumulative_dist_function, temp_bins
 
+def _batched_histogram_equalization_helper (all_valid_data, number_of_bins, clip_limit=None, slope_limit=None) :
+    """
+    calculate `_histogram_equalization_helper` for many sets of valid data at once
+
+    the data for all of the sets is binned with a single bincount and the clipping and
+    cumulative distribution functions are calculated for every set together
+
+    returns 2D arrays of the cumulative distribution functions and bin information, one row per set of valid data
+    """
+
+    sizes = numpy.array([valid_data.size for valid_data in all_valid_data])
+    all_bins = numpy.stack([numpy.histogram_bin_edges(valid_data, number_of_bins) for valid_data in all_valid_data])
+    set_index = numpy.repeat(numpy.arange(len(all_valid_data)), sizes)
+    valid_data = numpy.concatenate(all_valid_data)
+
+    # find the bin for each value the same way numpy.histogram does: start with a guess from the bin width and
+    # move it until bins[i] <= value < bins[i + 1] (the last bin includes the right edge)
+    bin_start = all_bins[set_index, 0].astype(numpy.float64)
+    bin_end = all_bins[set_index, -1].astype(numpy.float64)
+    bin_index = ((valid_data - bin_start) / (bin_end - bin_start) * number_of_bins).astype(numpy.intp)
+    numpy.clip(bin_index, 0, number_of_bins - 1, out=bin_index)
+    flat_bins = all_bins.ravel()
+    flat_offset = set_index * (number_of_bins + 1)
+    to_check = numpy.arange(valid_data.size)
+    while to_check.size:
+        check_index = bin_index[to_check]
+        check_offset = flat_offset[to_check] + check_index
+        check_data = valid_data[to_check]
+        decrement = check_data < flat_bins[check_offset]
+        increment = (check_data >= flat_bins[check_offset + 1]) & (check_index != number_of_bins - 1)
+        bin_index[to_check[decrement]] -= 1
+        bin_index[to_check[increment]] += 1
+        to_check = to_check[decrement | increment]
+
+    temp_histogram = numpy.bincount(set_index * number_of_bins + bin_index,
+                                    minlength=len(all_valid_data) * number_of_bins).reshape((len(all_valid_data), number_of_bins))
+
+    return all_bins, _histograms_to_cdfs(temp_histogram, sizes, number_of_bins, clip_limit=clip_limit,
+                                         slope_limit=slope_limit)
+
+def _histograms_to_cdfs (temp_histogram, sizes, number_of_bins, clip_limit=None, slope_limit=None) :
+    """
+    calculate the cumulative distribution functions for a 2D array of histograms (one per row) the same way
+    `_histogram_equalization_helper` does
+
+    sizes is the number of values that went in to each histogram
+    """
+
+    if clip_limit is not None:
+        pixels_to_clip_at = (clip_limit * (sizes / float(number_of_bins))).astype(temp_histogram.dtype)
+        mask_to_clip = temp_histogram > clip_limit
+        temp_histogram = numpy.where(mask_to_clip, pixels_to_clip_at[:, None], temp_histogram)
+
+    cumulative_dist_function = temp_histogram.cumsum(axis=1)
+
+    if slope_limit is not None:
+        # each bin can only be pixel_height_limit higher than the bin before it, the excess is removed from that bin
+        # and every bin after it
+        pixel_height_limit = (slope_limit * (sizes / float(number_of_bins))).astype(temp_histogram.dtype)
+        excess_height = numpy.maximum(temp_histogram[:, 1:] - pixel_height_limit[:, None], 0)
+        cumulative_dist_function[:, 1:] -= excess_height.cumsum(axis=1)
+
+    # now normalize the overall distribution functions
+    cumulative_dist_function = (number_of_bins - 1) * cumulative_dist_function / cumulative_dist_function[:, -1:]
+
+    return cumulative_dist_function
+
+def _interp_tiles (x, tile_index, all_bins, all_cdfs, all_slopes) :
+    """
+    same as ``numpy.interp(x[i], all_bins[tile_index[i]], all_cdfs[tile_index[i]])`` for every element of x
+
+    all_slopes is the slope between each pair of points in the cumulative distribution functions with an extra
+    column of zeros at the end so it is the same shape as all_bins and all_cdfs
+    """
+
+    number_of_points = all_bins.shape[1]
+    flat_bins = all_bins.ravel()
+    flat_cdfs = all_cdfs.ravel()
+    flat_slopes = all_slopes.ravel()
+    first_bin = all_bins[:, 0].take(tile_index)
+    # values left of the first bin get the first value of the cdf
+    x = numpy.maximum(x.astype(numpy.float64), first_bin)
+
+    # guess the point to the left of each value from the bin width, values right of the last bin get the last point
+    bin_scale = ((number_of_points - 1) / (all_bins[:, -1] - all_bins[:, 0])).take(tile_index)
+    with numpy.errstate(invalid="ignore"):
+        point_index = (x - first_bin) * bin_scale
+    numpy.fmax(point_index, 0, out=point_index)
+    numpy.fmin(point_index, number_of_points - 1, out=point_index)
+    flat_index = tile_index * number_of_points + point_index.astype(numpy.intp)
+    del first_bin, bin_scale, point_index
+
+    # move the guess until bins[j] <= x < bins[j + 1] (or j is the last point)
+    first_point = flat_index - flat_index % number_of_points
+    last_point = first_point + number_of_points - 1
+    left_bin = flat_bins.take(flat_index)
+    to_check = numpy.arange(x.size)
+    while to_check.size:
+        check_index = flat_index[to_check]
+        check_data = x[to_check]
+        decrement = (check_index != first_point[to_check]) & (check_data < left_bin[to_check])
+        increment = (check_index != last_point[to_check]) & \
+                    (check_data >= flat_bins.take(numpy.minimum(check_index + 1, flat_bins.size - 1)))
+        flat_index[to_check[decrement]] -= 1
+        flat_index[to_check[increment]] += 1
+        to_check = to_check[decrement | increment]
+        left_bin[to_check] = flat_bins.take(flat_index[to_check])
+
+    return flat_slopes.take(flat_index) * (x - left_bin) + flat_cdfs.take(flat_index)
+
+@lru_cache(maxsize=4)
 def _calculate_weights (tile_size) :
     """
     calculate a weight array that will be used to quickly bilinearly-interpolate the histogram equalizations
@@ -50,15 +50,25 @@ __docformat__ = "restructuredtext en"
 
 import os
 import sys
+import copy
 
 import logging
 import numpy
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 from polar2grid.core.dtype import dtype_to_str, dtype2range
+from polar2grid.core.statistics import get_statistics
 from . import roles
 
 LOG = logging.getLogger(__name__)
 DEFAULT_RCONFIG = "polar2grid.core:rescale_configs/rescale.ini"
+# Number of rows rescaled at a time by rescaling methods that can work on one block of data at a time
+RESCALE_ROWS_PER_BLOCK = int(os.environ.get("P2G_RESCALE_ROWS_PER_BLOCK", 1024))
+# Number of bands of a multi-band product (RGB, etc) rescaled at the same time
+RESCALE_NUM_WORKERS = int(os.environ.get("P2G_RESCALE_NUM_WORKERS", os.cpu_count() or 1))
+# Maximum number of whole number values palettized with a lookup table instead of trollimage
+MAX_PALETTE_LUT_SIZE = 65536
 
 
 def mask_helper(img, fill_value):
@@ -350,13 +360,83 @@ def ndvi_scale(img, min_out, max_out, min_in=-1.0, max_in=1.0, threshold=0.0, th
     return img
 
 
-def palettize(img, min_out, max_out, min_in=0, max_in=1.0, colormap=None, alpha=True, colorize=False, **kwargs):
-    """Apply a colormap to data and return the indices in to that colormap."""
+def palettize(img, min_out, max_out, min_in=0, max_in=1.0, colormap=None, alpha=True, colorize=False, lut=False,
+              **kwargs):
+    """Apply a colormap to data and return the indices in to that colormap.
+
+    Integer data and products configured with ``lut=True`` (floating point data that only contains whole numbers
+    like categories, classes, or masks) are converted with a lookup table (see `palettize_lut`). Other data is
+    palettized with trollimage.
+    """
+    if lut or numpy.issubdtype(img.dtype, numpy.integer):
+        result = palettize_lut(img, min_out, max_out, min_in=min_in, max_in=max_in, colormap=colormap, alpha=alpha,
+                               colorize=colorize, **kwargs)
+        if result is not None:
+            return result
+    return _palettize_trollimage(img, min_out, max_out, min_in=min_in, max_in=max_in, colormap=colormap,
+                                 alpha=alpha, colorize=colorize, **kwargs)
+
+
+def palettize_lut(img, min_out, max_out, min_in=0, max_in=1.0, colormap=None, alpha=True, colorize=False,
+                  good_data_mask=None, max_lut_size=MAX_PALETTE_LUT_SIZE, rows_per_block=None, **kwargs):
+    """Palettize or colorize whole number data using a lookup table.
+
+    The trollimage palettizing is run once on every whole number between `min_in` and `max_in` (and once for
+    invalid data) to create a lookup table of output values. Values outside of that range get the same colors as
+    the ends of the colormap so they use the first or last entry. The output is then a `numpy.take` from the
+    table for each block of rows. The data isn't checked for whole numbers, the result is the same as `palettize`
+    if it only contains whole numbers.
+
+    :returns: Palettized data or `None` if there are more than `max_lut_size` values between `min_in` and `max_in`
+    """
+    if img.ndim != 2 or not img.size:
+        return None
+    is_integer = numpy.issubdtype(img.dtype, numpy.integer)
+    if not is_integer and not numpy.issubdtype(img.dtype, numpy.floating):
+        return None
+    min_value = int(numpy.floor(min_in))
+    max_value = int(numpy.ceil(max_in))
+    if is_integer:
+        # integer data can't have values outside of its data type
+        dtype_info = numpy.iinfo(img.dtype)
+        min_value = min(max(min_value, int(dtype_info.min)), int(dtype_info.max))
+        max_value = min(max(max_value, int(dtype_info.min)), int(dtype_info.max))
+    num_values = max_value - min_value + 1
+    if num_values > max_lut_size:
+        return None
+    if good_data_mask is None:
+        good_data_mask = numpy.ones(img.shape, dtype=bool)
+
+    LOG.debug("Palettizing with a lookup table of %d values", num_values)
+    # one row image of every possible value, the last pixel is for invalid pixels
+    lut_input = numpy.empty((1, num_values + 1), dtype=img.dtype)
+    lut_input[0, :-1] = numpy.arange(min_value, min_value + num_values)
+    lut_input[0, -1] = min_value
+    lut_mask = numpy.ones(lut_input.shape, dtype=bool)
+    lut_mask[0, -1] = False
+    lut = _palettize_trollimage(lut_input, min_out, max_out, min_in=min_in, max_in=max_in, colormap=colormap,
+                                alpha=alpha, colorize=colorize, good_data_mask=lut_mask, chunks=-1, **kwargs)
+    lut = lut[..., 0, :]
+
+    out = numpy.empty(lut.shape[:-1] + img.shape, dtype=lut.dtype)
+    rows_per_block = rows_per_block or RESCALE_ROWS_PER_BLOCK
+    for start in range(0, img.shape[0], rows_per_block):
+        block = slice(start, start + rows_per_block)
+        indexes = numpy.subtract(img[block], min_value, dtype=numpy.float64 if not is_integer else numpy.int64)
+        numpy.clip(indexes, 0, num_values - 1, out=indexes)
+        indexes[~good_data_mask[block]] = num_values
+        out[..., block, :] = numpy.take(lut, indexes.astype(numpy.intp), axis=-1)
+    return out
+
+
+def _palettize_trollimage(img, min_out, max_out, min_in=0, max_in=1.0, colormap=None, alpha=True, colorize=False,
+                          chunks=None, **kwargs):
     import xarray as xr
     import dask.array as da
     from trollimage.xrimage import XRImage
     import trollimage.colormap as ticolormap
-    from satpy import CHUNK_SIZE
+    if chunks is None:
+        from satpy import CHUNK_SIZE as chunks
     good_data_mask = kwargs['good_data_mask']
 
     if img.ndim > 2:
@@ -370,7 +450,7 @@ def palettize(img, min_out, max_out, min_in=0, max_in=1.0, colormap=None, alpha=
     dims = ('y', 'x') if img.ndim == 2 else ('y',)
     attrs = kwargs.get('attrs', {})
     xrimg = XRImage(
-        xr.DataArray(da.from_array(img, chunks=CHUNK_SIZE), dims=dims, attrs=attrs))
+        xr.DataArray(da.from_array(img, chunks=chunks), dims=dims, attrs=attrs))
     if alpha:
         # convert to float otherwise trollimage will make a 0-255 alpha band (for uint8 data)
         xrimg.data = xrimg.data.where(good_data_mask)
@@ -434,6 +514,20 @@ def water_temp_palettize(img, min_out, max_out, min_in=0, max_in=1.0, colormap=N
     return img
 
 
+@lru_cache(maxsize=None)
+def load_colormap(colormap_name):
+    """Load a colormap from a color table file or get a builtin trollimage colormap by name.
+
+    Colormaps are cached by name and must not be modified, use a copy.
+    """
+    import trollimage.colormap as ticolormap
+    from polar2grid.add_colormap import load_color_table_file_to_colormap
+    try:
+        return load_color_table_file_to_colormap(colormap_name)
+    except OSError:
+        return getattr(ticolormap, colormap_name)
+
+
 def debug_scale(img, min_out, max_out, min_in=0, max_in=1.0, percent=0.5, **kwargs):
     # Put all valid at the top of the output scale
     LOG.debug("Running debug scale")
@@ -473,6 +567,29 @@ class Rescaler(roles.INIConfigReader):
         'water_temp_palettize': water_temp_palettize,
         'debug': debug_scale,
     }
+    # Rescaling methods whose output for a pixel only depends on that pixel's value. These are run on one block of
+    # rows at a time reading directly from the gridded product's file (see `_rescale_data_blockwise`)
+    blockwise_methods = {
+        'linear',
+        'linear_basic',
+        'brightness_temperature',
+        'linear_brightness_temperature',
+        'sqrt',
+        'temperature_difference',
+        'raw',
+        'lst',
+        'ctt',
+        'ndvi',
+        'unlinear',
+    }
+    rows_per_block = RESCALE_ROWS_PER_BLOCK
+    num_workers = RESCALE_NUM_WORKERS
+    # Methods that compute the input limits from all of the data if 'min_in' or 'max_in' aren't configured
+    data_limit_methods = {
+        'linear',
+        'linear_brightness_temperature',
+        'temperature_difference',
+    }
 
     def __init__(self, *rescale_configs, **kwargs):
         kwargs["section_prefix"] = kwargs.get("section_prefix", "rescale:")
@@ -484,9 +601,14 @@ class Rescaler(roles.INIConfigReader):
         kwargs["boolean_kwargs"] = self._bool_kwargs()
         LOG.debug("Loading rescale configuration files:\n\t%s", "\n\t".join(rescale_configs))
         super(Rescaler, self).__init__(*rescale_configs, **kwargs)
+        self._rescale_options_cache = {}
+
+    def compile_config(self):
+        super(Rescaler, self).compile_config()
+        self._rescale_options_cache = {}
 
     def _bool_kwargs(self):
-        args = {"clip", "flip", "alpha"}
+        args = {"clip", "flip", "alpha", "lut"}
         return args
 
     def _float_kwargs(self):
@@ -501,6 +623,7 @@ class Rescaler(roles.INIConfigReader):
         args.remove("units")
         args.remove("colormap")
         args.remove("alpha")
+        args.remove("lut")  # boolean
         args.add("min_out")
         args.add("max_out")
         args.add("percent")
@@ -510,7 +633,7 @@ class Rescaler(roles.INIConfigReader):
         self.rescale_methods[name] = (func, kwargs)
 
     def _rescale_data(self, method, data, good_data_mask, rescale_options, fill_value, clip=True, mask_clip=None, inc_by_one=False,
-                      clip_zero=False):
+                      clip_zero=False, stats=None):
         try:
             LOG.debug("Scaling data with method %s and arguments %r", method, rescale_options)
             rescale_func = self.rescale_methods[method]
@@ -518,6 +641,9 @@ class Rescaler(roles.INIConfigReader):
             # trollimage functions need a 2D image
             if is_colormapped:
                 good_data = rescale_func(data, good_data_mask=good_data_mask, **rescale_options)
+                if stats is not None:
+                    valid_count = numpy.count_nonzero(good_data_mask)
+                    stats.add(valid_count, good_data_mask.size - valid_count)
                 return good_data
             else:
                 good_data = data[good_data_mask]
@@ -544,6 +670,11 @@ class Rescaler(roles.INIConfigReader):
             # rescaling functions should set NaN for invalid values
             good_data_mask &= ~mask_helper(data, numpy.nan)
             data[~good_data_mask] = fill_value
+            if stats is not None:
+                # reduce the valid pixels that were already gathered instead of the full arrays
+                valid_pixels = ~numpy.isnan(good_data)
+                stats.update(good_data, valid_pixels, offset=1 if inc_by_one else 0,
+                             fill_count=good_data_mask.size - good_data.size)
 
             if inc_by_one and not is_colormapped:
                 LOG.debug("Incrementing data by 1 so 0 acts as a fill value")
@@ -554,13 +685,141 @@ class Rescaler(roles.INIConfigReader):
             LOG.error("Unexpected error during rescaling")
             raise
 
+    def _map_bands(self, func, num_bands):
+        """Call `func(band_index)` for every band using up to `num_workers` threads.
+
+        :returns: list of results in band order
+        """
+        num_workers = min(self.num_workers, num_bands)
+        if num_workers <= 1:
+            return [func(band_idx) for band_idx in range(num_bands)]
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            return list(executor.map(func, range(num_bands)))
+
+    def _rescale_bands(self, method, data, good_data_mask, rescale_options, fill_value, **kwargs):
+        """Rescale each band of 3D `data` separately and at the same time.
+
+        Most methods rescale a band in place so `data` itself is returned. Methods that return a new array
+        (colormaps) are copied in to one preallocated output array of shape ``(bands,) + band_result.shape``.
+        """
+        def _rescale_band(band_idx):
+            band_data = data[band_idx]
+            band_result = self._rescale_data(method, band_data, good_data_mask[band_idx], rescale_options,
+                                             fill_value, **kwargs)
+            return None if band_result is band_data else band_result
+
+        band_results = self._map_bands(_rescale_band, data.shape[0])
+        if all(band_result is None for band_result in band_results):
+            return data
+        out = numpy.empty((data.shape[0],) + band_results[0].shape, dtype=band_results[0].dtype)
+        for band_idx in range(data.shape[0]):
+            out[band_idx] = band_results[band_idx]
+            band_results[band_idx] = None
+        return out
+
+    def can_rescale_blockwise(self, method, rescale_options, data_type):
+        """Check if `method` can be run on one block of data at a time with the provided options.
+        """
+        if method not in self.blockwise_methods or not numpy.issubdtype(data_type, numpy.floating):
+            return False
+        if method in self.data_limit_methods and \
+                (rescale_options.get("min_in") is None or rescale_options.get("max_in") is None):
+            return False
+        return True
+
+    def _rescale_data_blockwise(self, method, data, fill_in, out, rescale_options, fill_value, clip=True,
+                                mask_clip=None, inc_by_one=False, clip_zero=False, rows_per_block=None, stats=None):
+        """Rescale `data` in to `out` by masking, scaling, clipping, filling, and incrementing one block at a time.
+
+        This produces the same result as `_rescale_data` without copying the entire input array or
+        gathering and scattering the valid pixels. Only methods in `blockwise_methods` are supported.
+
+        :param data: 2D input array (usually a read-only memory map of the gridded product)
+        :param fill_in: fill value of the input data
+        :param out: 2D array the same shape as `data` to write the rescaled data to
+        :param stats: `ProductStatistics` to update with the valid pixels of each rescaled block
+        """
+        rows_per_block = rows_per_block or self.rows_per_block
+        try:
+            block_func = self._get_block_rescaler(method, fill_in, rescale_options, fill_value, clip=clip,
+                                                  mask_clip=mask_clip, inc_by_one=inc_by_one, clip_zero=clip_zero,
+                                                  stats=stats)
+            for start in range(0, data.shape[0], rows_per_block):
+                block = slice(start, start + rows_per_block)
+                out[block] = block_func(data[block])
+            return out
+        except (ValueError, KeyError, RuntimeError):
+            LOG.error("Unexpected error during rescaling")
+            raise
+
+    def _get_block_rescaler(self, method, fill_in, rescale_options, fill_value, clip=True, mask_clip=None,
+                            inc_by_one=False, clip_zero=False, stats=None):
+        """Get a function that rescales one block of data (any shape) and returns the rescaled copy.
+
+        Only methods in `blockwise_methods` are supported. The function doesn't modify its input. If `stats` is
+        provided it is updated with the valid pixels of every block that is rescaled.
+        """
+        LOG.debug("Scaling data block-wise with method %s and arguments %r", method, rescale_options)
+        rescale_func = self.rescale_methods[method]
+        min_clip = None
+        if clip:
+            LOG.debug("Clipping data between %f and %f", rescale_options["min_out"], rescale_options["max_out"])
+            min_clip = rescale_options["min_out"]
+            if clip_zero and rescale_options['min_out'] == 0 and not inc_by_one:
+                LOG.debug("Additionally clipping data between %f and %f", 1, rescale_options["max_out"])
+                min_clip = 1
+        if inc_by_one:
+            LOG.debug("Incrementing data by 1 so 0 acts as a fill value")
+
+        def _rescale_block(data):
+            block_data = numpy.array(data)
+            good_data_mask = ~mask_helper(block_data, fill_in)
+            if not numpy.isnan(fill_in):
+                # invalid pixels are treated like values the rescaling method couldn't calculate
+                block_data[~good_data_mask] = numpy.nan
+            block_data = rescale_func(block_data, **rescale_options)
+
+            if clip:
+                if mask_clip in ["both", "min", True]:
+                    block_data[block_data < rescale_options["min_out"]] = numpy.nan
+                if mask_clip in ["both", "max", True]:
+                    block_data[block_data > rescale_options["max_out"]] = numpy.nan
+                block_data = numpy.clip(block_data, min_clip, rescale_options["max_out"], out=block_data)
+
+            # same data type conversion as assigning the valid pixels back in to the original array
+            block_data = block_data.astype(data.dtype, copy=False)
+            good_data_mask &= ~mask_helper(block_data, numpy.nan)
+            if stats is not None:
+                stats.update(block_data, good_data_mask, offset=1 if inc_by_one else 0)
+            block_data[~good_data_mask] = fill_value
+            if inc_by_one:
+                block_data[good_data_mask] += 1
+            return block_data
+        return _rescale_block
+
     def get_rescale_options(self, gridded_product, data_type, inc_by_one=False, fill_value=None):
-        all_meta = gridded_product["grid_definition"].copy(as_dict=True)
-        all_meta.update(**gridded_product)
-        kwargs = dict((k, all_meta.get(k, None)) for k in self.id_fields)
+        """Get the rescaling options configured for a gridded product.
+
+        Options are resolved once per unique set of identifying fields, output data type, and fill value. Later
+        calls for matching products (other grids, tiles, or backends) get a copy of the previous result.
+        """
+        grid_definition = gridded_product["grid_definition"]
+        # product metadata overrides the grid definition's
+        kwargs = dict((k, gridded_product[k] if k in gridded_product else grid_definition.get(k, None))
+                      for k in self.id_fields)
         # we don't want the product's current data_type, we want what the output will be
         kwargs["data_type"] = dtype_to_str(data_type)
         kwargs["inc_by_one"] = inc_by_one
+        default_units = gridded_product.get("units", "kelvin")
+        try:
+            cache_key = (tuple(kwargs[k] for k in self.id_fields), default_units, str(fill_value))
+            rescale_options = self._rescale_options_cache.get(cache_key)
+        except TypeError:
+            cache_key = None
+            rescale_options = None
+        if rescale_options is not None:
+            return rescale_options.copy()
+
         rescale_options = self.get_config_options(**kwargs)
         if "method" not in rescale_options:
             LOG.error("No rescaling method found and no default method configured for %s", gridded_product["product_name"])
@@ -570,40 +829,46 @@ class Rescaler(roles.INIConfigReader):
         min_out, max_out = dtype2range[kwargs["data_type"]]
         rescale_options.setdefault("min_out", min_out)
         rescale_options.setdefault("max_out", max_out - 1 if rescale_options["inc_by_one"] else max_out)
-        rescale_options.setdefault("units", gridded_product.get("units", "kelvin"))
+        rescale_options.setdefault("units", default_units)
         rescale_options["fill_out"] = fill_value
 
         # Parse out colormaps
         colormap = rescale_options.get('colormap')
         if colormap is not None:
             import trollimage.colormap as ticolormap
-            from polar2grid.add_colormap import load_color_table_file_to_colormap
             if isinstance(colormap, str):
-                try:
-                    colormap = load_color_table_file_to_colormap(colormap)
-                except OSError:
-                    colormap = getattr(ticolormap, colormap)
+                # copy so the range of the cached colormap isn't changed
+                colormap = copy.deepcopy(load_colormap(colormap))
             elif not isinstance(colormap, ticolormap.Colormap):
                 raise ValueError("Unknown 'colormap' type: %s", str(type(colormap)))
             if 'min_in' in rescale_options:
                 colormap.set_range(rescale_options['min_in'], rescale_options['max_in'])
             rescale_options['colormap'] = colormap
-        return rescale_options
+
+        if cache_key is not None:
+            self._rescale_options_cache[cache_key] = rescale_options
+        return rescale_options.copy()
 
     def rescale_product(self, gridded_product, data_type, inc_by_one=False, fill_value=None, rescale_options=None,
-                        clip_zero=False):
+                        clip_zero=False, lazy=False, chunks=None):
         """Rescale a gridded product based on how the rescaler is configured.
 
         The caller should know if it wants to increment the output data by 1 (`inc_by_one` keyword).
 
         :param data_type: Desired data type of the output data
         :param inc_by_one: After rescaling should 1 be added to all data values to leave the minumum value as the fill
+        :param lazy: Return a dask array that rescales each chunk of the gridded product when it is computed
+                     instead of a numpy array (see `rescale_product_lazy`)
+        :param chunks: dask chunk size when `lazy` is True (default: `rows_per_block` full rows per chunk)
 
         FUTURE: dec_by_one (mutually exclusive to inc_by_one)
 
         """
         if rescale_options is None:
             rescale_options = self.get_rescale_options(gridded_product, data_type, inc_by_one, fill_value)
+        if lazy:
+            return self.rescale_product_lazy(gridded_product, data_type, fill_value=fill_value,
+                                             rescale_options=rescale_options, clip_zero=clip_zero, chunks=chunks)
 
         method = rescale_options.pop("method")
         # if the configuration file didn't force these then provide a logical default
@@ -611,30 +876,81 @@ class Rescaler(roles.INIConfigReader):
         mask_clip = rescale_options.pop("mask_clip", None)
         inc_by_one = rescale_options.pop("inc_by_one")
 
+        rescale_options['attrs'] = gridded_product  # copy metadata as keyword argument
+        input_data = gridded_product.get_data_array()
+        stats = self._start_statistics(gridded_product)
+        if self.can_rescale_blockwise(method, rescale_options, input_data.dtype):
+            # single pass over the input data: no full copy of the input and no temporary arrays of valid pixels
+            data = numpy.empty(input_data.shape, dtype=input_data.dtype)
+            # the methods are per-pixel so separate_rgb doesn't change the result
+            if data.ndim == 3:
+                self._map_bands(lambda band_idx: self._rescale_data_blockwise(
+                    method, input_data[band_idx], gridded_product["fill_value"], data[band_idx], rescale_options,
+                    fill_value, clip=clip, mask_clip=mask_clip, inc_by_one=inc_by_one, clip_zero=clip_zero,
+                    stats=stats), data.shape[0])
+            else:
+                self._rescale_data_blockwise(method, input_data, gridded_product["fill_value"], data,
+                                             rescale_options, fill_value, clip=clip, mask_clip=mask_clip,
+                                             inc_by_one=inc_by_one, clip_zero=clip_zero, stats=stats)
+            get_statistics().finish(stats)
+            return data
+
         data = gridded_product.copy_array(read_only=False)
         good_data_mask = ~gridded_product.get_data_mask()
-        rescale_options['attrs'] = gridded_product  # copy metadata as keyword argument
         if rescale_options.get("separate_rgb", True) and data.ndim == 3:
-            data = numpy.concatenate((
-                [self._rescale_data(method, data[0], good_data_mask[0], rescale_options, fill_value, clip=clip, mask_clip=mask_clip, inc_by_one=inc_by_one, clip_zero=clip_zero)],
-                [self._rescale_data(method, data[1], good_data_mask[1], rescale_options, fill_value, clip=clip, mask_clip=mask_clip, inc_by_one=inc_by_one, clip_zero=clip_zero)],
-                [self._rescale_data(method, data[2], good_data_mask[2], rescale_options, fill_value, clip=clip, mask_clip=mask_clip, inc_by_one=inc_by_one, clip_zero=clip_zero)],
-            ))
+            data = self._rescale_bands(method, data, good_data_mask, rescale_options, fill_value, clip=clip,
+                                       mask_clip=mask_clip, inc_by_one=inc_by_one, clip_zero=clip_zero,
+                                       stats=stats)
         else:
-            data = self._rescale_data(method, data, good_data_mask, rescale_options, fill_value,
-                                      clip=clip, mask_clip=mask_clip, inc_by_one=inc_by_one, clip_zero=clip_zero)
-
-        log_level = logging.getLogger('').handlers[0].level or 0
-        # Only perform this calculation if it will be shown, its very time consuming
-        if log_level <= logging.DEBUG:
-            try:
-                # assumes NaN fill value
-                LOG.debug("Data min: %f, max: %f" % (float(numpy.nanmin(data)), float(numpy.nanmax(data))))
-            except (ValueError, KeyError, RuntimeError):
-                LOG.debug("Couldn't get min/max values for %s (all fill data?)", gridded_product["product_name"])
+            data = self._rescale_data(method, data, good_data_mask, rescale_options, fill_value, clip=clip,
+                                      mask_clip=mask_clip, inc_by_one=inc_by_one, clip_zero=clip_zero, stats=stats)
 
+        get_statistics().finish(stats)
         return data
 
+    def rescale_product_lazy(self, gridded_product, data_type, inc_by_one=False, fill_value=None,
+                             rescale_options=None, clip_zero=False, chunks=None):
+        """Rescale a gridded product as a dask array so it can be computed and written one chunk at a time.
+
+        Nothing is read from the gridded product's file until the result is computed. Chunks are rescaled
+        independently (masking, scaling, clipping, filling, and incrementing) so they can be processed in parallel
+        with bounded memory. Rescaling methods that aren't per-pixel (see `can_rescale_blockwise`) are computed
+        right away and the result is wrapped in a dask array.
+
+        Arguments are the same as `rescale_product`.
+        """
+        import dask.array as da
+        if rescale_options is None:
+            rescale_options = self.get_rescale_options(gridded_product, data_type, inc_by_one, fill_value)
+        method = rescale_options.get("method")
+        input_data = gridded_product.get_data_array()
+        if chunks is None:
+            chunks = (1,) * (input_data.ndim - 2) + (self.rows_per_block, input_data.shape[-1])
+
+        if not self.can_rescale_blockwise(method, rescale_options, input_data.dtype):
+            LOG.debug("Rescaling method '%s' can't be done lazily, rescaling all of the data now", method)
+            data = self.rescale_product(gridded_product, data_type, fill_value=fill_value,
+                                        rescale_options=rescale_options, clip_zero=clip_zero)
+            return da.from_array(data, chunks=chunks)
+
+        method = rescale_options.pop("method")
+        clip = rescale_options.pop("clip", True)
+        mask_clip = rescale_options.pop("mask_clip", None)
+        inc_by_one = rescale_options.pop("inc_by_one")
+        rescale_options['attrs'] = gridded_product  # copy metadata as keyword argument
+        # filled in as the chunks are computed
+        stats = self._start_statistics(gridded_product)
+        block_func = self._get_block_rescaler(method, gridded_product["fill_value"], rescale_options, fill_value,
+                                              clip=clip, mask_clip=mask_clip, inc_by_one=inc_by_one,
+                                              clip_zero=clip_zero, stats=stats)
+        dask_data = da.from_array(input_data, chunks=chunks)
+        return dask_data.map_blocks(block_func, dtype=input_data.dtype)
+
+    @staticmethod
+    def _start_statistics(gridded_product):
+        grid_definition = gridded_product.get("grid_definition") or {}
+        return get_statistics().start("rescale", gridded_product["product_name"], grid_definition.get("grid_name"))
+
 
 def main():
     from argparse import ArgumentParser
@@ -190,6 +190,11 @@ class INIConfigReader(SimpleINIConfigReader):
         self.float_kwargs = kwargs.pop("float_kwargs", [])
         self.int_kwargs = kwargs.pop("int_kwargs", [])
         self.boolean_kwargs = kwargs.pop("boolean_kwargs", [])
+        # resolved sections and options (see `compile_config`)
+        self._id_matcher = None
+        self._section_cache = {}
+        self._section_options_cache = {}
+        self._options_cache = {}
 
         # Need to have defaults for id fields
         for k in self.id_fields:
@@ -233,6 +238,38 @@ class INIConfigReader(SimpleINIConfigReader):
         # If 2 or more entries have the same number of wildcards they may not be sorted optimally
         # (i.e. specific first field highest)
         self.config.sort(key=lambda x: (x[0], next(re.finditer(r'[^\^:.*].*', x[2].pattern)).start(), x[3]))
+        self.compile_config()
+
+    def compile_config(self):
+        """Combine the identifying regular expressions of every section in to one regular expression.
+
+        Alternatives are tried in the same order as `config` so the first section matched is the same section
+        that would be found by checking each section's regular expression in order. Any previously resolved
+        sections and options are forgotten.
+        """
+        self._section_cache = {}
+        self._section_options_cache = {}
+        self._options_cache = {}
+        self._id_matcher = None
+        if not self.config:
+            return
+        try:
+            self._id_matcher = re.compile("|".join("(?P<_section%d>%s)" % (idx, regex_obj.pattern)
+                                                   for idx, (_, _, regex_obj, _) in enumerate(self.config)))
+        except (re.error, OverflowError, RecursionError):
+            LOG.debug("Could not combine configuration regular expressions, will check them one at a time")
+
+    def _match_config_section(self, id_key):
+        if self._id_matcher is not None:
+            match = self._id_matcher.match(id_key)
+            if match is None:
+                return None
+            return self.config[int(match.lastgroup[len("_section"):])]
+
+        for config_key in self.config:
+            if config_key[2].match(id_key):
+                return config_key
+        return None
 
     def get_config_section(self, **kwargs):
         if len(kwargs) != len(self.id_fields):
@@ -241,29 +278,34 @@ class INIConfigReader(SimpleINIConfigReader):
             raise ValueError("Incorrect number of identifying arguments, expected %d, got %d" % (len(self.id_fields), len(kwargs)))
 
         id_key = self.sep_char.join(str(kwargs.get(k, None)) for k in self.id_fields)
-        for num_wildcards, first_valid_idx, regex_obj, section in self.config:
-            if regex_obj.match(id_key):
-                LOG.debug("Key '%s' matched config regular expression '%s'", id_key, regex_obj.pattern)
-                return section
-        LOG.debug("No match found in config for key: %s", id_key)
-        return None
+        if id_key in self._section_cache:
+            return self._section_cache[id_key]
+
+        config_key = self._match_config_section(id_key)
+        if config_key is not None:
+            LOG.debug("Key '%s' matched config regular expression '%s'", id_key, config_key[2].pattern)
+            section = config_key[3]
+        else:
+            LOG.debug("No match found in config for key: %s", id_key)
+            section = None
+        self._section_cache[id_key] = section
+        return section
+
+    def _get_section_options(self, section):
+        """Get the type converted options for a section (`None` for the defaults) including the defaults.
+        """
+        section_options = self._section_options_cache.get(section)
+        if section_options is not None:
+            return section_options
 
-    def get_config_options(self, **kwargs):
-        allow_default = kwargs.pop("allow_default", True)
-        section = self.get_config_section(**kwargs)
         if section is not None:
-            LOG.debug("Using configuration section: %s", section)
             section_options = dict((k, self.config_parser.get(section, k)) for k in self.config_parser.options(section))
             # gotta get the defaults too
             for k, v in self.config_parser.defaults().items():
                 if k not in section_options:
                     section_options[k] = v
-        elif allow_default:
-            LOG.debug("Using default configuration section")
-            section_options = self.config_parser.defaults().copy()
         else:
-            LOG.error("No configuration section found")
-            raise RuntimeError("No configuration section found")
+            section_options = self.config_parser.defaults().copy()
 
         # Convert values
         for k, v in section_options.items():
@@ -277,11 +319,43 @@ class INIConfigReader(SimpleINIConfigReader):
                 section_options[k] = v == "True"
                 continue
 
+        self._section_options_cache[section] = section_options
+        return section_options
+
+    def get_config_options(self, **kwargs):
+        """Get the options for the section matching the provided identifying fields.
+
+        Results are remembered for each unique set of keyword arguments so this can be called repeatedly for the
+        same product. A new dictionary is returned every time so callers may modify it.
+        """
+        try:
+            cache_key = tuple(sorted(kwargs.items()))
+            section_options = self._options_cache.get(cache_key)
+        except TypeError:
+            # unhashable keyword arguments
+            cache_key = None
+            section_options = None
+        if section_options is not None:
+            return section_options.copy()
+
+        allow_default = kwargs.pop("allow_default", True)
+        section = self.get_config_section(**kwargs)
+        if section is not None:
+            LOG.debug("Using configuration section: %s", section)
+        elif allow_default:
+            LOG.debug("Using default configuration section")
+        else:
+            LOG.error("No configuration section found")
+            raise RuntimeError("No configuration section found")
+        section_options = self._get_section_options(section).copy()
+
         for k, v in kwargs.items():
             # overwrite any wildcards with what we were provided
             section_options[k] = v
 
-        return section_options
+        if cache_key is not None:
+            self._options_cache[cache_key] = section_options
+        return section_options.copy()
 
 
 class CSVConfigReader(object):
@@ -776,15 +850,25 @@ class FrontendRole(object):
     FILE_EXTENSIONS = []
 
     def __init__(self, search_paths=None, overwrite_existing=False, keep_intermediate=False, exit_on_error=True,
-                 **kwargs):
+                 file_catalog=None, num_workers=1, **kwargs):
         self.overwrite_existing = overwrite_existing
         self.keep_intermediate = keep_intermediate
         self.exit_on_error = exit_on_error
+        # maximum number of independent products to create at the same time
+        self.num_workers = num_workers
         self.search_paths = search_paths
         if not self.search_paths:
             LOG.info("No files or paths provided as input, will search the current directory...")
             self.search_paths = ['.']
 
+        file_catalog = file_catalog or os.environ.get("P2G_FILE_CATALOG")
+        if file_catalog:
+            from polar2grid.core.file_catalog import FileCatalog
+            LOG.debug("Using file catalog '%s'", file_catalog)
+            self.file_catalog = FileCatalog(file_catalog)
+        else:
+            self.file_catalog = None
+
     @property
     @abstractmethod
     def begin_time(self):
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Per-product data statistics collected while processing.
+
+The remapping, rescaling, and backend stages record the minimum, maximum,
+number of valid pixels, and number of fill pixels of each product they
+process in a `StatisticsAccumulator`. Statistics are updated from arrays and
+masks the stage already has in memory (one block of rows at a time where the
+stage works that way) so collecting them doesn't require reading the data
+again.
+
+Statistics are logged at the debug level as each stage finishes a product and
+can be written to a JSON sidecar file at the end of processing
+(``--statistics-file`` or the ``P2G_STATISTICS_FILE`` environment variable).
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+"""
+__docformat__ = "restructuredtext en"
+
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_STATISTICS_FILE = os.environ.get("P2G_STATISTICS_FILE", None)
+
+
+class ProductStatistics(object):
+    """Running minimum, maximum, valid pixel count, and fill pixel count for one product.
+
+    Updates are thread-safe so blocks of the same product can be processed in parallel.
+    """
+    def __init__(self, stage, product_name, grid_name=None):
+        self.stage = stage
+        self.product_name = product_name
+        self.grid_name = grid_name
+        self.min = None
+        self.max = None
+        self.valid_count = 0
+        self.fill_count = 0
+        self._lock = threading.Lock()
+
+    def add(self, valid_count, fill_count, min_value=None, max_value=None):
+        """Combine already computed counts and limits with the current statistics."""
+        with self._lock:
+            self.valid_count += int(valid_count)
+            self.fill_count += int(fill_count)
+            if min_value is not None and not numpy.isnan(min_value):
+                self.min = float(min_value) if self.min is None else min(self.min, float(min_value))
+            if max_value is not None and not numpy.isnan(max_value):
+                self.max = float(max_value) if self.max is None else max(self.max, float(max_value))
+
+    def update(self, data, valid_mask, offset=0, fill_count=0):
+        """Add the valid pixels of a block of data.
+
+        The limits are reduced over `data` where `valid_mask` is True without gathering the valid pixels in to a
+        new array.
+
+        :param data: block of data (any shape)
+        :param valid_mask: boolean array the same shape as `data`
+        :param offset: value added to the limits (ex. when the data will be incremented by one after this)
+        :param fill_count: number of fill pixels that were already removed from `data`
+        """
+        valid_count = numpy.count_nonzero(valid_mask)
+        min_value = max_value = None
+        if valid_count:
+            min_value = numpy.min(data, where=valid_mask, initial=numpy.inf) + offset
+            max_value = numpy.max(data, where=valid_mask, initial=-numpy.inf) + offset
+        self.add(valid_count, valid_mask.size - valid_count + fill_count, min_value, max_value)
+
+    @property
+    def valid_percent(self):
+        total = self.valid_count + self.fill_count
+        return self.valid_count / float(total) * 100. if total else 0.
+
+    def to_dict(self):
+        return OrderedDict([
+            ("min", self.min),
+            ("max", self.max),
+            ("valid_count", self.valid_count),
+            ("fill_count", self.fill_count),
+            ("valid_percent", self.valid_percent),
+        ])
+
+    def __str__(self):
+        limits = "min: {}, max: {}".format(self.min, self.max) if self.min is not None else "no limits"
+        return "{}, valid: {:d} ({:0.2f}%), fill: {:d}".format(
+            limits, self.valid_count, self.valid_percent, self.fill_count)
+
+
+class StatisticsAccumulator(object):
+    """Collection of `ProductStatistics` for every stage, product, and grid processed in a run.
+
+    Statistics are only collected when `enabled` is True (ex. a statistics file was requested or debug messages
+    are shown on the console). Otherwise `start` returns None so each stage can skip the extra work.
+
+    Usage::
+
+        stats = get_statistics().start("rescale", product_name, grid_name)
+        for block in ...:
+            ...
+            if stats is not None:
+                stats.update(block_data, block_valid_mask)
+        get_statistics().finish(stats)
+
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._stats = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, stage, product_name, grid_name=None):
+        """Get a new, empty `ProductStatistics` replacing any previous statistics for the same product.
+
+        :returns: `ProductStatistics` or None if statistics aren't being collected
+        """
+        if not self.enabled:
+            return None
+        stats = ProductStatistics(stage, product_name, grid_name)
+        with self._lock:
+            self._stats[(stage, product_name, grid_name)] = stats
+        return stats
+
+    def finish(self, stats):
+        """Log the statistics of a product once a stage is done with it."""
+        if stats is None:
+            return None
+        LOG.debug("%s statistics for %s%s: %s", stats.stage.capitalize(), stats.product_name,
+                  " ({})".format(stats.grid_name) if stats.grid_name else "", stats)
+        return stats
+
+    def get(self, stage, product_name, grid_name=None):
+        return self._stats.get((stage, product_name, grid_name))
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+    def to_dict(self):
+        """Statistics as ``{grid_name: {product_name: {stage: {...}}}}``."""
+        result = OrderedDict()
+        for (stage, product_name, grid_name), stats in list(self._stats.items()):
+            grid_stats = result.setdefault(grid_name or "swath", OrderedDict())
+            grid_stats.setdefault(product_name, OrderedDict())[stage] = stats.to_dict()
+        return result
+
+    def write(self, filename):
+        """Write all of the statistics to a JSON file."""
+        LOG.info("Writing product statistics to '%s'", filename)
+        with open(filename, "w") as stats_file:
+            json.dump(self.to_dict(), stats_file, indent=4)
+        return filename
+
+    def __len__(self):
+        return len(self._stats)
+
+
+_STATISTICS = StatisticsAccumulator()
+
+
+def get_statistics():
+    """Get the statistics accumulator used by every processing stage in this process."""
+    return _STATISTICS
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Tests for the persistent input file catalog.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+
+"""
+__docformat__ = "restructuredtext en"
+
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+from polar2grid.core.file_catalog import FileCatalog, CatalogFileHandle
+
+
+@pytest.fixture
+def input_file(tmpdir):
+    fn = tmpdir.join("input_file.h5")
+    fn.write_binary(b"fake input file contents")
+    return fn
+
+
+class _FakeFileHandle(object):
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+    def __getitem__(self, item):
+        return "value of " + item
+
+
+class TestFileCatalog(object):
+    def test_miss_and_hit(self, tmpdir, input_file):
+        catalog_fn = str(tmpdir.join("catalog", "catalog.json"))
+        catalog = FileCatalog(catalog_fn)
+        assert catalog.get(str(input_file)) is None
+        assert catalog.misses == 1
+        catalog.update(str(input_file), file_type="file_type_a", instrument="viirs", satellite="npp",
+                       begin_time=datetime(2021, 1, 1, 12, 0, 0), end_time=datetime(2021, 1, 1, 12, 1, 30))
+        catalog.set_shape(str(input_file), "data", (768, 3200))
+        catalog.save()
+
+        # the next run
+        catalog = FileCatalog(catalog_fn)
+        assert len(catalog) == 1
+        entry = catalog.get(str(input_file))
+        assert entry["file_type"] == "file_type_a"
+        assert catalog.get_shape(str(input_file), "data") == (768, 3200)
+        assert catalog.get_shape(str(input_file), "other_data") is None
+        assert catalog.hits == 3 and catalog.misses == 0
+
+    def test_unknown_file(self, tmpdir, input_file):
+        catalog = FileCatalog(str(tmpdir.join("catalog.json")))
+        catalog.update(str(input_file), file_type=None)
+        entry = catalog.get(str(input_file))
+        assert entry is not None and entry["file_type"] is None
+
+    @pytest.mark.parametrize("change_size", [True, False])
+    def test_changed_file(self, tmpdir, input_file, change_size):
+        catalog_fn = str(tmpdir.join("catalog.json"))
+        catalog = FileCatalog(catalog_fn)
+        catalog.update(str(input_file), file_type="file_type_a")
+        catalog.save()
+
+        if change_size:
+            input_file.write_binary(b"new and longer fake input file contents")
+        else:
+            st = os.stat(str(input_file))
+            os.utime(str(input_file), (st.st_atime, st.st_mtime + 60))
+        catalog = FileCatalog(catalog_fn)
+        assert catalog.get(str(input_file)) is None
+        assert catalog.misses == 1
+        # the old entry is removed from the saved catalog
+        catalog.save()
+        assert len(FileCatalog(catalog_fn)) == 0
+
+    @pytest.mark.parametrize("contents", [
+        "{\"version\": 1, \"files\": {",
+        "{\"version\": 1}",
+        "not json",
+    ])
+    def test_corrupt_catalog(self, tmpdir, input_file, contents):
+        catalog_fn = tmpdir.join("catalog.json")
+        catalog_fn.write(contents)
+        catalog = FileCatalog(str(catalog_fn))
+        assert len(catalog) == 0
+        assert catalog.get(str(input_file)) is None
+        # a corrupt catalog is replaced
+        catalog.update(str(input_file), file_type="file_type_a")
+        catalog.save()
+        assert FileCatalog(str(catalog_fn)).get(str(input_file))["file_type"] == "file_type_a"
+
+    def test_file_handle(self, tmpdir, input_file):
+        catalog = FileCatalog(str(tmpdir.join("catalog.json")))
+        assert catalog.get_file_handle(str(input_file), _FakeFileHandle) is None
+        catalog.update(str(input_file), file_type="file_type_a", instrument="viirs", satellite="npp",
+                       begin_time=datetime(2021, 1, 1, 12, 0, 0), end_time=datetime(2021, 1, 1, 12, 1, 30))
+
+        file_handle = catalog.get_file_handle(str(input_file), _FakeFileHandle)
+        assert isinstance(file_handle, CatalogFileHandle)
+        assert file_handle.filename == "input_file.h5"
+        assert file_handle.file_type == "file_type_a"
+        assert file_handle.instrument == "viirs"
+        assert file_handle.satellite == "npp"
+        assert file_handle.begin_time == datetime(2021, 1, 1, 12, 0, 0)
+        assert file_handle.end_time == datetime(2021, 1, 1, 12, 1, 30)
+        assert not file_handle.is_open
+
+        # reading data opens the file
+        assert file_handle["data"] == "value of data"
+        assert file_handle.is_open
+        assert isinstance(file_handle.file_handle, _FakeFileHandle)
+
+
+def main():
+    return pytest.main([os.path.realpath(__file__)])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
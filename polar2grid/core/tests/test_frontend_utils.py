@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Tests for the frontend product dependency helpers.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+
+"""
+__docformat__ = "restructuredtext en"
+
+import os
+import sys
+import threading
+import time
+
+import numpy
+import pytest
+
+from polar2grid.core.frontend_utils import (ProductDict, TASK_RAW, TASK_SECONDARY, FILE_ACCESS_LOCK, file_access,
+                                            run_dependent_tasks, BaseFileReader, BaseMultiFileReader)
+
+
+@pytest.fixture
+def products():
+    products = ProductDict()
+    products.add_product("lon", "nav", "longitude", "geo", "lon_var")
+    products.add_product("lat", "nav", "latitude", "geo", "lat_var")
+    products.add_product("band1", "nav", "reflectance", "band1_file", "band1_var")
+    products.add_product("band2", "nav", "btemp", "band2_file", "band2_var")
+    # raw product that needs extra masking
+    products.add_product("band3", "nav", "btemp", "band3_file", "band3_var", dependencies=(None, "band1"))
+    products.add_product("ratio", "nav", "ratio", dependencies=("band1", "band3"))
+    products.add_product("fog", "nav", "btemp", dependencies=("band2", "band3"))
+    products.add_product("sza", "nav", "solar_zenith_angle", "geo", "sza_var")
+    return products
+
+
+class TestProductTaskDependencies(object):
+    def test_dependencies(self, products):
+        products_needed = products.dependency_ordered_products(["ratio", "fog"])
+        task_deps = products.product_task_dependencies(products_needed)
+        assert task_deps[(TASK_RAW, "band1")] == []
+        assert task_deps[(TASK_RAW, "band3")] == []
+        assert task_deps[(TASK_SECONDARY, "band3")] == [(TASK_RAW, "band3"), (TASK_RAW, "band1")]
+        # secondary products depend on the final version of raw products needing extra processing
+        assert sorted(task_deps[(TASK_SECONDARY, "ratio")]) == [(TASK_RAW, "band1"), (TASK_SECONDARY, "band3")]
+        assert sorted(task_deps[(TASK_SECONDARY, "fog")]) == [(TASK_RAW, "band2"), (TASK_SECONDARY, "band3")]
+        # geolocation is created before any of these tasks
+        assert not any(product_name in ("lon", "lat") for _, product_name in task_deps)
+
+    def test_serial_order(self, products):
+        """Every task comes after the tasks it depends on so they can be run in order."""
+        products_needed = products.dependency_ordered_products(["ratio", "fog"])
+        task_deps = products.product_task_dependencies(products_needed)
+        tasks = list(task_deps)
+        for task, deps in task_deps.items():
+            assert all(tasks.index(dep) < tasks.index(task) for dep in deps)
+
+
+class TestRunDependentTasks(object):
+    TASKS = {
+        "a": [],
+        "b": [],
+        "c": ["a"],
+        "d": ["b", "c"],
+        "e": [],
+    }
+
+    @pytest.mark.parametrize("num_workers", [1, 3])
+    def test_order(self, num_workers):
+        started = []
+        finished = []
+        lock = threading.Lock()
+
+        def _task_func(task):
+            with lock:
+                started.append(task)
+                assert all(dep in finished for dep in self.TASKS[task])
+            # give other tasks a chance to run at the same time
+            time.sleep(0.01)
+            with lock:
+                finished.append(task)
+            return task * 2
+
+        results = dict((task, future.result()) for task, future in
+                       run_dependent_tasks(self.TASKS, _task_func, num_workers=num_workers))
+        assert results == dict((task, task * 2) for task in self.TASKS)
+        assert sorted(started) == sorted(self.TASKS)
+        if num_workers == 1:
+            assert started == list(self.TASKS)
+
+    @pytest.mark.parametrize("num_workers", [1, 3])
+    def test_error_propagation(self, num_workers):
+        def _task_func(task):
+            if task == "c":
+                raise ValueError("Bad task")
+            return task
+
+        results = {}
+        errors = {}
+        for task, future in run_dependent_tasks(self.TASKS, _task_func, num_workers=num_workers):
+            try:
+                results[task] = future.result()
+            except ValueError as e:
+                errors[task] = e
+        assert list(errors.keys()) == ["c"]
+        # dependent tasks are still run, it is up to the caller to decide what to do
+        assert sorted(results.keys()) == ["a", "b", "d", "e"]
+
+    @pytest.mark.parametrize("num_workers", [1, 3])
+    def test_stop_iterating(self, num_workers):
+        """Tasks that haven't started aren't run if the caller stops early (ex. exit on error)."""
+        ran = []
+
+        def _task_func(task):
+            ran.append(task)
+            return task
+
+        for task, future in run_dependent_tasks(self.TASKS, _task_func, num_workers=num_workers):
+            if task == "c":
+                break
+        assert "d" not in ran
+
+    @pytest.mark.parametrize("num_workers", [1, 2])
+    def test_error_stops_unstarted_tasks(self, num_workers):
+        """A caller re-raising a task's error (ex. exit on error) stops tasks that haven't started."""
+        tasks = dict((task, []) for task in "abcdef")
+        ran = []
+        lock = threading.Lock()
+
+        def _task_func(task):
+            with lock:
+                ran.append(task)
+            if task == "a":
+                raise ValueError("Bad task")
+            time.sleep(0.05)
+            return task
+
+        with pytest.raises(ValueError):
+            for task, future in run_dependent_tasks(tasks, _task_func, num_workers=num_workers):
+                future.result()
+        # only the tasks running when "a" failed were run
+        assert len(ran) <= num_workers
+        assert "a" in ran
+
+    def test_worker_limit(self):
+        tasks = dict((task, []) for task in "abcdef")
+        active = []
+        max_active = []
+        lock = threading.Lock()
+
+        def _task_func(task):
+            with lock:
+                active.append(task)
+                max_active.append(len(active))
+            time.sleep(0.01)
+            with lock:
+                active.remove(task)
+            return task
+
+        finished = [task for task, _ in run_dependent_tasks(tasks, _task_func, num_workers=2)]
+        assert sorted(finished) == sorted(tasks)
+        assert max(max_active) <= 2
+
+    @pytest.mark.parametrize("num_workers", [1, 3])
+    def test_cycle(self, num_workers):
+        tasks = {
+            "a": [],
+            "b": ["c"],
+            "c": ["b"],
+        }
+        finished = []
+        with pytest.raises(RuntimeError):
+            for task, future in run_dependent_tasks(tasks, lambda task: task, num_workers=num_workers):
+                finished.append(task)
+        assert finished == ["a"]
+
+
+class TestFileAccess(object):
+    def test_one_reader_at_a_time(self):
+        active = []
+        max_active = []
+
+        class _FakeReader(object):
+            @file_access
+            def read(self):
+                active.append(1)
+                max_active.append(len(active))
+                time.sleep(0.01)
+                active.pop()
+                # nested file access from the same thread doesn't deadlock
+                return self.read_attr()
+
+            @file_access
+            def read_attr(self):
+                return FILE_ACCESS_LOCK
+
+        reader = _FakeReader()
+        results = [future.result() for _, future in
+                   run_dependent_tasks(dict((idx, []) for idx in range(4)), lambda task: reader.read(), num_workers=4)]
+        assert all(result is FILE_ACCESS_LOCK for result in results)
+        assert max(max_active) == 1
+
+
+class _FakeFileHandle(object):
+    def __init__(self, filename, begin_time, data):
+        self.filename = filename
+        self.filepath = os.path.join("/tmp", filename)
+        self.begin_time = begin_time
+        self.data = data
+
+    def __getitem__(self, item):
+        return self.data[item]
+
+
+class _FakeFileReader(BaseFileReader):
+    def __init__(self, file_handle, file_type_info):
+        super(_FakeFileReader, self).__init__(file_handle, file_type_info)
+        self.begin_time = file_handle.begin_time
+        self.instrument = "viirs"
+        self.satellite = "npp"
+        self.reads = 0
+
+    def get_swath_data(self, item):
+        self.reads += 1
+        return self[item] * 2
+
+
+@pytest.fixture
+def multi_file_reader():
+    file_reader = BaseMultiFileReader({"data": "data_var"}, _FakeFileReader)
+    # out of order on purpose
+    for idx in (1, 0, 2):
+        # files can have a different number of rows
+        data = numpy.arange(idx * 100, idx * 100 + (2 + idx) * 4, dtype=numpy.int16).reshape((2 + idx, 4))
+        file_reader.add_file(_FakeFileHandle("file_%d.h5" % (idx,), idx, {"data_var": data}))
+    file_reader.finalize_files()
+    return file_reader
+
+
+class TestMultiFileSwathData(object):
+    def _expected(self, file_reader):
+        return numpy.concatenate([fr.file_handle["data_var"] * 2 for fr in file_reader.file_readers])
+
+    def test_in_memory(self, multi_file_reader):
+        assert multi_file_reader.get_swath_shape("data") == (9, 4)
+        data = multi_file_reader.get_swath_data("data")
+        assert not isinstance(data, numpy.memmap)
+        assert data.dtype == numpy.int16
+        numpy.testing.assert_array_equal(data, self._expected(multi_file_reader))
+        assert all(fr.reads == 1 for fr in multi_file_reader.file_readers)
+
+    def test_memmap(self, tmpdir, multi_file_reader):
+        filename = str(tmpdir.join("data.dat"))
+        data = multi_file_reader.get_swath_data("data", filename=filename, dtype=numpy.float32)
+        assert isinstance(data, numpy.memmap)
+        assert data.dtype == numpy.float32
+        data.flush()
+        del data
+        # same format as write_var_to_flat_binary
+        fbf_filename = str(tmpdir.join("data_fbf.dat"))
+        shape = multi_file_reader.write_var_to_flat_binary("data", fbf_filename)
+        assert shape == (9, 4)
+        with open(filename, "rb") as data_file, open(fbf_filename, "rb") as fbf_file:
+            assert data_file.read() == fbf_file.read()
+
+    def test_wrong_shape(self, tmpdir, multi_file_reader):
+        """Files returning a different shape than they said they would are an error."""
+        multi_file_reader.file_readers[1].get_swath_data = lambda item: numpy.zeros((5, 4), dtype=numpy.int16)
+        filename = str(tmpdir.join("data.dat"))
+        with pytest.raises(ValueError):
+            multi_file_reader.get_swath_data("data", filename=filename)
+        assert not os.path.exists(filename)
+
+    def test_empty(self):
+        with pytest.raises(RuntimeError):
+            BaseMultiFileReader({"data": "data_var"}, _FakeFileReader).get_swath_data("data")
+
+
+def main():
+    return pytest.main([os.path.realpath(__file__)])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
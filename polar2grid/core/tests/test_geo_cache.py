@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Tests for the geolocation cache.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+
+"""
+__docformat__ = "restructuredtext en"
+
+import os
+import sys
+
+import numpy
+import pytest
+
+from polar2grid.core.geo_cache import GeolocationCache
+
+
+class TestGeolocationCache(object):
+    def test_put_get(self, tmpdir):
+        geo_fn = tmpdir.join("geo.hdf")
+        geo_fn.write_binary(b"fake geolocation file contents")
+        geo_cache = GeolocationCache(str(tmpdir.join("cache")))
+        key = geo_cache.key(str(geo_fn), "modis_250m", res_factor=4, fill=-999.0)
+        assert geo_cache.get(key) is None
+
+        lons = numpy.linspace(-180., 180., 200, dtype=numpy.float32).reshape((10, 20))
+        lats = numpy.linspace(-90., 90., 200, dtype=numpy.float32).reshape((10, 20))
+        cached_lons, cached_lats = geo_cache.put(key, lons, lats)
+        assert isinstance(cached_lons, numpy.memmap)
+        numpy.testing.assert_array_equal(cached_lons, lons)
+        numpy.testing.assert_array_equal(cached_lats, lats)
+
+        # a new cache object (next run) with the same file contents at a different path
+        copy_fn = tmpdir.join("geo_copy.hdf")
+        geo_fn.copy(copy_fn)
+        geo_cache2 = GeolocationCache(str(tmpdir.join("cache")))
+        key2 = geo_cache2.key(str(copy_fn), "modis_250m", res_factor=4, fill=-999.0)
+        assert key2 == key
+        cached_lons, cached_lats = geo_cache2.get(key2)
+        numpy.testing.assert_array_equal(cached_lats, lats)
+        assert geo_cache2.hits == 1
+        assert geo_cache.misses == 1
+
+    def test_key_parameters(self, tmpdir):
+        geo_fn = tmpdir.join("geo.hdf")
+        geo_fn.write_binary(b"fake geolocation file contents")
+        geo_cache = GeolocationCache(str(tmpdir.join("cache")))
+        key_250 = geo_cache.key(str(geo_fn), "modis_250m", res_factor=4, fill=-999.0)
+        assert key_250 != geo_cache.key(str(geo_fn), "modis_500m", res_factor=2, fill=-999.0)
+        assert key_250 != geo_cache.key(str(geo_fn), "modis_250m", res_factor=4, fill=0.0)
+        geo_fn.write_binary(b"different geolocation file contents")
+        assert key_250 != geo_cache.key(str(geo_fn), "modis_250m", res_factor=4, fill=-999.0)
+
+
+def main():
+    return pytest.main([os.path.realpath(__file__)])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
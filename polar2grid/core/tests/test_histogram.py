@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Tests for the histogram equalization functions.
+
+The swath scale benchmark is skipped unless the ``P2G_RUN_BENCHMARKS``
+environment variable is set.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+
+"""
+__docformat__ = "restructuredtext en"
+
+import os
+import sys
+import time
+import logging
+
+import numpy
+import pytest
+
+from polar2grid.core import histogram
+
+LOG = logging.getLogger(__name__)
+
+
+def _fake_dnb_data(shape, dtype=numpy.float32, seed=42):
+    rs = numpy.random.RandomState(seed)
+    data = rs.lognormal(-6.0, 1.5, size=shape).astype(dtype)
+    # a bright region (city lights, fires) so tiles have different distributions
+    data[:shape[0] // 4, :shape[1] // 5] *= 20.0
+    valid_mask = rs.rand(*shape) > 0.05
+    return data, valid_mask, rs
+
+
+def _local_histogram_equalization_tile_loops(data, mask_to_equalize, valid_data_mask=None, number_of_bins=1000,
+                                             std_mult_cutoff=3.0, do_zerotoone_normalization=True,
+                                             local_radius_px=300, clip_limit=60.0, slope_limit=3.0,
+                                             do_log_scale=True, log_offset=0.00001):
+    """Original tile by tile implementation of `local_histogram_equalization` used as a reference."""
+    out = numpy.zeros_like(data)
+    if valid_data_mask is None:
+        valid_data_mask = mask_to_equalize
+
+    total_rows, total_cols = data.shape
+    tile_size = int((local_radius_px * 2.0) + 1.0)
+    row_tiles = -(-total_rows // tile_size)
+    col_tiles = -(-total_cols // tile_size)
+
+    # histogram equalization of every tile
+    all_cumulative_dist_functions = [[None] * col_tiles for _ in range(row_tiles)]
+    all_bin_information = [[None] * col_tiles for _ in range(row_tiles)]
+    for num_row_tile in range(row_tiles):
+        for num_col_tile in range(col_tiles):
+            tile = (slice(num_row_tile * tile_size, (num_row_tile + 1) * tile_size),
+                    slice(num_col_tile * tile_size, (num_col_tile + 1) * tile_size))
+            mask_valid_data_in_tile = valid_data_mask[tile]
+            if not mask_valid_data_in_tile.any():
+                continue
+            temp_valid_data = data[tile][mask_valid_data_in_tile]
+            temp_valid_data = temp_valid_data[temp_valid_data >= 0]
+            if std_mult_cutoff is not None:
+                avg = numpy.mean(temp_valid_data)
+                std = numpy.std(temp_valid_data)
+                concervative_mask = (temp_valid_data < (avg + std * std_mult_cutoff)) & \
+                    (temp_valid_data > (avg - std * std_mult_cutoff))
+                temp_valid_data = temp_valid_data[concervative_mask]
+            if do_log_scale:
+                temp_valid_data = numpy.log(temp_valid_data + log_offset)
+            if temp_valid_data.size > 0:
+                cumulative_dist_function, temp_bins = histogram._histogram_equalization_helper(
+                    temp_valid_data, number_of_bins, clip_limit=clip_limit, slope_limit=slope_limit)
+                all_cumulative_dist_functions[num_row_tile][num_col_tile] = cumulative_dist_function
+                all_bin_information[num_row_tile][num_col_tile] = temp_bins
+
+    # blend the equalizations of the 3x3 neighboring tiles for every pixel of each tile
+    tile_weights = histogram._calculate_weights(tile_size)
+    for num_row_tile in range(row_tiles):
+        for num_col_tile in range(col_tiles):
+            tile = (slice(num_row_tile * tile_size, (num_row_tile + 1) * tile_size),
+                    slice(num_col_tile * tile_size, (num_col_tile + 1) * tile_size))
+            temp_all_data = data[tile].copy()
+            temp_mask_to_equalize = mask_to_equalize[tile]
+            temp_all_valid_data_mask = valid_data_mask[tile]
+            if not temp_mask_to_equalize.any():
+                continue
+            if do_log_scale:
+                temp_all_data[temp_all_valid_data_mask] = numpy.log(
+                    temp_all_data[temp_all_valid_data_mask] + log_offset)
+            temp_data_to_equalize = temp_all_data[temp_mask_to_equalize]
+            temp_all_valid_data = temp_all_data[temp_all_valid_data_mask]
+            temp_sum = numpy.zeros_like(temp_data_to_equalize)
+            # weight of the tiles that fall off the edge of the image
+            unused_weight = numpy.zeros(temp_data_to_equalize.shape, dtype=tile_weights.dtype)
+            for weight_row in range(3):
+                for weight_col in range(3):
+                    calculated_row = num_row_tile - 1 + weight_row
+                    calculated_col = num_col_tile - 1 + weight_col
+                    tmp_tile_weights = tile_weights[weight_row, weight_col][numpy.where(temp_mask_to_equalize)]
+                    if 0 <= calculated_row < row_tiles and 0 <= calculated_col < col_tiles and \
+                            all_bin_information[calculated_row][calculated_col] is not None:
+                        temp_bins = all_bin_information[calculated_row][calculated_col]
+                        cumulative_dist_function = all_cumulative_dist_functions[calculated_row][calculated_col]
+                        temp_equalized_data = numpy.interp(temp_all_valid_data, temp_bins[:-1],
+                                                           cumulative_dist_function)
+                        temp_equalized_data = temp_equalized_data[
+                            numpy.where(temp_mask_to_equalize[temp_all_valid_data_mask])]
+                        temp_sum += (temp_equalized_data * tmp_tile_weights)
+                    else:
+                        unused_weight -= tmp_tile_weights
+            if unused_weight.any():
+                temp_sum /= unused_weight + 1
+            out[tile][temp_mask_to_equalize] = temp_sum
+
+    if do_zerotoone_normalization:
+        histogram._linear_normalization_from_0to1(out, mask_to_equalize, number_of_bins)
+    return out
+
+
+class TestHistogramEqualizationChunked(object):
+    @pytest.mark.parametrize("kwargs", [{}, {"clip_limit": 20.0, "slope_limit": 3.0}])
+    def test_matches_histogram_equalization(self, kwargs):
+        data, valid_mask, rs = _fake_dnb_data((500, 300))
+        mask_to_equalize = valid_mask & (rs.rand(*data.shape) > 0.3)
+        expected = histogram.histogram_equalization(data, mask_to_equalize, valid_data_mask=valid_mask, **kwargs)
+        result = histogram.histogram_equalization_chunked(data, mask_to_equalize, valid_data_mask=valid_mask,
+                                                          chunk_rows=77, **kwargs)
+        numpy.testing.assert_allclose(result, expected, rtol=1e-6)
+
+    def test_dask_input(self):
+        import dask.array as da
+        data, valid_mask, _ = _fake_dnb_data((500, 300))
+        expected = histogram.histogram_equalization(data, valid_mask)
+        result = histogram.histogram_equalization_chunked(da.from_array(data, chunks=(100, 150)),
+                                                          da.from_array(valid_mask, chunks=(250, 300)))
+        assert isinstance(result, da.Array)
+        numpy.testing.assert_allclose(result.compute(), expected, rtol=1e-6)
+
+    def test_out_memmap(self, tmpdir):
+        data, valid_mask, _ = _fake_dnb_data((500, 300))
+        expected = histogram.histogram_equalization(data, valid_mask, out=numpy.zeros_like(data))
+        out = numpy.memmap(str(tmpdir.join("out.dat")), mode="w+", dtype=data.dtype, shape=data.shape)
+        result = histogram.histogram_equalization_chunked(data, valid_mask, out=out, chunk_rows=64)
+        assert result is out
+        numpy.testing.assert_allclose(out, expected, rtol=1e-6)
+
+
+class TestLocalHistogramEqualization(object):
+    @pytest.mark.parametrize(("shape", "local_radius_px", "dtype"), [
+        ((300, 450), 20, numpy.float32),
+        ((257, 391), 30, numpy.float64),
+        ((120, 130), 300, numpy.float32),
+    ])
+    def test_matches_tile_loops(self, shape, local_radius_px, dtype):
+        data, valid_mask, rs = _fake_dnb_data(shape, dtype=dtype)
+        mask_to_equalize = valid_mask & (rs.rand(*shape) > 0.3)
+        expected = _local_histogram_equalization_tile_loops(
+            data, mask_to_equalize, valid_data_mask=valid_mask, local_radius_px=local_radius_px)
+        result = histogram.local_histogram_equalization(
+            data, mask_to_equalize, valid_data_mask=valid_mask, local_radius_px=local_radius_px,
+            num_threads=2, rows_per_band=17)
+        numpy.testing.assert_array_equal(result, expected)
+
+    def test_matches_tile_loops_no_log(self):
+        rs = numpy.random.RandomState(0)
+        data = rs.normal(250.0, 20.0, size=(200, 240)).astype(numpy.float32)
+        mask = rs.rand(*data.shape) > 0.1
+        expected = _local_histogram_equalization_tile_loops(data, mask, do_log_scale=False, local_radius_px=25)
+        result = histogram.local_histogram_equalization(data, mask, do_log_scale=False, local_radius_px=25)
+        numpy.testing.assert_array_equal(result, expected)
+
+    @pytest.mark.skipif(not os.environ.get("P2G_RUN_BENCHMARKS"), reason="P2G_RUN_BENCHMARKS not set")
+    def test_benchmark_swath(self):
+        """Compare the tile loop and vectorized implementations on a full DNB swath sized array."""
+        data, valid_mask, _ = _fake_dnb_data((3072, 4064))
+        # weights are cached, don't count creating them against either implementation
+        histogram._calculate_weights(601)
+
+        start = time.time()
+        expected = _local_histogram_equalization_tile_loops(data, valid_mask, local_radius_px=300)
+        loops_time = time.time() - start
+        start = time.time()
+        result = histogram.local_histogram_equalization(data, valid_mask, local_radius_px=300)
+        vectorized_time = time.time() - start
+        print("local_histogram_equalization 3072x4064: tile loops {:0.02f}s, vectorized {:0.02f}s".format(
+            loops_time, vectorized_time))
+        numpy.testing.assert_array_equal(result, expected)
+        assert vectorized_time < loops_time
+
+
+def main():
+    return pytest.main([os.path.realpath(__file__)])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
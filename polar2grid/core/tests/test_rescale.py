@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Tests for the legacy rescaling functions.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+
+"""
+__docformat__ = "restructuredtext en"
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from polar2grid.core import containers
+from polar2grid.core.rescale import Rescaler, DEFAULT_RCONFIG, palettize_lut, _palettize_trollimage
+
+ROWS = 37
+COLS = 25
+
+
+@pytest.fixture(scope="module")
+def rescaler():
+    return Rescaler(DEFAULT_RCONFIG)
+
+
+def _create_product(tmpdir, data, fill_value=np.nan, data_kind="reflectance"):
+    grid_def = containers.GridDefinition(grid_name="test_grid", proj4_definition="+proj=latlong",
+                                         height=data.shape[-2], width=data.shape[-1], cell_height=1.,
+                                         cell_width=1., origin_x=0., origin_y=0.)
+    fn = str(tmpdir.join("grid_test_grid_test.dat"))
+    data.tofile(fn)
+    return containers.GriddedProduct(product_name="test", satellite="npp", instrument="viirs", units="1",
+                                     begin_time=None, end_time=None, data_type=data.dtype, grid_data=fn,
+                                     grid_definition=grid_def, fill_value=fill_value, data_kind=data_kind)
+
+
+def _random_data(low, high, shape=(ROWS, COLS), fill_value=np.nan):
+    rs = np.random.RandomState(0)
+    data = rs.uniform(low, high, size=shape).astype(np.float32)
+    data[rs.uniform(size=shape) < 0.1] = fill_value
+    return data
+
+
+class TestBlockwiseRescale(object):
+    @pytest.mark.parametrize(("method", "low", "high", "options"), [
+        ("linear", -0.1, 1.2, {"min_in": 0., "max_in": 1.}),
+        ("linear", -0.1, 1.2, {"min_in": 0., "max_in": 1., "flip": True, "mask_clip": "min"}),
+        ("linear_brightness_temperature", 180., 330., {"min_in": 190., "max_in": 320., "units": "celsius"}),
+        ("sqrt", -0.1, 1.2, {"max_in": 1.}),
+        ("brightness_temperature", 180., 330., {"threshold": 242., "min_in": 163., "max_in": 330.}),
+        ("temperature_difference", -15., 15., {"min_in": -10., "max_in": 10.}),
+        ("lst", 220., 350., {"min_in": 233.2, "max_in": 322.0}),
+        ("ctt", 180., 320., {"min_in": 190., "max_in": 310.}),
+        ("ndvi", -1.2, 1.2, {}),
+        ("raw", 0., 300., {}),
+    ])
+    @pytest.mark.parametrize("inc_by_one", [False, True])
+    def test_matches_full_rescale(self, tmpdir, monkeypatch, rescaler, method, low, high, options, inc_by_one):
+        data = _random_data(low, high)
+        product = _create_product(tmpdir, data)
+        rescale_options = dict(options, method=method, inc_by_one=inc_by_one, min_out=0.,
+                               max_out=254. if inc_by_one else 255., fill_out=0., units=options.get("units", "1"))
+        assert rescaler.can_rescale_blockwise(method, rescale_options, data.dtype)
+
+        expected_options = rescale_options.copy()
+        expected_options.pop("method")
+        expected_options.pop("inc_by_one")
+        mask_clip = expected_options.pop("mask_clip", None)
+        expected_options["attrs"] = product
+        expected = rescaler._rescale_data(method, data.copy(), ~np.isnan(data), expected_options, 0.,
+                                          mask_clip=mask_clip, inc_by_one=inc_by_one)
+
+        monkeypatch.setattr(rescaler, "rows_per_block", 8)
+        result = rescaler.rescale_product(product, np.uint8, fill_value=0., rescale_options=rescale_options)
+        assert result.dtype == np.float32
+        np.testing.assert_array_equal(result, expected)
+
+    def test_small_blocks_and_non_nan_fill(self, rescaler):
+        data = _random_data(-0.1, 1.2, fill_value=-999.)
+        options = {"min_in": 0., "max_in": 1., "min_out": 0., "max_out": 255., "fill_out": 0.}
+        expected = rescaler._rescale_data("linear", data.copy(), data != -999., options.copy(), 0.)
+        result = np.empty_like(data)
+        rescaler._rescale_data_blockwise("linear", data, -999., result, options, 0., rows_per_block=5)
+        np.testing.assert_array_equal(result, expected)
+
+    def test_data_limits_not_blockwise(self, rescaler):
+        assert not rescaler.can_rescale_blockwise("linear", {"min_in": None, "max_in": 1.}, np.float32)
+        assert not rescaler.can_rescale_blockwise("linear", {"min_in": 0., "max_in": 1.}, np.uint8)
+        assert not rescaler.can_rescale_blockwise("palettize", {"min_in": 0., "max_in": 1.}, np.float32)
+
+
+class TestLazyRescale(object):
+    @pytest.mark.parametrize(("method", "options"), [
+        ("sqrt", {"max_in": 1.}),
+        ("linear", {"min_in": 0., "max_in": 1., "mask_clip": "both"}),
+        # needs the limits of all of the data so it isn't done lazily
+        ("linear", {}),
+    ])
+    @pytest.mark.parametrize("shape", [(ROWS, COLS), (3, ROWS, COLS)])
+    def test_matches_rescale_product(self, tmpdir, rescaler, method, options, shape):
+        da = pytest.importorskip("dask.array")
+        product = _create_product(tmpdir, _random_data(-0.1, 1.2, shape=shape))
+        rescale_options = dict(options, method=method, inc_by_one=True, min_out=0., max_out=254., fill_out=0.)
+        expected = rescaler.rescale_product(product, np.uint8, fill_value=0., rescale_options=rescale_options.copy())
+        result = rescaler.rescale_product(product, np.uint8, fill_value=0., rescale_options=rescale_options.copy(),
+                                          lazy=True, chunks=(1,) * (len(shape) - 2) + (10, 10))
+        assert isinstance(result, da.Array)
+        assert result.chunks[-1] == (10, 10, 5)
+        np.testing.assert_array_equal(result.compute(), expected)
+
+
+class TestRescaleConfig(object):
+    def test_combined_matcher(self, rescaler):
+        product_names = set()
+        for section in rescaler.config_parser.sections():
+            if rescaler.config_parser.has_option(section, "product_name"):
+                product_names.add(rescaler.config_parser.get(section, "product_name"))
+        id_keys = []
+        for product_name in sorted(pn for pn in product_names if pn) + ["unknown"]:
+            for data_type in ("uint1", "real4"):
+                for inc_by_one in (True, False):
+                    id_keys.append(":".join([product_name, data_type, "brightness_temperature", "npp", "viirs",
+                                             "wgs84_fit", str(inc_by_one), "kelvin", "None"]))
+
+        assert rescaler._id_matcher is not None
+        combined = [rescaler._match_config_section(id_key) for id_key in id_keys]
+        id_matcher = rescaler._id_matcher
+        rescaler._id_matcher = None
+        try:
+            separate = [rescaler._match_config_section(id_key) for id_key in id_keys]
+        finally:
+            rescaler._id_matcher = id_matcher
+        assert combined == separate
+        assert any(config_key is not None for config_key in combined)
+
+    def test_rescale_options_cached(self, tmpdir, rescaler):
+        product = _create_product(tmpdir, _random_data(180., 330.), data_kind="brightness_temperature")
+        product["product_name"] = "i05"
+        options1 = rescaler.get_rescale_options(product, np.uint8, inc_by_one=True, fill_value=0)
+        options1.pop("method")
+        options2 = rescaler.get_rescale_options(product, np.uint8, inc_by_one=True, fill_value=0)
+        assert "method" in options2
+        assert options2 == rescaler.get_rescale_options(product, np.uint8, inc_by_one=True, fill_value=0)
+        assert options2["max_out"] == 254
+        options3 = rescaler.get_rescale_options(product, np.uint8, inc_by_one=False, fill_value=0)
+        assert options3["max_out"] == 255
+
+
+class TestMultiBandRescale(object):
+    @pytest.mark.parametrize("options", [
+        {"min_in": 0., "max_in": 1.},
+        # not blockwise, each band gets its own data limits
+        {},
+    ])
+    @pytest.mark.parametrize("num_workers", [1, 4])
+    def test_bands_match_single_band(self, tmpdir, monkeypatch, rescaler, options, num_workers):
+        data = _random_data(-0.1, 1.2, shape=(4, ROWS, COLS))
+        data[2] *= 0.5
+        product = _create_product(tmpdir, data)
+        rescale_options = dict(options, method="linear", inc_by_one=True, min_out=0., max_out=254., fill_out=0.)
+        monkeypatch.setattr(rescaler, "num_workers", num_workers)
+        result = rescaler.rescale_product(product, np.uint8, fill_value=0., rescale_options=rescale_options.copy())
+        assert result.shape == data.shape
+        for band_idx in range(data.shape[0]):
+            band_product = _create_product(tmpdir.mkdir("band{:d}".format(band_idx)), data[band_idx])
+            expected = rescaler.rescale_product(band_product, np.uint8, fill_value=0.,
+                                                rescale_options=rescale_options.copy())
+            np.testing.assert_array_equal(result[band_idx], expected)
+
+
+class TestPalettizeLUT(object):
+    @staticmethod
+    def _colormap():
+        from trollimage.colormap import Colormap
+        rs = np.random.RandomState(1)
+        return Colormap(*[(value, tuple(rs.uniform(size=3))) for value in np.arange(12.)])
+
+    @pytest.mark.parametrize("dtype", [np.float32, np.int16])
+    @pytest.mark.parametrize(("alpha", "colorize"), [(True, False), (True, True), (False, False)])
+    def test_matches_trollimage(self, dtype, alpha, colorize):
+        rs = np.random.RandomState(0)
+        data = rs.randint(-2, 15, size=(ROWS, COLS)).astype(dtype)
+        good_data_mask = rs.uniform(size=data.shape) > 0.1
+        if np.issubdtype(dtype, np.floating):
+            data[~good_data_mask] = np.nan
+        kwargs = dict(min_out=0, max_out=255, min_in=0, max_in=11, colormap=self._colormap(), alpha=alpha,
+                      colorize=colorize, good_data_mask=good_data_mask)
+        expected = _palettize_trollimage(data.copy(), chunks=4096, **kwargs)
+        result = palettize_lut(data.copy(), rows_per_block=10, **kwargs)
+        assert result.dtype == expected.dtype
+        np.testing.assert_array_equal(result, expected)
+
+    @pytest.mark.parametrize(("data", "lut", "uses_lut"), [
+        (_random_data(0., 11.), False, False),
+        (np.floor(_random_data(0., 11.)), False, False),
+        (np.floor(_random_data(0., 11.)), True, True),
+        (np.arange(ROWS * COLS, dtype=np.uint8).reshape((ROWS, COLS)), False, True),
+    ])
+    def test_palettize(self, monkeypatch, data, lut, uses_lut):
+        import polar2grid.core.rescale as rescale
+        lut_calls = []
+        monkeypatch.setattr(rescale, "palettize_lut",
+                            lambda *args, **kwargs: lut_calls.append(args) or palettize_lut(*args, **kwargs))
+        # avoid depending on satpy's default chunk size
+        monkeypatch.setattr(rescale, "_palettize_trollimage",
+                            lambda *args, **kwargs: _palettize_trollimage(*args, **dict({"chunks": 4096}, **kwargs)))
+        kwargs = dict(min_out=0, max_out=255, min_in=0, max_in=11, colormap=self._colormap(), colorize=True,
+                      good_data_mask=~np.isnan(data))
+        expected = _palettize_trollimage(data.copy(), chunks=4096, **kwargs)
+        result = rescale.palettize(data.copy(), lut=lut, **kwargs)
+        assert bool(lut_calls) == uses_lut
+        np.testing.assert_array_equal(result, expected)
+
+    def test_too_many_values(self):
+        data = np.arange(ROWS * COLS, dtype=np.int32).reshape((ROWS, COLS))
+        result = palettize_lut(data, 0, 255, max_in=1000, colormap=self._colormap(),
+                               good_data_mask=np.ones(data.shape, dtype=bool), max_lut_size=100)
+        assert result is None
+
+    @pytest.mark.skipif(not os.environ.get("P2G_RUN_BENCHMARKS"), reason="P2G_RUN_BENCHMARKS not set")
+    def test_benchmark(self):
+        import time
+        rs = np.random.RandomState(0)
+        data = rs.randint(0, 12, size=(4000, 4000)).astype(np.float32)
+        good_data_mask = rs.uniform(size=data.shape) > 0.1
+        data[~good_data_mask] = np.nan
+        kwargs = dict(min_out=0, max_out=255, min_in=0, max_in=11, colormap=self._colormap(), colorize=True,
+                      good_data_mask=good_data_mask)
+        start = time.time()
+        _palettize_trollimage(data, chunks=4096, **kwargs)
+        trollimage_time = time.time() - start
+        start = time.time()
+        palettize_lut(data, **kwargs)
+        lut_time = time.time() - start
+        print("trollimage: {:0.3f}s, lookup table: {:0.3f}s".format(trollimage_time, lut_time))
+
+
+def main():
+    return pytest.main([os.path.realpath(__file__)])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Tests for the per-product statistics accumulator.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+
+"""
+__docformat__ = "restructuredtext en"
+
+
+import os
+import sys
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from polar2grid.core.statistics import StatisticsAccumulator, get_statistics
+
+
+def _random_data(shape=(40, 30)):
+    rs = np.random.RandomState(0)
+    data = rs.uniform(-5., 5., size=shape).astype(np.float32)
+    data[rs.uniform(size=shape) < 0.2] = np.nan
+    return data
+
+
+class TestStatisticsAccumulator(object):
+    def test_disabled(self):
+        accumulator = StatisticsAccumulator()
+        assert accumulator.start("rescale", "test", "test_grid") is None
+        assert accumulator.finish(None) is None
+        assert len(accumulator) == 0
+
+    def test_blocks_match_full_array(self):
+        data = _random_data()
+        valid_mask = ~np.isnan(data)
+        stats = StatisticsAccumulator(enabled=True).start("rescale", "test", "test_grid")
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda start: stats.update(data[start:start + 7], valid_mask[start:start + 7],
+                                                         offset=1), range(0, data.shape[0], 7)))
+        assert stats.min == pytest.approx(float(np.nanmin(data)) + 1)
+        assert stats.max == pytest.approx(float(np.nanmax(data)) + 1)
+        assert stats.valid_count == np.count_nonzero(valid_mask)
+        assert stats.fill_count == data.size - stats.valid_count
+
+    def test_all_fill(self):
+        stats = StatisticsAccumulator(enabled=True).start("remap", "test")
+        stats.update(np.zeros((5, 5)), np.zeros((5, 5), dtype=bool))
+        assert stats.min is None and stats.max is None
+        assert stats.fill_count == 25
+        assert stats.valid_percent == 0.
+
+    def test_write(self, tmpdir):
+        accumulator = StatisticsAccumulator(enabled=True)
+        accumulator.start("remap", "test", "test_grid").add(75, 25)
+        accumulator.start("rescale", "test", "test_grid").add(70, 30, 1., 255.)
+        # starting the same product and stage again replaces the previous statistics
+        accumulator.start("rescale", "test", "test_grid").add(70, 30, 2., 254.)
+        fn = accumulator.write(str(tmpdir.join("stats.json")))
+        with open(fn) as stats_file:
+            result = json.load(stats_file)
+        assert result["test_grid"]["test"]["remap"]["valid_percent"] == 75.
+        assert result["test_grid"]["test"]["remap"]["min"] is None
+        assert result["test_grid"]["test"]["rescale"]["min"] == 2.
+        assert result["test_grid"]["test"]["rescale"]["fill_count"] == 30
+
+    @pytest.mark.parametrize("options", [
+        # block-wise
+        {"min_in": -4., "max_in": 4.},
+        # needs the limits of all of the data first
+        {},
+    ])
+    def test_rescale_statistics(self, tmpdir, monkeypatch, options):
+        from polar2grid.core.rescale import Rescaler, DEFAULT_RCONFIG
+        from polar2grid.core.tests.test_rescale import _create_product
+        monkeypatch.setattr(get_statistics(), "enabled", True)
+        data = _random_data()
+        product = _create_product(tmpdir, data)
+        rescale_options = dict(options, method="linear", inc_by_one=True, min_out=0., max_out=254., fill_out=0.)
+        result = Rescaler(DEFAULT_RCONFIG).rescale_product(product, np.uint8, fill_value=0.,
+                                                           rescale_options=rescale_options)
+        stats = get_statistics().get("rescale", "test", "test_grid")
+        valid_mask = result != 0
+        assert stats.valid_count == np.count_nonzero(valid_mask)
+        assert stats.fill_count == result.size - stats.valid_count
+        assert stats.min == pytest.approx(float(result[valid_mask].min()))
+        assert stats.max == pytest.approx(float(result[valid_mask].max()))
+
+    def test_rescale_without_statistics(self, tmpdir):
+        from polar2grid.core.rescale import Rescaler, DEFAULT_RCONFIG
+        from polar2grid.core.tests.test_rescale import _create_product
+        get_statistics().clear()
+        product = _create_product(tmpdir, _random_data())
+        rescale_options = dict(method="linear", inc_by_one=True, min_out=0., max_out=254., fill_out=0.)
+        Rescaler(DEFAULT_RCONFIG).rescale_product(product, np.uint8, fill_value=0., rescale_options=rescale_options)
+        assert get_statistics().get("rescale", "test", "test_grid") is None
+
+
+def main():
+    return pytest.main([os.path.realpath(__file__)])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
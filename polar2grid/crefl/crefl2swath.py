@@ -165,6 +165,7 @@ import polar2grid.viirs.io as viirs_io
 import polar2grid.viirs.swath as viirs_module
 from polar2grid.core import containers, roles
 from polar2grid.core.frontend_utils import ProductDict, GeoPairDict
+from polar2grid.crefl.crefl_engine import correct_reflectance, load_average_elevation, terrain_height
 from polar2grid.readers import normalize_satellite_name
 
 LOG = logging.getLogger(__name__)
@@ -393,6 +394,60 @@ VIIRS_FALSE_COLOR_PRODUCTS = [PRODUCT_VCR07, PRODUCT_VCR02, PRODUCT_VCR01, PRODU
 MODIS_FALSE_COLOR_PRODUCTS = [PRODUCT_MCR07_500M, PRODUCT_MCR02_500M, PRODUCT_MCR01_500M, PRODUCT_MCR02_250M]
 FALSE_COLOR_PRODUCTS = VIIRS_FALSE_COLOR_PRODUCTS + MODIS_FALSE_COLOR_PRODUCTS
 
+# CREFL product -> (crefl band number, VIIRS SDR product, VIIRS SDR file type) for in-process CREFL
+VIIRS_CREFL_SOURCES = {
+    PRODUCT_VCR01: (1, viirs_module.PRODUCT_M05, viirs_guidebook.FILE_TYPE_M05),
+    PRODUCT_VCR02: (2, viirs_module.PRODUCT_M07, viirs_guidebook.FILE_TYPE_M07),
+    PRODUCT_VCR03: (3, viirs_module.PRODUCT_M03, viirs_guidebook.FILE_TYPE_M03),
+    PRODUCT_VCR04: (4, viirs_module.PRODUCT_M04, viirs_guidebook.FILE_TYPE_M04),
+    PRODUCT_VCR05: (5, viirs_module.PRODUCT_M08, viirs_guidebook.FILE_TYPE_M08),
+    PRODUCT_VCR06: (6, viirs_module.PRODUCT_M10, viirs_guidebook.FILE_TYPE_M10),
+    PRODUCT_VCR07: (7, viirs_module.PRODUCT_M11, viirs_guidebook.FILE_TYPE_M11),
+    PRODUCT_VCR08: (8, viirs_module.PRODUCT_I01, viirs_guidebook.FILE_TYPE_I01),
+    PRODUCT_VCR09: (9, viirs_module.PRODUCT_I02, viirs_guidebook.FILE_TYPE_I02),
+    PRODUCT_VCR10: (10, viirs_module.PRODUCT_I03, viirs_guidebook.FILE_TYPE_I03),
+}
+# geo pair -> (sensor azimuth, sensor zenith, solar azimuth, solar zenith) VIIRS SDR products
+VIIRS_CREFL_ANGLES = {
+    PAIR_MNAV: (viirs_module.PRODUCT_M_SAT_AA, viirs_module.PRODUCT_M_SAT_ZA,
+                viirs_module.PRODUCT_M_SAA, viirs_module.PRODUCT_M_SZA),
+    PAIR_INAV: (viirs_module.PRODUCT_I_SAT_AA, viirs_module.PRODUCT_I_SAT_ZA,
+                viirs_module.PRODUCT_I_SAA, viirs_module.PRODUCT_I_SZA),
+}
+# CREFL product -> (crefl band number, MODIS L1B file type, MODIS L1B file key) for in-process CREFL
+MODIS_CREFL_SOURCES = {
+    PRODUCT_MCR01_1000M: (1, modis_guidebook.FT_1000M, modis_guidebook.K_VIS01),
+    PRODUCT_MCR02_1000M: (2, modis_guidebook.FT_1000M, modis_guidebook.K_VIS02),
+    PRODUCT_MCR03_1000M: (3, modis_guidebook.FT_1000M, modis_guidebook.K_VIS03),
+    PRODUCT_MCR04_1000M: (4, modis_guidebook.FT_1000M, modis_guidebook.K_VIS04),
+    PRODUCT_MCR05_1000M: (5, modis_guidebook.FT_1000M, modis_guidebook.K_VIS05),
+    PRODUCT_MCR06_1000M: (6, modis_guidebook.FT_1000M, modis_guidebook.K_VIS06),
+    PRODUCT_MCR07_1000M: (7, modis_guidebook.FT_1000M, modis_guidebook.K_VIS07),
+    PRODUCT_MCR01_500M: (1, modis_guidebook.FT_500M, modis_guidebook.K_VIS01),
+    PRODUCT_MCR02_500M: (2, modis_guidebook.FT_500M, modis_guidebook.K_VIS02),
+    PRODUCT_MCR03_500M: (3, modis_guidebook.FT_500M, modis_guidebook.K_VIS03),
+    PRODUCT_MCR04_500M: (4, modis_guidebook.FT_500M, modis_guidebook.K_VIS04),
+    PRODUCT_MCR05_500M: (5, modis_guidebook.FT_500M, modis_guidebook.K_VIS05),
+    PRODUCT_MCR06_500M: (6, modis_guidebook.FT_500M, modis_guidebook.K_VIS06),
+    PRODUCT_MCR07_500M: (7, modis_guidebook.FT_500M, modis_guidebook.K_VIS07),
+    PRODUCT_MCR01_250M: (1, modis_guidebook.FT_250M, modis_guidebook.K_VIS01),
+    PRODUCT_MCR02_250M: (2, modis_guidebook.FT_250M, modis_guidebook.K_VIS02),
+    # bands 3 and 4 of the 250m crefl files are at 500m resolution
+    PRODUCT_MCR03_250M: (3, modis_guidebook.FT_500M, modis_guidebook.K_VIS03),
+    PRODUCT_MCR04_250M: (4, modis_guidebook.FT_500M, modis_guidebook.K_VIS04),
+}
+# (sensor azimuth, sensor zenith, solar azimuth, solar zenith) 1km MODIS geolocation file keys
+MODIS_CREFL_ANGLES = (modis_guidebook.K_SenAA, modis_guidebook.K_SenZA, modis_guidebook.K_SAA, modis_guidebook.K_SZA)
+# number of 1km rows (10 scans) of MODIS angles expanded to the band resolution at a time
+MODIS_CREFL_ROWS_PER_BLOCK = 100
+
+
+def _repeat_angles(angle_data, factor, shape):
+    """Repeat every 1km angle pixel `factor` times in both dimensions to match band data of `shape`."""
+    if factor != 1:
+        angle_data = numpy.repeat(numpy.repeat(angle_data, factor, axis=0), factor, axis=1)
+    return angle_data[:shape[0], :shape[1]]
+
 # VIIRS Band to CREFL bands
 # M05 = CR01
 # M07 = CR02
@@ -406,11 +461,19 @@ FALSE_COLOR_PRODUCTS = VIIRS_FALSE_COLOR_PRODUCTS + MODIS_FALSE_COLOR_PRODUCTS
 # I03 = CR10
 
 class Frontend(roles.FrontendRole):
-    def __init__(self, use_terrain_corrected=True, ignore_crefl=False, **kwargs):
+    def __init__(self, use_terrain_corrected=True, ignore_crefl=False, crefl_engine=None, **kwargs):
         super(Frontend, self).__init__(**kwargs)
         self.use_terrain_corrected = use_terrain_corrected
         # Ignore existing CREFL files and just create from SDRs
         self.ignore_crefl = ignore_crefl
+        # "binary" to run the crefl executables or "python" to run CREFL in-process
+        self.crefl_engine = crefl_engine or os.environ.get("P2G_CREFL_ENGINE", "binary")
+        # VIIRS SDR files and file types to run CREFL on in-process (None if using CREFL files)
+        self.in_process_files = None
+        self.in_process_file_types = None
+        # MODIS L1B file types to run CREFL on in-process (None if using CREFL files)
+        self.in_process_modis_file_types = None
+        self._crefl_heights = {}
         # FUTURE: Remove these files or give the option to remove them when an error is encountered
         self.crefl_files_created = []
         self.secondary_product_functions = {}
@@ -467,21 +530,32 @@ class Frontend(roles.FrontendRole):
                 # Check for MODIS
                 LOG.error("Found MODIS CREFL files, but not the associated geolocation files")
                 raise RuntimeError("Found MODIS CREFL files, but not the associated geolocation files")
+        elif have_modis and self.crefl_engine == "python":
+            if not len(self.file_readers[FT_GEO]):
+                LOG.error("MODIS geolocation files are required for in-process crefl processing")
+                raise RuntimeError("MODIS geolocation files are required for in-process crefl processing")
+            LOG.info("Could not find any existing crefl output will run CREFL on MODIS SDRs in-process")
+            self.in_process_modis_file_types = [ft for ft in self.modis_refl_fts if len(self.file_readers[ft])]
         elif have_modis:
             LOG.info("Could not find any existing crefl output will use MODIS SDRs to create some")
             self.create_modis_crefl_files()
         else:
             have_viirs = self.analyze_hdf5_files(hdf5_files)
-            if have_viirs:
+            if have_viirs and self.crefl_engine == "python":
+                LOG.info("Could not find any existing crefl output will run CREFL on VIIRS SDRs in-process")
+                self.in_process_files = hdf5_files
+                self.in_process_file_types = [ft for ft in self.viirs_refl_fts if len(self.file_readers[ft])]
+            elif have_viirs:
                     LOG.info("Could not find any existing crefl output will use VIIRS SDRs to create some")
                     self.create_viirs_crefl_files()
             else:
                 LOG.error("Could not find any existing CREFL files, MODIS SDRs, or VIIRS SDRs")
                 raise RuntimeError("Could not find any existing CREFL files, MODIS SDRs, or VIIRS SDRs")
 
-        # We have CREFL files now so let's get rid of the SDRs
+        # We have CREFL files now so let's get rid of the SDRs (except MODIS SDRs used in-process)
         for ft in self.modis_refl_fts + self.viirs_refl_fts:
-            del self.file_readers[ft]
+            if ft not in (self.in_process_modis_file_types or []):
+                del self.file_readers[ft]
         # Get rid of empty crefl file readers
         for ft in list(self.crefl_fts) + [FT_GEO, FT_GIMGO, FT_GITCO, FT_GMTCO, FT_GMODO]:
             if len(self.file_readers[ft]) == 0:
@@ -638,7 +712,7 @@ class Frontend(roles.FrontendRole):
                 raise RuntimeError("Will not create viirs crefl products because there is less than 10%% of day data")
             LOG.debug("Will attempt crefl creation, found %f%% day data", day_percentage)
 
-            kwargs = {"keep_intermediate": self.keep_intermediate}
+            kwargs = {"keep_intermediate": self.keep_intermediate, "num_workers": self.num_workers}
             for ft, kw_name in zip(self.viirs_refl_fts, kw_names):
                 if ft in self.file_readers:
                     kwargs[kw_name] = self.file_readers[ft].filepaths
@@ -663,13 +737,13 @@ class Frontend(roles.FrontendRole):
 
     @property
     def begin_time(self):
-        for ft in self.crefl_fts:
+        for ft in self.crefl_fts + (FT_GMTCO, FT_GMODO, FT_GEO):
             if ft in self.file_readers:
                 return self.file_readers[ft].begin_time
 
     @property
     def end_time(self):
-        for ft in self.crefl_fts:
+        for ft in self.crefl_fts + (FT_GMTCO, FT_GMODO, FT_GEO):
             if ft in self.file_readers:
                 return self.file_readers[ft].end_time
 
@@ -679,8 +753,15 @@ class Frontend(roles.FrontendRole):
 
     @property
     def available_product_names(self):
-        return [product_name for product_name, product_def in PRODUCTS.items()
-                if product_def.file_type in self.file_readers]
+        available = [product_name for product_name, product_def in PRODUCTS.items()
+                     if product_def.file_type in self.file_readers]
+        if self.in_process_file_types is not None:
+            available.extend(product_name for product_name, (_, _, ft) in VIIRS_CREFL_SOURCES.items()
+                             if ft in self.in_process_file_types)
+        if self.in_process_modis_file_types is not None:
+            available.extend(product_name for product_name, (_, ft, _) in MODIS_CREFL_SOURCES.items()
+                             if ft in self.in_process_modis_file_types)
+        return available
 
     @property
     def default_products(self):
@@ -734,6 +815,8 @@ class Frontend(roles.FrontendRole):
         return ft
 
     def create_raw_swath_object(self, product_name, swath_definition):
+        if self.in_process_modis_file_types is not None and product_name in MODIS_CREFL_SOURCES:
+            return self.create_modis_crefl_product(product_name, swath_definition)
         product_def = PRODUCTS[product_name]
         try:
             file_type = product_def.get_file_type(self.available_file_types)
@@ -777,6 +860,160 @@ class Frontend(roles.FrontendRole):
     def create_secondary_swath_object(self, product_name, swath_definition, filename, data_type, products_created):
         pass
 
+    def create_in_process_crefl_product(self, product_name, refl_product, angle_products, height):
+        """Run CREFL on a VIIRS SDR reflectance product and write the result to a new swath product.
+        """
+        crefl_band = VIIRS_CREFL_SOURCES[product_name][0]
+        filename = product_name + ".dat"
+        if os.path.isfile(filename):
+            if not self.overwrite_existing:
+                LOG.error("Binary file already exists: %s" % (filename,))
+                raise RuntimeError("Binary file already exists: %s" % (filename,))
+            else:
+                LOG.warning("Binary file already exists, will overwrite: %s", filename)
+
+        try:
+            refl_data = refl_product.get_data_array()
+            out = numpy.memmap(filename, dtype=refl_data.dtype, mode="w+", shape=refl_data.shape)
+            angles = [angle_product.get_data_array() for angle_product in angle_products]
+            correct_reflectance(refl_data, *angles, instrument="viirs", crefl_band=crefl_band, height=height, out=out)
+            if not numpy.isnan(refl_product["fill_value"]):
+                out[refl_product.get_data_mask()] = refl_product["fill_value"]
+            out.flush()
+            del out
+
+            product_def = PRODUCTS[product_name]
+            one_swath = containers.SwathProduct(
+                product_name=product_name, description=product_def.description, units=product_def.units,
+                satellite=refl_product["satellite"], instrument=refl_product["instrument"],
+                begin_time=refl_product["begin_time"], end_time=refl_product["end_time"],
+                swath_definition=refl_product["swath_definition"], fill_value=refl_product["fill_value"],
+                swath_rows=refl_product["swath_rows"], swath_columns=refl_product["swath_columns"],
+                data_type=refl_product["data_type"], swath_data=filename,
+                source_filenames=refl_product["source_filenames"], data_kind=product_def.data_kind,
+                rows_per_scan=refl_product["rows_per_scan"], **product_def.info
+            )
+            if "orbit_rows" in refl_product:
+                one_swath["orbit_rows"] = refl_product["orbit_rows"]
+        except (ValueError, RuntimeError, KeyError):
+            if os.path.isfile(filename):
+                os.remove(filename)
+            raise
+        return one_swath
+
+    def _get_crefl_height(self, swath_definition):
+        """Terrain height of every pixel in a swath, computed once per swath (0 if there is no elevation data)."""
+        swath_name = swath_definition["swath_name"]
+        if swath_name not in self._crefl_heights:
+            avg_elevation = load_average_elevation()
+            if avg_elevation is None:
+                self._crefl_heights[swath_name] = 0.0
+            else:
+                self._crefl_heights[swath_name] = terrain_height(
+                    swath_definition.get_longitude_array(), swath_definition.get_latitude_array(), avg_elevation)
+        return self._crefl_heights[swath_name]
+
+    def create_modis_crefl_product(self, product_name, swath_definition):
+        """Run CREFL on a MODIS L1B reflectance band and write the result to a new swath product.
+
+        The 1km angles from the geolocation files are repeated to the resolution of the band a few scans at a time.
+        """
+        crefl_band, file_type, file_key = MODIS_CREFL_SOURCES[product_name]
+        file_reader = self.file_readers[file_type]
+        geo_reader = self.file_readers[FT_GEO]
+        filename = product_name + ".dat"
+        if os.path.isfile(filename):
+            if not self.overwrite_existing:
+                LOG.error("Binary file already exists: %s" % (filename,))
+                raise RuntimeError("Binary file already exists: %s" % (filename,))
+            else:
+                LOG.warning("Binary file already exists, will overwrite: %s", filename)
+
+        try:
+            # the reflectance is corrected in place in the product's binary file
+            refl_data = file_reader.get_swath_data(file_key, filename=filename, dtype=numpy.float32)
+            angles = [geo_reader.get_swath_data(angle_key) for angle_key in MODIS_CREFL_ANGLES]
+            height = self._get_crefl_height(swath_definition)
+            factor = refl_data.shape[0] // angles[0].shape[0]
+            block_rows = MODIS_CREFL_ROWS_PER_BLOCK * factor
+            for start in range(0, refl_data.shape[0], block_rows):
+                sl = slice(start, start + block_rows)
+                angle_sl = slice(start // factor, (start + block_rows) // factor)
+                block = refl_data[sl]
+                block_angles = [_repeat_angles(angle_data[angle_sl], factor, block.shape) for angle_data in angles]
+                correct_reflectance(block, *block_angles, instrument="modis", crefl_band=crefl_band,
+                                    height=height if numpy.ndim(height) == 0 else height[sl], out=block)
+            shape = refl_data.shape
+            refl_data.flush()
+            del refl_data
+            rows_per_scan = GEO_PAIRS[PRODUCTS[product_name].geo_pair_name].rows_per_scan
+        except (ValueError, RuntimeError, KeyError):
+            LOG.error("Could not run CREFL on MODIS band %d for '%s'", crefl_band, product_name)
+            if os.path.isfile(filename):
+                os.remove(filename)
+            raise
+
+        product_def = PRODUCTS[product_name]
+        one_swath = containers.SwathProduct(
+            product_name=product_name, description=product_def.description, units=product_def.units,
+            satellite=file_reader.satellite, instrument=file_reader.instrument,
+            begin_time=file_reader.begin_time, end_time=file_reader.end_time,
+            swath_definition=swath_definition, fill_value=file_reader.get_fill_value(file_key),
+            swath_rows=shape[0], swath_columns=shape[1], data_type=numpy.float32, swath_data=filename,
+            source_filenames=sorted(set(file_reader.filepaths + geo_reader.filepaths)),
+            data_kind=product_def.data_kind, rows_per_scan=rows_per_scan, **product_def.info
+        )
+        return one_swath
+
+    def create_in_process_scene(self, products):
+        """Create CREFL products by running CREFL in-process on the data loaded by the VIIRS frontend.
+        """
+        crefl_products = [p for p in products if p in VIIRS_CREFL_SOURCES]
+        sdr_products = set(p for p in products if p not in VIIRS_CREFL_SOURCES)
+        for product_name in crefl_products:
+            sdr_products.add(VIIRS_CREFL_SOURCES[product_name][1])
+            sdr_products.update(VIIRS_CREFL_ANGLES[PRODUCTS[product_name].geo_pair_name])
+
+        LOG.debug("Loading the VIIRS frontend to load SDR data for CREFL")
+        f = viirs_module.Frontend(search_paths=self.in_process_files, use_terrain_corrected=self.use_terrain_corrected,
+                                  overwrite_existing=self.overwrite_existing, keep_intermediate=self.keep_intermediate,
+                                  exit_on_error=self.exit_on_error, num_workers=self.num_workers)
+        sdr_scene = f.create_scene(products=sorted(sdr_products))
+
+        avg_elevation = load_average_elevation()
+        heights = {}
+        scene = containers.SwathScene()
+        for product_name in crefl_products:
+            sdr_product_name = VIIRS_CREFL_SOURCES[product_name][1]
+            angle_product_names = VIIRS_CREFL_ANGLES[PRODUCTS[product_name].geo_pair_name]
+            if sdr_product_name not in sdr_scene or any(p not in sdr_scene for p in angle_product_names):
+                LOG.warning("Could not create product '%s' because the SDR data could not be loaded", product_name)
+                continue
+            refl_product = sdr_scene[sdr_product_name]
+            swath_def = refl_product["swath_definition"]
+            if avg_elevation is None:
+                height = 0.0
+            elif swath_def["swath_name"] in heights:
+                height = heights[swath_def["swath_name"]]
+            else:
+                height = heights[swath_def["swath_name"]] = terrain_height(
+                    swath_def.get_longitude_array(), swath_def.get_latitude_array(), avg_elevation)
+
+            try:
+                LOG.info("Creating CREFL product '%s'", product_name)
+                scene[product_name] = self.create_in_process_crefl_product(
+                    product_name, refl_product, [sdr_scene[p] for p in angle_product_names], height)
+            except (ValueError, RuntimeError, KeyError):
+                LOG.error("Could not create product '%s'", product_name)
+                LOG.debug("Could not create product '%s'", product_name, exc_info=True)
+                if self.exit_on_error:
+                    raise
+
+        for product_name in products:
+            if product_name not in VIIRS_CREFL_SOURCES and product_name in sdr_scene:
+                scene[product_name] = sdr_scene[product_name]
+        return scene
+
     def create_scene(self, products=None, **kwargs):
         LOG.debug("Loading scene data...")
         # If the user didn't provide the products they want, figure out which ones we can create
@@ -786,6 +1023,8 @@ class Frontend(roles.FrontendRole):
 
         # Do we actually have all of the files needed to create the requested products?
         products = self.loadable_products(products)
+        if self.in_process_file_types is not None:
+            return self.create_in_process_scene(products)
 
         # Needs to be ordered (least-depended product -> most-depended product)
         products_needed = PRODUCTS.dependency_ordered_products(products)
@@ -884,6 +1123,13 @@ def add_frontend_argument_groups(parser):
                        help="List available frontend products and exit")
     group.add_argument("--no-tc", dest="use_terrain_corrected", action="store_false",
                        help="Don't use terrain-corrected navigation (VIIRS products only)")
+    group.add_argument("--num-workers", dest="num_workers", type=int,
+                       default=int(os.environ.get("P2G_FRONTEND_NUM_WORKERS", 1)),
+                       help="Number of VIIRS granules to run CREFL on at the same time (default: 1)")
+    group.add_argument("--crefl-engine", dest="crefl_engine", choices=["binary", "python"],
+                       default=os.environ.get("P2G_CREFL_ENGINE", "binary"),
+                       help="Run the crefl executables ('binary') or correct VIIRS and MODIS SDRs in-process without "
+                            "intermediate files ('python') (default: binary)")
     group_title = "Frontend Swath Extraction"
     group = parser.add_argument_group(title=group_title, description="swath extraction options")
     group.add_argument("-p", "--products", dest="products", nargs="+", default=None, action=ExtendAction,
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""In-process numpy implementation of the CREFL (corrected reflectance) algorithm.
+
+This is a port of the Rayleigh, ozone, and water vapor correction done by the
+``cviirs`` and ``crefl`` (version 1.7.1) executables wrapped by
+`polar2grid.crefl.crefl_wrapper`. It works directly on reflectance and angle
+arrays (numpy arrays, memory maps, or dask arrays) so the SDR to HDF4
+conversion and the read of the HDF4 results aren't needed.
+
+Bands are identified the same way as the CREFL output files: VIIRS bands 1-10
+are M05, M07, M03, M04, M08, M10, M11, I01, I02, I03 and MODIS bands 1-7 are
+MODIS bands 1-7.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+"""
+__docformat__ = "restructuredtext en"
+
+import os
+import logging
+from functools import lru_cache
+
+import numpy
+
+LOG = logging.getLogger(__name__)
+
+UO3_MODIS = 0.319
+UH2O_MODIS = 2.93
+UO3_VIIRS = 0.285
+UH2O_VIIRS = 2.93
+
+MAXAIRMASS = 18
+SCALEHEIGHT = 8000
+TAUSTEP4SPHALB = 0.0001
+MAXNUMSPHALBVALUES = 4000  # with no aerosol taur <= 0.4 in all bands everywhere
+REFLMIN = -0.01
+REFLMAX = 1.6
+
+CMGDEM_FILENAME = "CMGDEM.hdf"
+CMGDEM_VARIABLE = "averaged elevation"
+
+# crefl band number -> (aH2O, bH2O, aO3, taur0), values from crefl 1.7.1
+VIIRS_COEFFICIENTS = {
+    1: (0.000406601, 0.812659, 0.0433461, 0.04350),  # M05
+    2: (0.0015933, 0.832931, 0.0, 0.01582),  # M07
+    3: (0.0, 1.0, 0.0178299, 0.16176),  # M03
+    4: (1.78644e-05, 0.8677850, 0.0853012, 0.09740),  # M04
+    5: (0.00296457, 0.806816, 0.0, 0.00369),  # M08
+    6: (0.000617252, 0.944958, 0.0, 0.00132),  # M10
+    7: (0.000996563, 0.78812, 0.0, 0.00033),  # M11
+    8: (0.00222253, 0.791204, 0.0813531, 0.05373),  # I01
+    9: (0.00094005, 0.900564, 0.0, 0.01561),  # I02
+    10: (0.000563288, 0.942907, 0.0, 0.00129),  # I03
+}
+MODIS_COEFFICIENTS = {
+    1: (-5.60723, 0.820175, 0.0715289, 0.05100),
+    2: (-5.25251, 0.725159, 0.0, 0.01631),
+    3: (0.0, 0.0, 0.00743232, 0.19325),
+    4: (0.0, 0.0, 0.089691, 0.09536),
+    5: (-6.29824, 0.865732, 0.0, 0.00366),
+    6: (-7.70944, 0.966947, 0.0, 0.00123),
+    7: (-3.91877, 0.745342, 0.0, 0.00043),
+}
+
+
+def get_coefficients(instrument, crefl_band):
+    """Get the (aH2O, bH2O, aO3, taur0) coefficients for a crefl band number of an instrument.
+    """
+    coeffs = {"viirs": VIIRS_COEFFICIENTS, "modis": MODIS_COEFFICIENTS}.get(instrument.lower())
+    if coeffs is None:
+        raise ValueError("CREFL is not supported for instrument '%s'" % (instrument,))
+    try:
+        return coeffs[int(crefl_band)]
+    except KeyError:
+        raise ValueError("Unknown %s CREFL band: %s" % (instrument, crefl_band))
+
+
+@lru_cache(maxsize=1)
+def _spherical_albedo_table():
+    """Spherical albedo of the atmosphere for every `TAUSTEP4SPHALB` step of molecular optical depth."""
+    tau = numpy.linspace(TAUSTEP4SPHALB, MAXNUMSPHALBVALUES * TAUSTEP4SPHALB, MAXNUMSPHALBVALUES)
+    # exponential integrals E1 and E3
+    a = [-.57721566, 0.99999193, -0.24991055, 0.05519968, -0.00976004, 0.00107857]
+    fintexp1 = numpy.polyval(a[::-1], tau) - numpy.log(tau)
+    fintexp3 = (numpy.exp(-tau) * (1.0 - tau) + tau ** 2 * fintexp1) / 2.0
+    sphalb = (3.0 * tau - fintexp3 * (4.0 + 2.0 * tau) + 2.0 * numpy.exp(-tau)) / (4.0 + 3.0 * tau)
+    sphalb.flags.writeable = False
+    return sphalb
+
+
+@lru_cache(maxsize=2)
+def load_average_elevation(filename=None):
+    """Load the global average elevation (meters) table used to get terrain height.
+
+    By default the 'CMGDEM.hdf' file bundled with the crefl executables is used (see
+    `polar2grid.crefl.crefl_wrapper.CMGDEM_PATH`). If the file can't be read `None` is returned and the correction
+    is done at sea level like the crefl executables do.
+    """
+    if filename is None:
+        from polar2grid.crefl.crefl_wrapper import CMGDEM_PATH
+        filename = os.path.join(CMGDEM_PATH, CMGDEM_FILENAME)
+    try:
+        from pyhdf import SD
+        from pyhdf.error import HDF4Error
+    except ImportError:
+        LOG.warning("Can't read average elevation without pyhdf, will assume sea level")
+        return None
+    try:
+        hdf_file = SD.SD(filename, SD.SDC.READ)
+        try:
+            avg_elevation = hdf_file.select(CMGDEM_VARIABLE)[:].astype(numpy.float64)
+        finally:
+            hdf_file.end()
+    except (HDF4Error, OSError):
+        LOG.warning("Could not read average elevation from '%s', will assume sea level", filename)
+        LOG.debug("Average elevation read error: ", exc_info=True)
+        return None
+    avg_elevation.flags.writeable = False
+    return avg_elevation
+
+
+def terrain_height(lon, lat, avg_elevation):
+    """Terrain height (meters) of each pixel from the nearest global average elevation cell.
+
+    Invalid (NaN) navigation and negative (ocean) heights are given a height of 0.
+    """
+    num_rows, num_cols = avg_elevation.shape
+    valid = (lon >= -180.) & (lon <= 180.) & (lat >= -90.) & (lat <= 90.)
+    row = (90.0 - numpy.where(valid, lat, 0.)) * (num_rows / 180.0)
+    col = (numpy.where(valid, lon, 0.) + 180.0) * (num_cols / 360.0)
+    row = numpy.clip(row, 0, num_rows - 1).astype(numpy.int32)
+    col = numpy.clip(col, 0, num_cols - 1).astype(numpy.int32)
+    height = avg_elevation[row, col]
+    height[~valid | ~(height >= 0.0)] = 0.0
+    return height
+
+
+def _rayleigh(phi, muv, mus, taur):
+    """Molecular path reflectance and the down and up transmissions (`chand` in the C code)."""
+    xfd = 0.958725775  # depolarization factor term, xdep = 0.0279
+    xbeta2 = 0.5
+    as0 = [0.33243832, 0.16285370, -0.30924818, -0.10324388, 0.11493334,
+           -6.777104e-02, 1.577425e-03, -1.240906e-02, 3.241678e-02, -3.503695e-02]
+    as1 = [0.19666292, -5.439061e-02]
+    as2 = [0.14545937, -2.910845e-02]
+
+    mus2 = mus * mus
+    muv2 = muv * muv
+    xph1 = 1.0 + (3.0 * mus2 - 1.0) * (3.0 * muv2 - 1.0) * xfd / 8.0
+    xph2 = -xfd * xbeta2 * 1.5 * mus * muv * numpy.sqrt(1.0 - mus2) * numpy.sqrt(1.0 - muv2)
+    xph3 = xfd * xbeta2 * 0.375 * (1.0 - mus2) * (1.0 - muv2)
+
+    pl1 = mus + muv
+    pl2 = mus * muv
+    pl3 = mus2 + muv2
+    pl4 = mus2 * muv2
+    fs01 = as0[0] + pl1 * as0[1] + pl2 * as0[2] + pl3 * as0[3] + pl4 * as0[4]
+    fs02 = as0[5] + pl1 * as0[6] + pl2 * as0[7] + pl3 * as0[8] + pl4 * as0[9]
+
+    xlntaur = numpy.log(taur)
+    fs0 = fs01 + fs02 * xlntaur
+    fs1 = as1[0] + xlntaur * as1[1]
+    fs2 = as2[0] + xlntaur * as2[1]
+
+    trdown = numpy.exp(-taur / mus)
+    trup = numpy.exp(-taur / muv)
+
+    xitm1 = (1.0 - trdown * trup) / 4.0 / pl1
+    xitm2 = (1.0 - trdown) * (1.0 - trup)
+    xitot1 = xph1 * (xitm1 + xitm2 * fs0)
+    xitot2 = xph2 * (xitm1 + xitm2 * fs1)
+    xitot3 = xph3 * (xitm1 + xitm2 * fs2)
+
+    phios = numpy.deg2rad(phi + 180.0)
+    rhoray = xitot1 + xitot2 * numpy.cos(phios) * 2.0 + xitot3 * numpy.cos(2.0 * phios) * 2.0
+    return rhoray, trdown, trup
+
+
+def correct_reflectance_block(refl, sensor_azimuth, sensor_zenith, solar_azimuth, solar_zenith, height,
+                              instrument, crefl_band):
+    """Run CREFL on one block of data, see `correct_reflectance`.
+
+    All array arguments must have the same shape except `height` which may also be a scalar.
+    :returns: float64 array of corrected reflectance
+    """
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        return _correct_reflectance_block(refl, sensor_azimuth, sensor_zenith, solar_azimuth, solar_zenith, height,
+                                          instrument, crefl_band)
+
+
+def _correct_reflectance_block(refl, sensor_azimuth, sensor_zenith, solar_azimuth, solar_zenith, height,
+                               instrument, crefl_band):
+    ah2o, bh2o, ao3, taur0 = get_coefficients(instrument, crefl_band)
+    is_viirs = instrument.lower() == "viirs"
+
+    mus = numpy.cos(numpy.deg2rad(solar_zenith, dtype=numpy.float64))
+    mus[~(mus >= 0)] = numpy.nan
+    muv = numpy.cos(numpy.deg2rad(sensor_zenith, dtype=numpy.float64))
+    phi = numpy.subtract(solar_azimuth, sensor_azimuth, dtype=numpy.float64)
+
+    taur = taur0 * numpy.exp(-numpy.asarray(height, dtype=numpy.float64) / SCALEHEIGHT)
+    rhoray, trdown, trup = _rayleigh(phi, muv, mus, taur)
+    sphalb = _spherical_albedo_table()[(taur / TAUSTEP4SPHALB + 0.5).astype(numpy.int32)]
+    ttotrayu = ((2 / 3. + muv) + (2 / 3. - muv) * trup) / (4 / 3. + taur)
+    ttotrayd = ((2 / 3. + mus) + (2 / 3. - mus) * trdown) / (4 / 3. + taur)
+
+    air_mass = 1.0 / mus + 1.0 / muv
+    air_mass[air_mass > MAXAIRMASS] = -1.0
+    if bh2o == 0:
+        th2o = 1.0
+    elif is_viirs:
+        th2o = numpy.exp(-(ah2o * ((air_mass * UH2O_VIIRS) ** bh2o)))
+    else:
+        th2o = numpy.exp(-numpy.exp(ah2o + bh2o * numpy.log(air_mass * UH2O_MODIS)))
+    if ao3 == 0:
+        to3 = 1.0
+    else:
+        to3 = numpy.exp(-air_mass * (UO3_VIIRS if is_viirs else UO3_MODIS) * ao3)
+
+    corr_refl = (refl / to3 - rhoray) / (ttotrayu * ttotrayd * th2o)
+    corr_refl /= (1.0 + corr_refl * sphalb)
+    return numpy.clip(corr_refl, REFLMIN, REFLMAX, out=corr_refl)
+
+
+def correct_reflectance(refl, sensor_azimuth, sensor_zenith, solar_azimuth, solar_zenith, instrument, crefl_band,
+                        height=0.0, out=None, rows_per_block=512):
+    """Correct top of atmosphere reflectance for Rayleigh scattering and ozone/water vapor absorption.
+
+    Reflectances are unitless (0-1) and angles are in degrees. Pixels that are missing, at night (solar zenith above
+    90 degrees), or have invalid angles are NaN in the output.
+
+    If the inputs are dask arrays a lazy dask array is returned. Otherwise the data is processed `rows_per_block`
+    rows at a time so the float64 temporaries stay small, and the result is written to `out` (a new array of the
+    same data type as `refl` if not provided, can be a memory map).
+
+    :param height: Terrain height (meters) of each pixel (see `terrain_height`) or a scalar
+    :param instrument: "viirs" or "modis"
+    :param crefl_band: crefl band number (see module documentation)
+    """
+    get_coefficients(instrument, crefl_band)
+    arrays = (refl, sensor_azimuth, sensor_zenith, solar_azimuth, solar_zenith)
+    if any(hasattr(arr, "dask") for arr in arrays + (height,)):
+        import dask.array as da
+        corr_refl = da.map_blocks(correct_reflectance_block, *arrays, height, instrument, crefl_band,
+                                  dtype=numpy.float64, meta=numpy.array((), dtype=numpy.float64))
+        return corr_refl.astype(refl.dtype)
+
+    for arr in arrays[1:]:
+        if arr.shape != refl.shape:
+            raise ValueError("All CREFL input arrays must be the same shape")
+    scalar_height = numpy.ndim(height) == 0
+    if out is None:
+        out = numpy.empty(refl.shape, dtype=refl.dtype)
+    for start in range(0, refl.shape[0], rows_per_block):
+        sl = slice(start, start + rows_per_block)
+        out[sl] = correct_reflectance_block(*[arr[sl] for arr in arrays],
+                                            height if scalar_height else height[sl],
+                                            instrument, crefl_band)
+    return out
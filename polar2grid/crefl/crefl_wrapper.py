@@ -41,7 +41,10 @@ __docformat__ = "restructuredtext en"
 
 import os
 import sys
+import shutil
+import tempfile
 from subprocess import check_output, CalledProcessError, STDOUT
+from concurrent.futures import ThreadPoolExecutor
 from itertools import zip_longest
 import logging
 
@@ -82,10 +85,12 @@ def run_hdf5_rename(input_filename, output_filename, input_variable, output_vari
     return output_filename
 
 
-def _run_cviirs(output_filename, input_filenames, bands=None, overwrite=True, verbose=True, output_500m=False, output_1km=False):
+def _run_cviirs(output_filename, input_filenames, bands=None, overwrite=True, verbose=True, output_500m=False,
+                output_1km=False, cwd=None):
     """Run cviirs on one set of file (one granule's worth of time)
 
-    Essentially a replacement for `run_viirs_crefl.sh`.
+    Essentially a replacement for `run_viirs_crefl.sh`. If `cwd` is provided cviirs is run from that directory so
+    any files it creates besides the output file don't conflict with other cviirs processes.
     """
     args = [CVIIRS_NAME]
     if bands:
@@ -111,8 +116,8 @@ def _run_cviirs(output_filename, input_filenames, bands=None, overwrite=True, ve
     try:
         args = [str(a) for a in args]
         LOG.debug("Running cviirs with '%s'" % " ".join(args))
-        os.environ["ANCPATH"] = CMGDEM_PATH
-        transfer_output = check_output(args, stderr=STDOUT)
+        env = dict(os.environ, ANCPATH=CMGDEM_PATH)
+        transfer_output = check_output(args, stderr=STDOUT, cwd=cwd, env=env)
         LOG.debug("cviirs output:\n%s", transfer_output)
 
         # Check to make sure the HDF4 file actually exists now
@@ -129,83 +134,123 @@ def _run_cviirs(output_filename, input_filenames, bands=None, overwrite=True, ve
 
     return output_filename
 
+
+def _run_cviirs_granule(geo_file, m_granule_files, i_granule_files, keep_intermediate=False):
+    """Convert one granule's SDR files to HDF4 and run cviirs on them.
+
+    Intermediate HDF4 files are written to a new temporary directory in the current directory so multiple granules
+    can be processed at the same time. The directory is removed afterwards unless `keep_intermediate` is True.
+
+    :param geo_file: M-band geolocation file for this granule
+    :param m_granule_files: list of M-band SDR files (or None) in the order of `run_cviirs` M-band keywords
+    :param i_granule_files: list of I-band SDR files (or None) in the order of `run_cviirs` I-band keywords
+    :returns: list of CREFL output filenames created for this granule
+    """
+    m_vars = ["Reflectance_Mod_M%d" % (i,) for i in [5, 7, 3, 4, 8, 10, 11]]
+    i_vars = ["Reflectance_Img_I%d" % (i,) for i in range(1, 4)]
+    m_bands = [str(x) for x in range(1, 8)]
+    i_bands = ["8", "9", "10"]
+    output_filenames = []
+    # GITCO_npp_d20120225_t1805407_e1807049_b01708_c20120226002721519187_noaa_ops.h5
+    # Result: npp_d20120225_t1805407_e1807049
+    output_suffix = "_".join(os.path.basename(geo_file).split("_")[1:5])
+    m_output_filename = "CREFLM_%s.hdf" % (output_suffix,)
+    i_output_filename = "CREFLI_%s.hdf" % (output_suffix,)
+    work_dir = tempfile.mkdtemp(prefix="crefl_%s_" % (output_suffix,), dir=os.getcwd())
+    # transfer HDF5 files to HDF4 versions of themselves because that's how CREFL plays
+    svm_temp_file = os.path.join(work_dir, "NPP_VMAE_L1.hdf")
+    svi_temp_file = os.path.join(work_dir, "NPP_VIAE_L1.hdf")
+    try:
+        run_hdf5_rename(geo_file, svm_temp_file, "Latitude")
+        run_hdf5_rename(geo_file, svm_temp_file, "Longitude")
+        run_hdf5_rename(geo_file, svm_temp_file, "SatelliteAzimuthAngle", "SenAziAng_Mod")
+        run_hdf5_rename(geo_file, svm_temp_file, "SatelliteZenithAngle", "SenZenAng_Mod")
+        run_hdf5_rename(geo_file, svm_temp_file, "SolarZenithAngle", "SolZenAng_Mod")
+        run_hdf5_rename(geo_file, svm_temp_file, "SolarAzimuthAngle", "SolAziAng_Mod")
+
+        available_m_bands = []
+        for m_file, m_var, m_band in zip(m_granule_files, m_vars, m_bands):
+            if m_file:
+                LOG.debug("Running HDF5 to HDF4 transfer tool for band %s using var %s", m_band, m_var)
+                run_hdf5_rename(m_file, svm_temp_file, "Reflectance", m_var)
+                available_m_bands.append(m_band)
+
+        if available_m_bands:
+            # only run this if we were given any files
+            LOG.info("Running CREFL for M bands (%s)", output_suffix)
+            _run_cviirs(os.path.abspath(m_output_filename), [svm_temp_file], bands=available_m_bands,
+                        output_1km=True, cwd=work_dir)
+            output_filenames.append(m_output_filename)
+
+        available_i_bands = []
+        for i_file, i_var, i_band in zip(i_granule_files, i_vars, i_bands):
+            if i_file:
+                LOG.debug("Running HDF5 to HDF4 transfer tool for band %s using var %s", i_band, i_var)
+                run_hdf5_rename(i_file, svi_temp_file, "Reflectance", i_var)
+                available_i_bands.append(i_band)
+
+        if available_i_bands:
+            # only run this if we have the necessary data
+            LOG.info("Running CREFL for I bands (%s)", output_suffix)
+            _run_cviirs(os.path.abspath(i_output_filename), [svm_temp_file, svi_temp_file], bands=available_i_bands,
+                        output_500m=True, cwd=work_dir)
+            output_filenames.append(i_output_filename)
+    except (OSError, RuntimeError, ValueError, KeyError):
+        LOG.error("Could not create VIIRS CREFL files", exc_info=True)
+        LOG.error("Could not create VIIRS CREFL files")
+        if os.path.isfile(m_output_filename) and not keep_intermediate:
+            LOG.debug("Removing unfinished CREFLM file: %s", m_output_filename)
+            os.remove(m_output_filename)
+        if os.path.isfile(i_output_filename) and not keep_intermediate:
+            LOG.debug("Removing unfinished CREFLI file: %s", i_output_filename)
+            os.remove(i_output_filename)
+        raise
+    finally:
+        if not keep_intermediate:
+            LOG.debug("Removing temporary crefl directory: %s", work_dir)
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return output_filenames
+
+
 def run_cviirs(geo_files,
                m05_files=None, m07_files=None, m03_files=None, m04_files=None,
                m08_files=None, m10_files=None, m11_files=None,
-               i01_files=None, i02_files=None, i03_files=None, keep_intermediate=False):
+               i01_files=None, i02_files=None, i03_files=None, keep_intermediate=False, num_workers=1):
     """Run cviirs for multiple granules worth of files.
 
+    Each granule is processed in its own temporary directory (see `_run_cviirs_granule`). Up to `num_workers`
+    granules are converted and run through cviirs at the same time. Output filenames are returned in granule order.
+    If any granule fails the remaining granules that haven't started are not processed and the first error, in
+    granule order, is raised.
+
     Note: cviirs requires a 'CMGDEM.hdf' to be in the same directory as the 'cviirs' executable. The search directory
     can be changed with the 'ANCPATH' environment variable.
     """
     m_files = [m05_files, m07_files, m03_files, m04_files, m08_files, m10_files, m11_files]
     i_files = [i01_files, i02_files, i03_files]
-    m_vars = ["Reflectance_Mod_M%d" % (i,) for i in [5, 7, 3, 4, 8, 10, 11]]
-    i_vars = ["Reflectance_Img_I%d" % (i,) for i in range(1, 4)]
-    m_bands = [str(x) for x in range(1, 8)]
-    i_bands = ["8", "9", "10"]
-    output_filenames = []
+    granule_args = []
     for idx, geo_file in enumerate(geo_files):
-        # transfer HDF5 files to HDF4 versions of themselves because that's how CREFL plays
-        svm_temp_file = "NPP_VMAE_L1.hdf"
-        svi_temp_file = "NPP_VIAE_L1.hdf"
-        # GITCO_npp_d20120225_t1805407_e1807049_b01708_c20120226002721519187_noaa_ops.h5
-        # Result: npp_d20120225_t1805407_e1807049
-        output_suffix = "_".join(os.path.basename(geo_file).split("_")[1:5])
-        m_output_filename = "CREFLM_%s.hdf" % (output_suffix,)
-        i_output_filename = "CREFLI_%s.hdf" % (output_suffix,)
-        try:
-            run_hdf5_rename(geo_file, svm_temp_file, "Latitude")
-            run_hdf5_rename(geo_file, svm_temp_file, "Longitude")
-            run_hdf5_rename(geo_file, svm_temp_file, "SatelliteAzimuthAngle", "SenAziAng_Mod")
-            run_hdf5_rename(geo_file, svm_temp_file, "SatelliteZenithAngle", "SenZenAng_Mod")
-            run_hdf5_rename(geo_file, svm_temp_file, "SolarZenithAngle", "SolZenAng_Mod")
-            run_hdf5_rename(geo_file, svm_temp_file, "SolarAzimuthAngle", "SolAziAng_Mod")
-
-            available_m_bands = []
-            for m_file_list, m_var, m_band in zip(m_files, m_vars, m_bands):
-                if m_file_list:
-                    LOG.debug("Running HDF5 to HDF4 transfer tool for band %s using var %s", m_band, m_var)
-                    run_hdf5_rename(m_file_list[idx], svm_temp_file, "Reflectance", m_var)
-                    available_m_bands.append(m_band)
-
-            if available_m_bands:
-                # only run this if we were given any files
-                LOG.info("Running CREFL for M bands")
-                _run_cviirs(m_output_filename, [svm_temp_file], bands=available_m_bands, output_1km=True)
-                output_filenames.append(m_output_filename)
-
-            available_i_bands = []
-            for i_file_list, i_var, i_band in zip(i_files, i_vars, i_bands):
-                if i_file_list:
-                    LOG.debug("Running HDF5 to HDF4 transfer tool for band %s using var %s", i_band, i_var)
-                    run_hdf5_rename(i_file_list[idx], svi_temp_file, "Reflectance", i_var)
-                    available_i_bands.append(i_band)
-
-            if available_i_bands:
-                # only run this if we have the necessary data
-                LOG.info("Running CREFL for I bands")
-                _run_cviirs(i_output_filename, [svm_temp_file, svi_temp_file], bands=available_i_bands, output_500m=True)
-                output_filenames.append(i_output_filename)
-        except (OSError, RuntimeError, ValueError, KeyError):
-            LOG.error("Could not create VIIRS CREFL files", exc_info=True)
-            LOG.error("Could not create VIIRS CREFL files")
-            if os.path.isfile(m_output_filename) and not keep_intermediate:
-                LOG.debug("Removing unfinished CREFLM file: %s", m_output_filename)
-                os.remove(m_output_filename)
-            if os.path.isfile(i_output_filename) and not keep_intermediate:
-                LOG.debug("Removing unfinished CREFLI file: %s", i_output_filename)
-                os.remove(i_output_filename)
-            raise
-        finally:
-            if os.path.isfile(svm_temp_file) and not keep_intermediate:
-                LOG.debug("Removing temporary crefl file: %s", svm_temp_file)
-                os.remove(svm_temp_file)
-            if os.path.isfile(svi_temp_file) and not keep_intermediate:
-                LOG.debug("Removing temporary crefl file: %s", svi_temp_file)
-                os.remove(svi_temp_file)
-
-    output_filenames = list(set(output_filenames))
+        m_granule_files = [m_file_list[idx] if m_file_list else None for m_file_list in m_files]
+        i_granule_files = [i_file_list[idx] if i_file_list else None for i_file_list in i_files]
+        granule_args.append((geo_file, m_granule_files, i_granule_files, keep_intermediate))
+
+    if num_workers is None or num_workers <= 1 or len(granule_args) <= 1:
+        granule_outputs = [_run_cviirs_granule(*args) for args in granule_args]
+    else:
+        # the work is done by subprocesses so threads are enough to run them in parallel
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = [executor.submit(_run_cviirs_granule, *args) for args in granule_args]
+            try:
+                granule_outputs = [future.result() for future in futures]
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    output_filenames = []
+    for granule_output in granule_outputs:
+        output_filenames.extend(fn for fn in granule_output if fn not in output_filenames)
     LOG.debug("cviirs output filenames:\n\t%s", "\n\t".join(output_filenames))
     return output_filenames
 
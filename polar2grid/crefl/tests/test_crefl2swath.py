@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Tests for the CREFL frontend.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+
+"""
+__docformat__ = "restructuredtext en"
+
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+# the polar2grid.crefl package requires pyhdf through the MODIS frontend
+pytest.importorskip("pyhdf")
+from polar2grid.crefl import crefl2swath  # noqa: E402
+from polar2grid.crefl.crefl_engine import correct_reflectance  # noqa: E402
+from polar2grid.modis import modis_guidebook  # noqa: E402
+
+
+class _FakeMultiReader(object):
+    """Minimal MODIS multi-file reader returning the arrays it was created with."""
+    satellite = "aqua"
+    instrument = "modis"
+    begin_time = datetime(2021, 1, 1, 18, 0, 0)
+    end_time = datetime(2021, 1, 1, 18, 5, 0)
+
+    def __init__(self, filepath, arrays):
+        self.filepaths = [filepath]
+        self.arrays = arrays
+
+    def __len__(self):
+        return 1
+
+    def get_swath_data(self, item, filename=None, dtype=None):
+        data = self.arrays[item].astype(dtype or np.float32)
+        if filename is not None:
+            output = np.memmap(filename, dtype=data.dtype, mode="w+", shape=data.shape)
+            output[:] = data
+            return output
+        return data.copy()
+
+    def get_fill_value(self, item):
+        return np.nan
+
+
+@pytest.fixture
+def modis_in_process_frontend(tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    monkeypatch.setattr(crefl2swath, "load_average_elevation", lambda: None)
+    # 4 MODIS 1km scans and the same scans at 500m
+    rs = np.random.RandomState(0)
+    angles = {
+        modis_guidebook.K_SenAA: rs.uniform(-180., 180., size=(40, 30)),
+        modis_guidebook.K_SenZA: rs.uniform(0., 65., size=(40, 30)),
+        modis_guidebook.K_SAA: rs.uniform(-180., 180., size=(40, 30)),
+        modis_guidebook.K_SZA: rs.uniform(0., 80., size=(40, 30)),
+    }
+    refl = {modis_guidebook.K_VIS01: rs.uniform(0., 1., size=(80, 60))}
+    frontend = crefl2swath.Frontend.__new__(crefl2swath.Frontend)
+    frontend.overwrite_existing = False
+    frontend.in_process_modis_file_types = [modis_guidebook.FT_500M]
+    frontend._crefl_heights = {}
+    frontend.file_readers = {
+        modis_guidebook.FT_GEO: _FakeMultiReader("MYD03.hdf", angles),
+        modis_guidebook.FT_500M: _FakeMultiReader("MYD02HKM.hdf", refl),
+    }
+    return frontend, angles, refl
+
+
+class TestModisInProcess(object):
+    def test_matches_full_resolution_angles(self, modis_in_process_frontend):
+        frontend, angles, refl = modis_in_process_frontend
+        product = frontend.create_raw_swath_object(crefl2swath.PRODUCT_MCR01_500M, {"swath_name": "500m_nav"})
+        assert product["swath_rows"] == 80 and product["swath_columns"] == 60
+        assert product["source_filenames"] == ["MYD02HKM.hdf", "MYD03.hdf"]
+
+        full_angles = [np.repeat(np.repeat(angles[key], 2, axis=0), 2, axis=1)
+                       for key in crefl2swath.MODIS_CREFL_ANGLES]
+        expected = correct_reflectance(refl[modis_guidebook.K_VIS01].astype(np.float32), *full_angles,
+                                       instrument="modis", crefl_band=1)
+        result = np.fromfile(product["swath_data"], dtype=np.float32).reshape((80, 60))
+        np.testing.assert_allclose(result, expected, rtol=1e-5, atol=1e-6)
+
+    def test_existing_file(self, modis_in_process_frontend):
+        frontend = modis_in_process_frontend[0]
+        open(crefl2swath.PRODUCT_MCR01_500M + ".dat", "w").close()
+        with pytest.raises(RuntimeError):
+            frontend.create_raw_swath_object(crefl2swath.PRODUCT_MCR01_500M, {"swath_name": "500m_nav"})
+
+
+def main():
+    return pytest.main([os.path.realpath(__file__)])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
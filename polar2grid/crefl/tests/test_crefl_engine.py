@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Tests for the in-process CREFL engine.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+
+"""
+__docformat__ = "restructuredtext en"
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# the polar2grid.crefl package requires pyhdf through the MODIS frontend
+pytest.importorskip("pyhdf")
+from polar2grid.crefl import crefl_engine  # noqa: E402
+
+
+def _fake_inputs(shape=(48, 300)):
+    rs = np.random.RandomState(0)
+    refl = rs.uniform(0.0, 1.0, size=shape).astype(np.float32)
+    refl[0, :5] = np.nan
+    sensor_azimuth = rs.uniform(-180.0, 180.0, size=shape).astype(np.float32)
+    sensor_zenith = rs.uniform(0.0, 70.0, size=shape).astype(np.float32)
+    solar_azimuth = rs.uniform(-180.0, 180.0, size=shape).astype(np.float32)
+    solar_zenith = rs.uniform(0.0, 100.0, size=shape).astype(np.float32)
+    height = rs.uniform(-50.0, 3000.0, size=shape)
+    return refl, sensor_azimuth, sensor_zenith, solar_azimuth, solar_zenith, height
+
+
+class TestCorrectReflectance(object):
+    @pytest.mark.parametrize(("instrument", "crefl_band", "band_name", "resolution"), [
+        ("viirs", 1, "M05", 742),
+        ("viirs", 8, "I01", 371),
+        ("modis", 3, "3", 1000),
+    ])
+    def test_matches_satpy(self, instrument, crefl_band, band_name, resolution):
+        xr = pytest.importorskip("xarray")
+        da = pytest.importorskip("dask.array")
+        crefl_utils = pytest.importorskip("satpy.modifiers._crefl_utils")
+        refl, sensor_azimuth, sensor_zenith, solar_azimuth, solar_zenith, _ = _fake_inputs()
+        # satpy's MODIS coefficients are looked up by wavelength
+        wavelength = (0.459, 0.469, 0.479) if instrument == "modis" else band_name
+        attrs = {"sensor": instrument, "units": "1", "wavelength": wavelength, "resolution": resolution}
+        refl_arr = xr.DataArray(da.from_array(refl, chunks=16), dims=("y", "x"), attrs=attrs)
+        angles = [xr.DataArray(da.from_array(a, chunks=16), dims=("y", "x")) for a in
+                  (sensor_azimuth, sensor_zenith, solar_azimuth, solar_zenith)]
+        expected = crefl_utils.run_crefl(refl_arr, *angles).values
+
+        result = crefl_engine.correct_reflectance(refl, sensor_azimuth, sensor_zenith, solar_azimuth,
+                                                  solar_zenith, instrument, crefl_band, rows_per_block=16)
+        assert result.dtype == refl.dtype
+        np.testing.assert_allclose(result, expected, rtol=1e-5, atol=1e-6, equal_nan=True)
+        assert np.isnan(result[0, :5]).all()
+        assert np.isnan(result[solar_zenith > 90.0]).all()
+
+    def test_blocks_and_dask_match(self):
+        da = pytest.importorskip("dask.array")
+        refl, sensor_azimuth, sensor_zenith, solar_azimuth, solar_zenith, height = _fake_inputs()
+        args = (refl, sensor_azimuth, sensor_zenith, solar_azimuth, solar_zenith)
+        whole = crefl_engine.correct_reflectance(*args, "viirs", 3, height=height, rows_per_block=refl.shape[0])
+
+        out = np.empty_like(refl)
+        blocked = crefl_engine.correct_reflectance(*args, "viirs", 3, height=height, out=out, rows_per_block=5)
+        assert blocked is out
+        np.testing.assert_array_equal(blocked, whole)
+
+        lazy = crefl_engine.correct_reflectance(*[da.from_array(a, chunks=(16, 100)) for a in args],
+                                                "viirs", 3, height=da.from_array(height, chunks=(16, 100)))
+        np.testing.assert_array_equal(lazy.compute(), whole)
+
+    def test_unknown_band(self):
+        refl = np.zeros((2, 2), dtype=np.float32)
+        pytest.raises(ValueError, crefl_engine.correct_reflectance, refl, refl, refl, refl, refl, "viirs", 11)
+        pytest.raises(ValueError, crefl_engine.correct_reflectance, refl, refl, refl, refl, refl, "abi", 1)
+
+
+def test_terrain_height():
+    avg_elevation = np.array([[100.0, -5.0], [2000.0, 50.0]])
+    lon = np.array([-90.0, 90.0, -90.0, 90.0, np.nan, 200.0])
+    lat = np.array([45.0, 45.0, -45.0, -45.0, 0.0, 0.0])
+    height = crefl_engine.terrain_height(lon, lat, avg_elevation)
+    np.testing.assert_array_equal(height, [100.0, 0.0, 2000.0, 50.0, 0.0, 0.0])
+
+
+def test_missing_average_elevation(tmpdir):
+    assert crefl_engine.load_average_elevation(str(tmpdir.join("CMGDEM.hdf"))) is None
+
+
+def main():
+    return pytest.main([os.path.realpath(__file__)])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Tests for running the CREFL executables.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+
+"""
+__docformat__ = "restructuredtext en"
+
+import os
+import sys
+import threading
+from subprocess import CalledProcessError
+
+import pytest
+
+# the polar2grid.crefl package requires pyhdf through the MODIS frontend
+pytest.importorskip("pyhdf")
+from polar2grid.crefl import crefl_wrapper  # noqa: E402
+
+
+def _geo_filename(granule_idx):
+    return "GMTCO_npp_d20120225_t18%02d407_e18%02d049_b01708_c20120226002721519187_noaa_ops.h5" % (
+        granule_idx, granule_idx + 1)
+
+
+class _FakeCheckOutput(object):
+    """Replacement for `subprocess.check_output` that creates the output files the real executables would."""
+    def __init__(self, fail_on=None, barrier=None):
+        self.calls = []
+        self.fail_on = fail_on
+        self.barrier = barrier
+        self._lock = threading.Lock()
+
+    def __call__(self, args, stderr=None, cwd=None, env=None):
+        with self._lock:
+            self.calls.append((args, cwd, env))
+        if args[0] == crefl_wrapper.CVIIRS_NAME:
+            if self.barrier is not None:
+                # every granule must be running at the same time to get past this
+                self.barrier.wait()
+            if self.fail_on is not None and any(self.fail_on in arg for arg in args):
+                raise CalledProcessError(1, args, output=b"cviirs failed")
+            output_filename = [arg for arg in args if arg.startswith("--of=")][0][5:]
+        else:
+            output_filename = args[2]
+        with open(output_filename, "a"):
+            pass
+        return b""
+
+    def renames(self):
+        return [call for call in self.calls if call[0][0] == crefl_wrapper.H5SDS_TRANSFER_RENAME_NAME]
+
+    def cviirs_calls(self):
+        return [call for call in self.calls if call[0][0] == crefl_wrapper.CVIIRS_NAME]
+
+
+@pytest.fixture
+def fake_crefl(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    monkeypatch.setattr(crefl_wrapper, "CMGDEM_PATH", "/path/to/ancillary")
+    monkeypatch.delenv("ANCPATH", raising=False)
+
+    def _fake_crefl(**kwargs):
+        check_output = _FakeCheckOutput(**kwargs)
+        monkeypatch.setattr(crefl_wrapper, "check_output", check_output)
+        return check_output
+    return _fake_crefl
+
+
+class TestRunCVIIRSGranule(object):
+    def test_granule(self, tmpdir, fake_crefl):
+        check_output = fake_crefl()
+        m_files = ["SVM05.h5", None, "SVM03.h5", None, None, None, None]
+        i_files = ["SVI01.h5", None, None]
+        output_filenames = crefl_wrapper._run_cviirs_granule(_geo_filename(5), m_files, i_files)
+        assert output_filenames == ["CREFLM_npp_d20120225_t1805407_e1806049.hdf",
+                                    "CREFLI_npp_d20120225_t1805407_e1806049.hdf"]
+        assert all(os.path.isfile(str(tmpdir.join(fn))) for fn in output_filenames)
+
+        # intermediate files go in a new directory for this granule in the current directory
+        work_dirs = set(os.path.dirname(args[2]) for args, _, _ in check_output.renames())
+        assert len(work_dirs) == 1
+        work_dir = work_dirs.pop()
+        assert os.path.dirname(work_dir) == str(tmpdir)
+        assert os.path.basename(work_dir).startswith("crefl_npp_d20120225_t1805407_e1806049_")
+        assert not os.path.exists(work_dir)
+
+        cviirs_calls = check_output.cviirs_calls()
+        assert len(cviirs_calls) == 2
+        assert "--bands=1,3" in cviirs_calls[0][0]
+        assert "--bands=8" in cviirs_calls[1][0]
+        for args, cwd, env in cviirs_calls:
+            assert cwd == work_dir
+            # the ancillary path is given to cviirs without changing this process's environment
+            assert env["ANCPATH"] == "/path/to/ancillary"
+        assert "ANCPATH" not in os.environ
+
+    def test_keep_intermediate(self, fake_crefl):
+        check_output = fake_crefl()
+        crefl_wrapper._run_cviirs_granule(_geo_filename(5), ["SVM05.h5"] + [None] * 6, [None] * 3,
+                                          keep_intermediate=True)
+        work_dir = check_output.cviirs_calls()[0][1]
+        assert os.path.isfile(os.path.join(work_dir, "NPP_VMAE_L1.hdf"))
+
+    def test_cviirs_error(self, tmpdir, fake_crefl):
+        check_output = fake_crefl(fail_on="--500m")
+        with pytest.raises(ValueError):
+            crefl_wrapper._run_cviirs_granule(_geo_filename(5), ["SVM05.h5"] + [None] * 6,
+                                              ["SVI01.h5", None, None])
+        # partial output and intermediate files are removed
+        assert tmpdir.listdir() == []
+        assert len(check_output.cviirs_calls()) == 2
+
+
+class TestRunCVIIRS(object):
+    def test_parallel_granules(self, tmpdir, fake_crefl):
+        check_output = fake_crefl(barrier=threading.Barrier(3, timeout=10))
+        geo_files = [_geo_filename(idx) for idx in (1, 3, 5)]
+        output_filenames = crefl_wrapper.run_cviirs(geo_files, m05_files=["SVM05_%d.h5" % (idx,) for idx in range(3)],
+                                                    num_workers=3)
+        # outputs are in granule order no matter when each granule finished
+        assert output_filenames == ["CREFLM_npp_d20120225_t1801407_e1802049.hdf",
+                                    "CREFLM_npp_d20120225_t1803407_e1804049.hdf",
+                                    "CREFLM_npp_d20120225_t1805407_e1806049.hdf"]
+        work_dirs = [cwd for _, cwd, _ in check_output.cviirs_calls()]
+        assert len(set(work_dirs)) == 3
+        assert tmpdir.listdir(lambda p: p.isdir()) == []
+
+    @pytest.mark.parametrize("num_workers", [1, 2])
+    def test_granule_error(self, tmpdir, fake_crefl, num_workers):
+        fake_crefl(fail_on="t1803407")
+        geo_files = [_geo_filename(idx) for idx in (1, 3, 5)]
+        with pytest.raises(ValueError):
+            crefl_wrapper.run_cviirs(geo_files, m05_files=["SVM05_%d.h5" % (idx,) for idx in range(3)],
+                                     num_workers=num_workers)
+        assert not tmpdir.join("CREFLM_npp_d20120225_t1803407_e1804049.hdf").exists()
+        assert tmpdir.listdir(lambda p: p.isdir()) == []
+
+
+def main():
+    return pytest.main([os.path.realpath(__file__)])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
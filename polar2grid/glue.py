@@ -43,6 +43,9 @@ import numpy as np
 from pyresample.geometry import DynamicAreaDefinition, AreaDefinition
 from pyproj import Proj
 from polar2grid.writers import geotiff, awips_tiled
+from polar2grid.composite_cache import CompositeCache, generate_composites
+from polar2grid.pyspectral_cache import install_lut_cache
+from polar2grid.writers.enhancement_compiler import CompilingEnhancer, get_default_cache_filename
 
 try:
     from pyproj import CRS
@@ -406,6 +409,17 @@ basic processing with limited products:
         warnings.filterwarnings("ignore")
     LOG.debug("Starting script with arguments: %s", " ".join(sys.argv))
 
+    # Load pyspectral lookup tables from the cache made by p2g_pyspectral_cache.sh if it exists
+    install_lut_cache()
+
+    # Share one enhancer between writers so each product's enhancements are only compiled once
+    enhancer = None
+    for writer in writer_args['writers']:
+        if writer_args[writer].get('enhance') is True:
+            if enhancer is None:
+                enhancer = CompilingEnhancer(cache_filename=get_default_cache_filename())
+            writer_args[writer]['enhance'] = enhancer
+
     # Set up dask and the number of workers
     if args.num_workers:
         from multiprocessing.pool import ThreadPool
@@ -440,7 +454,11 @@ basic processing with limited products:
         scene_creation['reader'], load_args['products'])
     if not load_args['products']:
         return -1
-    scn.load(load_args['products'])
+    # share intermediate composites (corrected bands, angles, etc) between products and resampled areas
+    composite_cache = CompositeCache()
+    scn.load(load_args['products'], generate=False)
+    composite_cache.install(scn)
+    generate_composites(scn)
 
     # from .filters.day_night import _get_sunlight_coverage
     # data_arr = scn[load_args['products'][0]]
@@ -541,6 +559,9 @@ basic processing with limited products:
 
     LOG.info("Computing products and saving data to writers...")
     compute_writer_results(to_save)
+    composite_cache.log_summary()
+    if enhancer is not None:
+        enhancer.save_cache()
     LOG.info("SUCCESS")
     return 0
 
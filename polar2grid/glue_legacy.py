@@ -48,6 +48,7 @@ import pkg_resources
 from polar2grid.readers import ReaderWrapper, convert_satpy_to_p2g_swath, convert_satpy_to_p2g_gridded
 from polar2grid.readers import dataarray_to_gridded_product
 from polar2grid.remap import Remapper, add_remap_argument_groups, SATPY_RESAMPLERS
+from polar2grid.core.statistics import get_statistics, DEFAULT_STATISTICS_FILE
 from satpy import Scene, DatasetID, CHUNK_SIZE
 from satpy.utils import TRACE_LEVEL
 from xarray import DataArray
@@ -207,6 +208,9 @@ def main(argv=sys.argv[1:]):
                         help="Specify the backend to use to write data output (additional arguments are determined after this is specified)")
     parser.add_argument("--compositor-configs", nargs="*", default=None,
                         help="Specify alternative configuration file(s) for compositors")
+    parser.add_argument("--statistics-file", default=DEFAULT_STATISTICS_FILE,
+                        help="Write the min, max, valid pixel count, and fill pixel count of each product "
+                             "for each processing stage to this JSON file")
     # don't include the help flag
     argv_without_help = [x for x in argv if x not in ["-h", "--help"]]
     args, remaining_args = parser.parse_known_args(argv_without_help)
@@ -252,6 +256,8 @@ def main(argv=sys.argv[1:]):
     setup_logging(console_level=levels[min(4, args.verbosity)], log_filename=args.log_fn)
     sys.excepthook = create_exc_handler(LOG.name)
     LOG.debug("Starting script with arguments: %s", " ".join(sys.argv))
+    # statistics cost extra passes over the data so only collect them when they will be seen
+    get_statistics().enabled = bool(args.statistics_file) or levels[min(4, args.verbosity)] <= logging.DEBUG
 
     # Keep track of things going wrong to tell the user what went wrong (we want to create as much as possible)
     status_to_return = STATUS_SUCCESS
@@ -502,6 +508,8 @@ def main(argv=sys.argv[1:]):
         # Force deletion and eventual garbage collection of the scene objects
         del gridded_scene
     del scene
+    if args.statistics_file:
+        get_statistics().write(args.statistics_file)
     return status_to_return
 
 
@@ -179,7 +179,8 @@ import numpy as np
 import os
 
 from polar2grid.core import containers, roles
-from polar2grid.core.frontend_utils import BaseMultiFileReader, BaseFileReader, ProductDict, GeoPairDict
+from polar2grid.core.frontend_utils import BaseMultiFileReader, BaseFileReader, ProductDict, GeoPairDict, file_access
+from polar2grid.core.frontend_utils import TASK_RAW, run_dependent_tasks
 
 try:
     # try getting setuptools/distribute's version of resource retrieval first
@@ -383,9 +384,27 @@ class MIRSFileReader(BaseFileReader):
     }
 
     def __init__(self, filepath, file_type_info):
-        super(MIRSFileReader, self).__init__(NetCDFFileReader(filepath), file_type_info)
+        """Initialize the reader from a filepath or an already created file handle (ex. a
+        `polar2grid.core.file_catalog.CatalogFileHandle`).
+        """
+        file_handle = NetCDFFileReader(filepath) if isinstance(filepath, str) else filepath
+        super(MIRSFileReader, self).__init__(file_handle, file_type_info)
         # Not supported in older version of NetCDF4 library
         #self.file_handle.set_auto_maskandscale(False)
+        if not self._load_cataloged_info():
+            self._load_file_info()
+
+        if self.instrument in self.INST_NADIR_RESOLUTION:
+            self.nadir_resolution = self.INST_NADIR_RESOLUTION[self.instrument]
+        else:
+            self.nadir_resolution = None
+
+        if self.instrument in self.INST_LIMB_RESOLUTION:
+            self.limb_resolution = self.INST_LIMB_RESOLUTION[self.instrument]
+        else:
+            self.limb_resolution = None
+
+    def _load_file_info(self):
         if not self.handles_file(self.file_handle):
             LOG.error("Unknown file format for file %s" % (self.filename,))
             raise ValueError("Unknown file format for file %s" % (self.filename,))
@@ -401,16 +420,6 @@ class MIRSFileReader(BaseFileReader):
             else:
                 self._parse_new_filename()
 
-        if self.instrument in self.INST_NADIR_RESOLUTION:
-            self.nadir_resolution = self.INST_NADIR_RESOLUTION[self.instrument]
-        else:
-            self.nadir_resolution = None
-
-        if self.instrument in self.INST_LIMB_RESOLUTION:
-            self.limb_resolution = self.INST_LIMB_RESOLUTION[self.instrument]
-        else:
-            self.limb_resolution = None
-
     def _parse_old_filename(self):
         # IMG_SX.M1.D15238.S1614.E1627.B0000001.WE.HR.ORB.nc
         fn_parts = self.file_handle.filename.split(".")
@@ -587,6 +596,7 @@ class MIRSMultiReader(BaseMultiFileReader):
     def handles_file(cls, fn_or_nc_obj):
         return MIRSFileReader.handles_file(fn_or_nc_obj)
 
+    @file_access
     def get_channel_index(self, freq):
         return self.file_readers[0].get_channel_index(freq)
 
@@ -682,8 +692,17 @@ class Frontend(roles.FrontendRole):
     def _load_files(self, filepaths):
         self.file_readers = {}
         for filepath in filepaths:
-            file_type = get_file_type(filepath)
-            if file_type is None:
+            # cataloged files aren't opened until their data is read
+            file_handle = None
+            if self.file_catalog is not None:
+                file_handle = self.file_catalog.get_file_handle(filepath, NetCDFFileReader)
+            if file_handle is not None:
+                file_type = file_handle.file_type
+            else:
+                file_type = get_file_type(filepath)
+                if self.file_catalog is not None and file_type is None:
+                    self.file_catalog.update(filepath, file_type=None)
+            if file_type not in FILE_CLASSES:
                 LOG.debug("Unrecognized file: %s", filepath)
                 continue
 
@@ -691,7 +710,13 @@ class Frontend(roles.FrontendRole):
                 file_reader = self.file_readers[file_type]
             else:
                 self.file_readers[file_type] = file_reader = FILE_CLASSES[file_type]()
-            file_reader.add_file(filepath)
+                file_reader.file_catalog = self.file_catalog
+            file_reader.add_file(filepath if file_handle is None else file_handle)
+            if self.file_catalog is not None and file_handle is None:
+                self.file_catalog.update_from_reader(file_reader.file_readers[-1], file_type)
+
+        if self.file_catalog is not None:
+            self.file_catalog.save()
 
         # Get rid of the readers we aren't using
         for file_type, file_reader in self.file_readers.items():
@@ -847,8 +872,7 @@ class Frontend(roles.FrontendRole):
         # Needs to be ordered (least-depended product -> most-depended product)
         products_needed = self.PRODUCTS.dependency_ordered_products(products)
         geo_pairs_needed = self.PRODUCTS.geo_pairs_for_products(products_needed, self.available_file_types)
-        # both lists below include raw products that need extra processing/masking
-        raw_products_needed = (p for p in products_needed if self.PRODUCTS.is_raw(p, geo_is_raw=True))
+        # includes raw products that need extra processing/masking
         secondary_products_needed = [p for p in products_needed if self.PRODUCTS.needs_processing(p)]
         for p in secondary_products_needed:
             if p not in self.secondary_product_functions:
@@ -889,35 +913,37 @@ class Frontend(roles.FrontendRole):
 
             swath_definitions[geo_pair_name] = self.create_swath_definition(one_lon_swath, one_lat_swath)
 
-        # Create each raw products (products that are loaded directly from the file)
-        for product_name in raw_products_needed:
-            if product_name in products_created:
-                # already created
-                continue
-
-            try:
+        # Create raw products (loaded directly from the file) and dependent/special case products (non-raw products or
+        # raw products that need further processing), independent products may be created at the same time
+        def _create_product(task):
+            stage, product_name = task
+            if stage == TASK_RAW:
                 LOG.info("Creating data product '%s'", product_name)
                 swath_def = swath_definitions[self.PRODUCTS[product_name].get_geo_pair_name(self.available_file_types)]
-                one_swath = products_created[product_name] = self.create_raw_swath_object(product_name, swath_def)
-            except (ValueError, OSError):
-                LOG.error("Could not create raw product '%s'", product_name)
-                LOG.debug("Debug: ", exc_info=True)
-                if self.exit_on_error:
-                    raise
-                continue
-
-            if product_name in products:
-                # the user wants this product
-                scene[product_name] = one_swath
-
-        # Dependent products and Special cases (i.e. non-raw products that need further processing)
-        for product_name in reversed(secondary_products_needed):
-            product_func = self.secondary_product_functions[product_name]
+                return self.create_raw_swath_object(product_name, swath_def)
+            LOG.info("Creating secondary product '%s'", product_name)
             swath_def = swath_definitions[self.PRODUCTS[product_name].geo_pair_name]
+            return self.secondary_product_functions[product_name](product_name, swath_def, products_created)
+
+        task_dependencies = self.PRODUCTS.product_task_dependencies(products_needed)
+        for (stage, product_name), future in run_dependent_tasks(task_dependencies, _create_product, self.num_workers):
+            if stage == TASK_RAW:
+                try:
+                    one_swath = products_created[product_name] = future.result()
+                except (ValueError, OSError):
+                    LOG.error("Could not create raw product '%s'", product_name)
+                    LOG.debug("Debug: ", exc_info=True)
+                    if self.exit_on_error:
+                        raise
+                    continue
+
+                if product_name in products:
+                    # the user wants this product
+                    scene[product_name] = one_swath
+                continue
 
             try:
-                LOG.info("Creating secondary product '%s'", product_name)
-                one_swath = product_func(product_name, swath_def, products_created)
+                one_swath = future.result()
             except (ValueError, OSError, KeyError):
                 LOG.error("Could not create product (unexpected error): '%s'", product_name)
                 LOG.debug("Could not create product (unexpected error): '%s'", product_name, exc_info=True)
@@ -984,6 +1010,11 @@ def add_frontend_argument_groups(parser):
     group = parser.add_argument_group(title=group_title, description="swath extraction initialization options")
     group.add_argument("--list-products", dest="list_products", action="store_true",
                         help="List available frontend products")
+    group.add_argument("--file-catalog", dest="file_catalog",
+                       help="JSON file to cache input file information between runs (default: $P2G_FILE_CATALOG)")
+    group.add_argument("--num-workers", dest="num_workers", type=int,
+                       default=int(os.environ.get("P2G_FRONTEND_NUM_WORKERS", 1)),
+                       help="Number of independent products to create at the same time (default: 1)")
     group_title = "Frontend Swath Extraction"
     group = parser.add_argument_group(title=group_title, description="swath extraction options")
     group.add_argument("--bt-channels", dest="all_bt_channels", action='store_true',
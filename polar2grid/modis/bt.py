@@ -43,6 +43,8 @@ Documentation: http://www.ssec.wisc.edu/software/polar2grid/
 """
 __docformat__ = "restructuredtext en"
 
+from functools import lru_cache
+
 # copypasta! 
 BT_FORTRAN = """
       REAL FUNCTION MODIS_BRIGHT_SHIFT(RAD, BAND, UNITS)
@@ -361,7 +363,7 @@ def wnum_bt(v, r):
     return zult
 
 
-def bright_shift(platform, rad, band, units="micron"):
+def bright_shift(platform, rad, band, units="micron", scale=None, offset=None):
     """compute brightness temperature for MODIS on Terra and Aqua
 
     :arg platform: "Terra" or "Aqua"
@@ -369,6 +371,8 @@ def bright_shift(platform, rad, band, units="micron"):
     :arg band: band number
     :keyword units: "micron" implying Watts per square meter per steradian per micron for radiance
             or "wavenumber" implying milliWatts per square meter per steradian per wavenumber
+    :keyword scale: radiance scale of `rad` if it is scaled integers (see `bright_shift_scaled`)
+    :keyword offset: radiance offset of `rad` if it is scaled integers (see `bright_shift_scaled`)
     
     .. note::
     
@@ -376,6 +380,9 @@ def bright_shift(platform, rad, band, units="micron"):
         could not be processed
 
     """    
+    if scale is not None and offset is not None and np.issubdtype(rad.dtype, np.integer):
+        return bright_shift_scaled(platform, rad, band, scale, offset, units=units, dtype=np.float64)
+
     offset = (band - 20) if (band <= 25) else (band - 21)
     assert(offset >=0 and offset <16)
     C = _coeffs(platform, offset)
@@ -389,6 +396,56 @@ def bright_shift(platform, rad, band, units="micron"):
         raise ValueError("units must be 'wavenumber' or 'micron'")
 
 
+# MODIS L1B emissive radiances are stored as 16-bit scaled integers, valid values are 0-32767
+NUM_SCALED_VALUES = 2**16
+MAX_VALID_SCALED_VALUE = 32767
+
+
+@lru_cache(maxsize=64)
+def bt_lookup_table(platform, band, scale, offset, units="micron", dtype=np.float32):
+    """Brightness temperature for every possible 16-bit scaled integer radiance of a band.
+
+    Radiance is ``scale * (scaled_integer - offset)`` as described by the L1B `radiance_scales` and
+    `radiance_offsets` attributes. Entries for values outside the valid range (fill, saturation, etc.) are NaN.
+    The returned array is shared between callers and is read-only.
+    """
+    scaled_values = np.arange(NUM_SCALED_VALUES, dtype=np.float64)
+    rad = (scaled_values - offset) * scale
+    rad[MAX_VALID_SCALED_VALUE + 1:] = np.nan
+    with np.errstate(invalid="ignore"):
+        lut = bright_shift(platform, rad, band, units=units).astype(dtype)
+    lut.flags.writeable = False
+    return lut
+
+
+def bright_shift_scaled(platform, scaled_rad, band, scale, offset, units="micron", dtype=np.float32, out=None):
+    """compute brightness temperature for MODIS on Terra and Aqua from scaled integer radiances
+
+    Instead of evaluating the planck function for every pixel, a lookup table of every possible scaled
+    value is computed once per platform, band, scale, and offset (see `bt_lookup_table`) and the result is
+    a single gather from that table.
+
+    :arg platform: "Terra" or "Aqua"
+    :arg scaled_rad: 8 or 16-bit integer scaled radiances, arbitrary shape
+    :arg band: band number
+    :arg scale: radiance scale for this band (`radiance_scales` attribute)
+    :arg offset: radiance offset for this band (`radiance_offsets` attribute)
+    :keyword units: units of the unscaled radiances, see `bright_shift`
+    :keyword dtype: data type of the returned brightness temperatures
+    :keyword out: optional array to write the brightness temperatures to
+
+    """
+    if not np.issubdtype(scaled_rad.dtype, np.integer) or scaled_rad.dtype.itemsize > 2:
+        raise ValueError("scaled radiances must be 8 or 16-bit integers, not '%s'" % (scaled_rad.dtype,))
+    if scaled_rad.dtype.itemsize == 2:
+        # signed values are reinterpreted as unsigned so negative values land in the invalid (NaN) entries
+        indexes = scaled_rad.view(np.uint16)
+    else:
+        indexes = scaled_rad.astype(np.uint16)
+    lut = bt_lookup_table(platform, band, float(scale), float(offset), units=units, dtype=np.dtype(dtype))
+    return np.take(lut, indexes, out=out)
+
+
 def _test1():
     from pprint import pprint
     shape = (147, 31) # arbitrary image-like
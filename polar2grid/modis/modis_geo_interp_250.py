@@ -38,7 +38,6 @@
 """
 
 import numpy as np
-from scipy.ndimage.interpolation import map_coordinates
 
 import logging
 
@@ -72,82 +71,112 @@ def get_lats_from_cartesian(x__, y__, z__, thr=0.8):
     return lats
 
 
-def interpolate_geolocation_cartesian(lon_array, lat_array, res_factor=4):
+def _linear_indexes(coords, size):
+    """Neighbor indexes and weight of the second neighbor for linear interpolation at `coords`.
+
+    Coordinates outside of the array use the nearest edge value like ``map_coordinates(..., mode='nearest')``.
+    """
+    floor_coords = np.floor(coords)
+    idx0 = np.clip(floor_coords, 0, size - 1).astype(np.intp)
+    idx1 = np.clip(floor_coords + 1, 0, size - 1).astype(np.intp)
+    return idx0, idx1, coords - floor_coords
+
+
+def _interp_axis(arr, idx0, idx1, weight, axis):
+    """Linearly interpolate `arr` along `axis` using neighbor indexes and weights from `_linear_indexes`."""
+    result = arr.take(idx0, axis=axis)
+    result *= 1 - weight
+    second = arr.take(idx1, axis=axis)
+    second *= weight
+    result += second
+    return result
+
+
+def _extrapolate_rows(result_array, y, src_row1, src_row2, dst_rows):
+    """Linearly extrapolate `dst_rows` of every scan from two other rows of the same scan.
+
+    :param result_array: Interpolated data with shape (scans, rows per scan, columns)
+    :param y: Row coordinate for each row of a scan
+    """
+    m = (result_array[:, src_row2] - result_array[:, src_row1]) / (y[src_row2] - y[src_row1])
+    b = result_array[:, src_row2] - m * y[src_row2]
+    for dst_row in dst_rows:
+        result_array[:, dst_row] = m * y[dst_row] + b
+
+
+def interpolate_geolocation_cartesian(lon_array, lat_array, res_factor=4, dtype=np.float64, scans_per_block=None):
     """Interpolate MODIS navigation from 1000m resolution to 250m.
 
     Python rewrite of the IDL function ``MODIS_GEO_INTERP_250`` but converts to cartesian (X, Y, Z) coordinates
     first to avoid problems with the anti-meridian/poles.
 
+    All scans are interpolated at once by treating the data as a (scan, row, column) array. The cartesian
+    coordinates are computed in `dtype` and, if `scans_per_block` is specified, only that many scans are
+    interpolated at a time. Using ``numpy.float32`` and/or a small number of scans per block greatly reduces
+    the memory needed for the full resolution X/Y/Z arrays.
+
     :param lon_array: MODIS 1km longitude array
     :param lat_array: MODIS 1km latitude array
+    :param res_factor: 4 for 250m and 2 for 500m
+    :param dtype: Data type to do the cartesian interpolation in
+    :param scans_per_block: Number of scans to interpolate at a time (default: all scans)
 
-    :returns: MODIS 250m latitude array or 250m longitude array
-
-    If we are going from 1000m to 250m we have 4 times the size of the original
-    If we are going from 1000m to 250m we have 2 times the size of the original
+    :returns: MODIS 250m (or 500m) longitude and latitude arrays
     """
-    num_rows,num_cols = lon_array.shape
+    num_rows, num_cols = lon_array.shape
     num_scans = int(num_rows / ROWS_PER_SCAN)
+    scans_per_block = scans_per_block or max(num_scans, 1)
+    rows_per_new_scan = ROWS_PER_SCAN * res_factor
 
-    lons_rad = np.radians(lon_array)
-    lats_rad = np.radians(lat_array)
-    x_in = EARTH_RADIUS * np.cos(lats_rad) * np.cos(lons_rad)
-    y_in = EARTH_RADIUS * np.cos(lats_rad) * np.sin(lons_rad)
-    z_in = EARTH_RADIUS * np.sin(lats_rad)
-
-    # Create an array of indexes that we want our result to have
+    # Column and row (in a scan) coordinates that we want our result to have
     x = np.arange(res_factor * num_cols, dtype=np.float32) * (1./res_factor)
     # 0.375 for 250m, 0.25 for 500m
-    y = np.arange(res_factor * ROWS_PER_SCAN, dtype=np.float32) * (1./res_factor) - (res_factor * (1./16) + (1./8))
-    x,y = np.meshgrid(x,y)
-    coordinates = np.array([y,x]) # Used by map_coordinates, major optimization
-
-    new_x = np.empty((num_rows * res_factor, num_cols * res_factor), dtype=np.float64)
-    new_y = new_x.copy()
-    new_z = new_x.copy()
-    nav_arrays = [(x_in, new_x), (y_in, new_y), (z_in, new_z)]
-
-    # Interpolate each scan, one at a time, otherwise the math doesn't work well
-    for scan_idx in range(num_scans):
-        # Calculate indexes
-        j0 = ROWS_PER_SCAN              * scan_idx
-        j1 = j0 + ROWS_PER_SCAN
-        k0 = ROWS_PER_SCAN * res_factor * scan_idx
-        k1 = k0 + ROWS_PER_SCAN * res_factor
-
-        for nav_array, result_array in nav_arrays:
-            # Use bilinear interpolation for all 250 meter pixels
-            map_coordinates(nav_array[ j0:j1, : ], coordinates, output=result_array[ k0:k1, : ], order=1, mode='nearest')
-
+    y = np.arange(rows_per_new_scan, dtype=np.float32) * (1./res_factor) - (res_factor * (1./16) + (1./8))
+    x0, x1, x_weight = _linear_indexes(x.astype(dtype), num_cols)
+    y0, y1, y_weight = _linear_indexes(y.astype(dtype), ROWS_PER_SCAN)
+    y_weight = y_weight[:, None]
+    y = y.astype(dtype)
+
+    new_lons = np.full((num_rows * res_factor, num_cols * res_factor), np.nan, dtype=lon_array.dtype)
+    new_lats = np.full((num_rows * res_factor, num_cols * res_factor), np.nan, dtype=lat_array.dtype)
+    for scan_start in range(0, num_scans, scans_per_block):
+        scan_end = min(scan_start + scans_per_block, num_scans)
+        j0 = ROWS_PER_SCAN * scan_start
+        j1 = ROWS_PER_SCAN * scan_end
+        k0 = rows_per_new_scan * scan_start
+        k1 = rows_per_new_scan * scan_end
+
+        lons_rad = np.radians(lon_array[j0:j1].astype(dtype)).reshape((-1, ROWS_PER_SCAN, num_cols))
+        lats_rad = np.radians(lat_array[j0:j1].astype(dtype)).reshape((-1, ROWS_PER_SCAN, num_cols))
+        cos_lats = np.cos(lats_rad)
+        nav_arrays = [
+            EARTH_RADIUS * cos_lats * np.cos(lons_rad),
+            EARTH_RADIUS * cos_lats * np.sin(lons_rad),
+            EARTH_RADIUS * np.sin(lats_rad),
+        ]
+        del lons_rad, lats_rad, cos_lats
+
+        for idx, nav_array in enumerate(nav_arrays):
+            # bilinear interpolation for all pixels of every scan: first along the columns, then along the rows
+            result_array = _interp_axis(nav_array, x0, x1, x_weight, axis=2)
+            result_array = _interp_axis(result_array, y0, y1, y_weight, axis=1)
             if res_factor == 4:
-                # Use linear extrapolation for the first two 250 meter pixels along track
-                m = (result_array[ k0 + 5, : ] - result_array[ k0 + 2, : ]) / (y[5,0] - y[2,0])
-                b = result_array[ k0 + 5, : ] - m * y[5,0]
-                result_array[ k0 + 0, : ] = m * y[0,0] + b
-                result_array[ k0 + 1, : ] = m * y[1,0] + b
-
-                # Use linear extrapolation for the last  two 250 meter pixels along track
-                m = (result_array[ k0 + 37, : ] - result_array[ k0 + 34, : ]) / (y[37,0] - y[34,0])
-                b = result_array[ k0 + 37, : ] - m * y[37,0]
-                result_array[ k0 + 38, : ] = m * y[38,0] + b
-                result_array[ k0 + 39, : ] = m * y[39,0] + b
+                # Use linear extrapolation for the first two and last two 250 meter pixels along track
+                _extrapolate_rows(result_array, y, 2, 5, (0, 1))
+                _extrapolate_rows(result_array, y, 34, 37, (38, 39))
             else:
-                # 500m
-                # Use linear extrapolation for the first two 250 meter pixels along track
-                m = (result_array[ k0 + 2, : ] - result_array[ k0 + 1, : ]) / (y[2,0] - y[1,0])
-                b = result_array[ k0 + 2, : ] - m * y[2,0]
-                result_array[ k0 + 0, : ] = m * y[0,0] + b
-
-                # Use linear extrapolation for the last  two 250 meter pixels along track
-                m = (result_array[ k0 + 18, : ] - result_array[ k0 + 17, : ]) / (y[18,0] - y[17,0])
-                b = result_array[ k0 + 18, : ] - m * y[18,0]
-                result_array[ k0 + 19, : ] = m * y[19,0] + b
-
-    # Convert from cartesian to lat/lon space
-    new_lons = get_lons_from_cartesian(new_x, new_y)
-    new_lats = get_lats_from_cartesian(new_x, new_y, new_z)
-
-    return new_lons.astype(lon_array.dtype), new_lats.astype(lat_array.dtype)
+                # 500m, first and last 500 meter pixel along track
+                _extrapolate_rows(result_array, y, 1, 2, (0,))
+                _extrapolate_rows(result_array, y, 17, 18, (19,))
+            nav_arrays[idx] = result_array.reshape((k1 - k0, -1))
+
+        # Convert from cartesian to lat/lon space
+        # arctan2 is used for the longitudes because arccos loses too much precision near 0/180 in 32-bit floats
+        new_x, new_y, new_z = nav_arrays
+        new_lons[k0:k1] = np.rad2deg(np.arctan2(new_y, new_x))
+        new_lats[k0:k1] = get_lats_from_cartesian(new_x, new_y, new_z)
+
+    return new_lons, new_lats
 
 
 # def interpolate_geolocation(nav_array):
@@ -39,18 +39,23 @@
 """
 __docformat__ = "restructuredtext en"
 
-from polar2grid.core.frontend_utils import BaseFileReader, BaseMultiFileReader
+from polar2grid.core.frontend_utils import BaseFileReader, BaseMultiFileReader, FILE_ACCESS_LOCK
 from polar2grid.modis.modis_geo_interp_250 import interpolate_geolocation_cartesian
 
 import os
 import logging
+import threading
 
+from collections import OrderedDict
 from datetime import datetime
 from pyhdf import SD
 import numpy
 
 LOG = logging.getLogger(__name__)
 
+# number of scans to interpolate to 250m/500m at a time, limits the memory used by the full resolution X/Y/Z arrays
+NAV_INTERP_SCANS_PER_BLOCK = 20
+
 # file keys
 K_LONGITUDE = "longitude_var"
 K_LATITUDE = "latitude_var"
@@ -91,6 +96,8 @@ K_SLST = "slst_var"
 K_NDVI = "ndvi_var"
 K_SZA = "sza_var"
 K_SenZA = "senza_var"
+K_SAA = "saa_var"
+K_SenAA = "senaa_var"
 K_IST = "ist_var"
 K_INV = "inv_var"
 K_IND = "ind_var"
@@ -105,90 +112,98 @@ def mask_helper(data, fill_value):
     return data == fill_value
 
 
+# process-wide cache of parsed metadata, see `HDFEOSReader.get_metadata`
+# least recently used entries are removed once there are more than `MAX_METADATA_CACHE_SIZE`
+MAX_METADATA_CACHE_SIZE = 256
+_METADATA_CACHE = OrderedDict()
+_METADATA_CACHE_LOCK = threading.Lock()
+
+
+def _get_cached_metadata(cache_key):
+    with _METADATA_CACHE_LOCK:
+        metadata = _METADATA_CACHE.get(cache_key)
+        if metadata is not None:
+            _METADATA_CACHE.move_to_end(cache_key)
+        return metadata
+
+
+def _cache_metadata(cache_key, metadata):
+    with _METADATA_CACHE_LOCK:
+        metadata = _METADATA_CACHE.setdefault(cache_key, metadata)
+        _METADATA_CACHE.move_to_end(cache_key)
+        while len(_METADATA_CACHE) > MAX_METADATA_CACHE_SIZE:
+            _METADATA_CACHE.popitem(last=False)
+        return metadata
+
+
+def _odl_statements(metadata_str):
+    """Iterate over the "KEY = VALUE" statements of ODL text, joining values continued on following lines.
+    """
+    key = None
+    val = None
+    for line in metadata_str.splitlines():
+        line_key, sep, line_val = line.partition("=")
+        if sep:
+            if key is not None:
+                yield key, val
+            key = line_key.strip()
+            val = line_val.strip()
+        elif key is not None:
+            line = line.strip()
+            if line and line != "END":
+                val += line
+    if key is not None:
+        yield key, val
+
+
 class HDFEOSMetadata(dict):
     """Basic Metadata parser for MODIS HDF-EOS files.
 
-    This parser could probably be done better, but no one seems to know specifics about the Metadata format.
+    Parses the ODL text of the 'CoreMetadata.0' and 'StructMetadata.0' style global attributes in one pass in to
+    a flat dictionary keyed by the '/' separated path of GROUP and OBJECT names
+    (ex. "/INVENTORYMETADATA/RANGEDATETIME/RANGEBEGINNINGDATE"). Plain "KEY = VALUE" statements inside a group
+    or object (used by 'StructMetadata') are added with the key appended to the path.
     """
     def __init__(self, metadata_str):
         super(HDFEOSMetadata, self).__init__()
-        metadata_lines = [x.strip() for x in metadata_str.split("\n") if x]
-
-        # Check that we have a fully constructed metadata dictionary
-        assert(metadata_lines[0].split("=")[0].strip() == "GROUP")
-        group_type_key, group_type = metadata_lines[1].split("=")
-        assert(group_type_key.strip() == "GROUPTYPE" and group_type.strip() == "MASTERGROUP")
-        assert(metadata_lines[-1] == "END")
-
-        # We only want the stuff inside
-        # Add special value to END keyword because why would consistency matter
-        metadata_key_values = [(line.split("=")[0].strip(), line.split("=")[1].strip()) for line in metadata_lines[:-1]] + [("END", "END")]
-        self._recurse_metadata_lines(metadata_key_values)
-
-    def _recurse_metadata_lines(self, key_values, current_idx=0, current_prefix=""):
-        current_key, current_val = key_values[current_idx]
-        # print "Info: ", current_prefix, current_idx, current_key, current_val
-        if current_idx >= len(key_values):
-            return current_idx + 1
-
-        if current_key == "OBJECT":
-            this_prefix = "/%s" % (current_val,)
-            current_prefix += this_prefix
-            current_object_val = None
-            current_object_num_vals = None
-            current_idx += 1
-            current_key, current_val = key_values[current_idx]
-            # we are starting an object
-            while current_key != "END_OBJECT":
-                if current_key == "NUM_VAL":
-                    current_object_num_vals = int(current_val)
-                elif current_key == "VALUE":
-                    current_object_val = current_val
-                elif current_key == "CLASS":
-                    # not sure what this is used for or what it means
-                    pass
-                elif current_key == "OBJECT" or current_key == "GROUP":
-                    # go process this object or group which could be recursive
-                    # since we are a container object we don't have any specific value to add so return to parent
-                    while current_key != "END_OBJECT":
-                        current_idx = self._recurse_metadata_lines(key_values, current_idx=current_idx, current_prefix=current_prefix)
-                        current_key, current_val = key_values[current_idx]
-                    LOG.debug("End of container object: %s", current_prefix)
-                    return current_idx + 1
-                else:
-                    LOG.warning("Unknown key/value: %s = %s", current_key, current_val)
-
-                current_idx += 1
-                current_key, current_val = key_values[current_idx]
-
-            if current_object_num_vals != 1:
-                current_object_val = tuple(current_object_val[1:-1].split(","))
+        metadata_str = metadata_str.rstrip("\x00 \t\r\n")
+        if not metadata_str.endswith("END"):
+            raise ValueError("Could not properly parse HDF-EOS Metadata: missing 'END'")
+
+        # stack of [prefix, is_object, num_val, value] for each open GROUP/OBJECT
+        stack = []
+        prefix = ""
+        for key, val in _odl_statements(metadata_str):
+            if key == "GROUP" or key == "OBJECT":
+                if stack:
+                    # an object containing other objects or groups is only a container, it has no value
+                    stack[-1][1] = False
+                prefix = "%s/%s" % (prefix, val)
+                stack.append([prefix, key == "OBJECT", None, None])
+            elif key == "END_GROUP" or key == "END_OBJECT":
+                if not stack:
+                    raise ValueError("Could not properly parse HDF-EOS Metadata: unexpected '%s'" % (key,))
+                this_prefix, is_object, num_val, object_val = stack.pop()
+                if is_object and object_val is not None:
+                    if num_val != 1:
+                        object_val = tuple(object_val[1:-1].split(","))
+                    else:
+                        # remove quotation marks
+                        object_val = object_val.replace("\"", "")
+                    self[this_prefix] = object_val
+                prefix = stack[-1][0] if stack else ""
+            elif key == "GROUPTYPE" or key == "CLASS":
+                # passive group information, we don't know what to do with this
+                continue
+            elif stack and stack[-1][1] and key == "NUM_VAL":
+                stack[-1][2] = int(val)
+            elif stack and stack[-1][1] and key == "VALUE":
+                stack[-1][3] = val
             else:
-                # remove quotation marks
-                current_object_val = current_object_val.replace("\"", "")
-            LOG.debug("Adding metadata: %s = %r", current_prefix, current_object_val)
-            self[current_prefix] = current_object_val
-            return current_idx+1
-        elif current_key == "GROUP":
-            this_prefix = "/%s" % (current_val,)
-            current_prefix += this_prefix
-            current_idx += 1
-            current_key, current_val = key_values[current_idx]
-            # process everything in this group
-            while current_key != "END_GROUP":
-                current_idx = self._recurse_metadata_lines(key_values, current_idx=current_idx, current_prefix=current_prefix)
-                current_key, current_val = key_values[current_idx]
-            # we are done with the group and the parent should keep moving on
-            LOG.debug("End of group: %s", current_prefix)
-            return current_idx + 1
-        elif current_key == "GROUPTYPE":
-            # passive group thing, just keep moving on
-            return current_idx + 1
-        elif current_key == "CLASS":
-            # we don't know what to do with this
-            return current_idx + 1
-        else:
-            raise RuntimeError("Could not properly parse HDF-EOS Metadata")
+                self["%s/%s" % (prefix, key)] = val.replace("\"", "")
+
+        if stack:
+            raise ValueError("Could not properly parse HDF-EOS Metadata: '%s' was never closed" % (stack[-1][0],))
 
 
 class HDFReader(object):
@@ -315,6 +330,7 @@ class HDFEOSReader(HDFReader):
 
     def __init__(self, filename):
         super(HDFEOSReader, self).__init__(filename)
+        self._end_time = None
 
         # handle meta data
         try:
@@ -326,40 +342,72 @@ class HDFEOSReader(HDFReader):
                 self.instrument = "modis"
                 parts = fn.split(".")
                 self.begin_time = datetime.strptime(parts[1][1:] + parts[2], "%Y%j%H%M")
-                # we don't know the end time from the filename
-                self.end_time = self.begin_time
                 self.file_type = self.MODIS2FILETYPE[parts[0][3:]]
             else:
                 self.satellite = "aqua" if fn[0] == "a" else "terra"
                 self.instrument = "modis"
                 parts = fn.split(".")
                 self.begin_time = datetime.strptime(parts[1] + parts[2], "%y%j%H%M")
-                # we don't know the end time from the filename
-                self.end_time = self.begin_time
                 file_type_str = ".".join(parts[3:-1])
                 self.file_type = self.MODIS2FILETYPE[file_type_str]
+        except (IndexError, KeyError, ValueError):
+            LOG.debug("Could not get file information from filename, will try file metadata: %s", filename)
+            self._read_info_from_metadata()
+        except OSError:
+            LOG.debug("Could not parse HDF-EOS file", exc_info=True)
+            raise ValueError("Could not parse HDF-EOS file (see debug log for details)")
 
-            # Get file type and satellite from the information in the file
-            # try:
-            #     metadata_str = self["." + self.METADATA_ATTR_NAME]
-            #     self.meta = HDFEOSMetadata(metadata_str)
-            #
-            #     # begin_time_str = self.meta[self.METADATA_SDATE] + self.meta[self.METADATA_STIME]
-            #     # end_time_str = self.meta[self.METADATA_EDATE] + self.meta[self.METADATA_ETIME]
-            #     # self.begin_time = datetime.strptime(begin_time_str.split(".")[0], "%Y-%m-%d%H:%M:%S")
-            #     # self.begin_time.replace(microsecond=int(begin_time_str.split(".")[1]))
-            #     # self.end_time = datetime.strptime(end_time_str.split(".")[0], "%Y-%m-%d%H:%M:%S")
-            #     # self.end_time.replace(microsecond=int(end_time_str.split(".")[1]))
-            #     self.instrument = self.meta[self.METADATA_INSTRUMENT]
-            #     file_type_str = self.meta[self.METADATA_FILE_TYPE]
-            #     self.file_type = self.MODIS2FILETYPE[file_type_str[3:]]
-            #     self.satellite = "aqua" if file_type_str.startswith("MYD") else "terra"
-            # except KeyError:
-            #     pass
-        except (OSError, ValueError):
+    def _read_info_from_metadata(self):
+        try:
+            meta = self.get_metadata()
+            self.begin_time = self._metadata_time(meta, self.METADATA_SDATE, self.METADATA_STIME)
+            self._end_time = self._metadata_time(meta, self.METADATA_EDATE, self.METADATA_ETIME)
+            self.instrument = meta[self.METADATA_INSTRUMENT].lower()
+            file_type_str = meta[self.METADATA_FILE_TYPE]
+            self.file_type = self.MODIS2FILETYPE[file_type_str[3:]]
+            self.satellite = "aqua" if file_type_str.startswith("MYD") else "terra"
+        except (KeyError, ValueError):
             LOG.debug("Could not parse HDF-EOS file", exc_info=True)
             raise ValueError("Could not parse HDF-EOS file (see debug log for details)")
 
+    @staticmethod
+    def _metadata_time(meta, date_key, time_key):
+        return datetime.strptime(meta[date_key] + meta[time_key].split(".")[0], "%Y-%m-%d%H:%M:%S")
+
+    @property
+    def end_time(self):
+        """End time of the file's observations from the 'CoreMetadata.0' attribute.
+
+        The filename doesn't include the end time so the metadata is only read when this is first needed. If it
+        can't be read the begin time is used.
+        """
+        if self._end_time is None:
+            try:
+                self._end_time = self._metadata_time(self.get_metadata(), self.METADATA_EDATE, self.METADATA_ETIME)
+            except (KeyError, ValueError):
+                LOG.debug("Could not get end time from metadata, using begin time: %s", self.filename)
+                self._end_time = self.begin_time
+        return self._end_time
+
+    @end_time.setter
+    def end_time(self, value):
+        self._end_time = value
+
+    def get_metadata(self, attr_name=METADATA_ATTR_NAME):
+        """Parsed `HDFEOSMetadata` for the specified global attribute (ex. "StructMetadata\\.0").
+
+        Parsed metadata is cached and shared between readers of the same file, as long as the file's size and
+        modification time don't change, so classifying and then reading a file only parses its metadata once. Only
+        the `MAX_METADATA_CACHE_SIZE` most recently used entries are kept. The returned dictionary should not be
+        modified.
+        """
+        st = os.stat(self.filepath)
+        cache_key = (self.filepath, st.st_size, st.st_mtime_ns, attr_name)
+        metadata = _get_cached_metadata(cache_key)
+        if metadata is None:
+            metadata = _cache_metadata(cache_key, HDFEOSMetadata(self["." + attr_name]))
+        return metadata
+
 
 class FileReader(BaseFileReader):
     """Basic file wrapper that uses a `file_type_info` dictionary to map common key names to complex
@@ -370,6 +418,7 @@ class FileReader(BaseFileReader):
     SATURATION_VALUE = 65533
     # if a value couldn't be aggregated from 250m/500m to 1km then we should clip those too
     CANT_AGGR_VALUE = 65528
+    _end_time = None
 
     def __init__(self, filename_or_hdf_obj, file_type_info):
         if isinstance(filename_or_hdf_obj, str):
@@ -379,12 +428,24 @@ class FileReader(BaseFileReader):
         self.instrument = self.file_handle.instrument.lower()
         self.satellite = self.file_handle.satellite.lower()
         self.begin_time = self.file_handle.begin_time
-        self.end_time = self.file_handle.end_time
         # special hack for storing the 250m resolution navigation
         self.nav_interpolation = {
             "250": [None, None],
             "500": [None, None],
         }
+        # optional `polar2grid.core.geo_cache.GeolocationCache` to reuse interpolated navigation between runs
+        self.geo_cache = None
+
+    @property
+    def end_time(self):
+        # only read from the file (see `HDFEOSReader.end_time`) when needed
+        if self._end_time is None:
+            return self.file_handle.end_time
+        return self._end_time
+
+    @end_time.setter
+    def end_time(self, value):
+        self._end_time = value
 
     def __getitem__(self, item):
         known_item = self.file_type_info.get(item, item)
@@ -397,12 +458,65 @@ class FileReader(BaseFileReader):
         LOG.debug("Loading %s from %s", known_item, self.filename)
         return self.file_handle[known_item]
 
+    def get_swath_shape(self, item):
+        var_info = self.file_type_info.get(item)
+        shape = self[var_info.var_name].info()[2]
+        shape = tuple(shape) if isinstance(shape, (tuple, list)) else (shape,)
+        if var_info.index is not None:
+            shape = shape[1:]
+        if var_info.interpolate:
+            res_factor = 4 if item in [K_LONGITUDE_250, K_LATITUDE_250] else 2
+            shape = tuple(dim * res_factor for dim in shape)
+        return shape
+
+    def _get_interpolation_info(self, item):
+        """Get the cache key, longitude key, latitude key, and resolution factor for an interpolated navigation item.
+        """
+        if item in [K_LONGITUDE_250, K_LATITUDE_250]:
+            return "250", K_LONGITUDE_250, K_LATITUDE_250, 4
+        elif item in [K_LONGITUDE_500, K_LATITUDE_500]:
+            return "500", K_LONGITUDE_500, K_LATITUDE_500, 2
+        raise ValueError("Don't know how to interpolate item '%s'" % (item,))
+
+    def _get_geo_cache_key(self, cache_key, res_factor, fill):
+        return self.geo_cache.key(self.filepath, "modis_%sm" % (cache_key,), res_factor=res_factor, fill=float(fill))
+
+    def get_scaled_swath_data(self, item):
+        """Get the integer data for `item` as stored in the file along with its scale and offset.
+
+        The unscaled value is ``scale * (data - offset)``. No masking is done.
+
+        :raises ValueError: if the variable isn't stored as integers or has no scale or offset
+        """
+        var_info = self.file_type_info.get(item)
+        if var_info is None or var_info.interpolate or var_info.bit_mask is not None or \
+                not var_info.scale_attr_name or not var_info.offset_attr_name:
+            raise ValueError("'%s' isn't stored as scaled integers" % (item,))
+        data = self[var_info.var_name].get()
+        if var_info.index is not None:
+            data = data[var_info.index]
+        if not numpy.issubdtype(data.dtype, numpy.integer):
+            raise ValueError("'%s' isn't stored as scaled integers" % (item,))
+        scale_value = self[var_info.var_name + "." + var_info.scale_attr_name]
+        offset_value = self[var_info.var_name + "." + var_info.offset_attr_name]
+        if var_info.index is not None:
+            scale_value = scale_value[var_info.index]
+            offset_value = offset_value[var_info.index]
+        return data, float(scale_value), float(offset_value)
+
     def get_swath_data(self, item, fill=None):
         """Retrieve the item asked for then set it to the specified data type, scale it, and mask it.
         """
         if fill is None:
             fill = self.get_fill_value(item)
         var_info = self.file_type_info.get(item)
+        if var_info.interpolate and self.geo_cache is not None:
+            cache_key, lon_key, lat_key, res_factor = self._get_interpolation_info(item)
+            cached = self.geo_cache.get(self._get_geo_cache_key(cache_key, res_factor, fill))
+            if cached is not None:
+                LOG.debug("Using cached %sm resolution geolocation data for %s", cache_key, self.filename)
+                return cached[0] if item == lon_key else cached[1]
+
         variable = self[var_info.var_name]
         data = variable.get()
         if var_info.index is not None:
@@ -478,18 +592,7 @@ class FileReader(BaseFileReader):
             if mask is not None:
                 data[mask] = numpy.nan
 
-            if item in [K_LONGITUDE_250, K_LATITUDE_250]:
-                cache_key = "250"
-                lon_key = K_LONGITUDE_250
-                lat_key = K_LATITUDE_250
-                res_factor = 4
-            elif item in [K_LONGITUDE_500, K_LATITUDE_500]:
-                cache_key = "500"
-                lon_key = K_LONGITUDE_500
-                lat_key = K_LATITUDE_500
-                res_factor = 2
-            else:
-                raise ValueError("Don't know how to interpolate item '%s'" % (item,))
+            cache_key, lon_key, lat_key, res_factor = self._get_interpolation_info(item)
 
             if self.nav_interpolation[cache_key][0] is not None and self.nav_interpolation[cache_key][1] is not None:
                 LOG.debug("Returning previously interpolated %sm resolution geolocation data", cache_key)
@@ -511,10 +614,14 @@ class FileReader(BaseFileReader):
             lon_data, lat_data = self.nav_interpolation[cache_key]
 
             new_lon_data, new_lat_data = interpolate_geolocation_cartesian(lon_data, lat_data,
-                                                                           res_factor=res_factor)
+                                                                           res_factor=res_factor,
+                                                                           scans_per_block=NAV_INTERP_SCANS_PER_BLOCK)
 
             new_lon_data[numpy.isnan(new_lon_data)] = fill
             new_lat_data[numpy.isnan(new_lat_data)] = fill
+            if self.geo_cache is not None:
+                new_lon_data, new_lat_data = self.geo_cache.put(self._get_geo_cache_key(cache_key, res_factor, fill),
+                                                                new_lon_data, new_lat_data)
             # Cache the results when the user requests the other coordinate
             self.nav_interpolation[cache_key] = [new_lon_data, new_lat_data]
             data = new_lon_data if item == lon_key else new_lat_data
@@ -525,8 +632,24 @@ class FileReader(BaseFileReader):
 
 
 class MultiFileReader(BaseMultiFileReader):
-    def __init__(self, file_type_info, single_class=FileReader):
+    def __init__(self, file_type_info, single_class=FileReader, geo_cache=None):
         super(MultiFileReader, self).__init__(file_type_info, single_class)
+        self.geo_cache = geo_cache
+
+    def add_file(self, fn):
+        super(MultiFileReader, self).add_file(fn)
+        self.file_readers[-1].geo_cache = self.geo_cache
+
+    def iter_scaled_swath_data(self, item):
+        """Yield the unscaled integer data, scale, and offset for `item` from each file in order.
+
+        Scale and offset can be different for every file so they are provided per file.
+        """
+        for file_reader in self.file_readers:
+            # don't hold the lock while the caller uses the data
+            with FILE_ACCESS_LOCK:
+                scaled_data = file_reader.get_scaled_swath_data(item)
+            yield scaled_data
 
 
 class FileInfo(object):
@@ -558,6 +681,8 @@ FILE_TYPES[FT_MOD03] = {
     K_LATITUDE_500: FileInfo("Latitude", interpolate=True),
     K_SZA: FileInfo("SolarZenith", offset_attr_name=None),
     K_SenZA: FileInfo("SensorZenith", offset_attr_name=None),
+    K_SAA: FileInfo("SolarAzimuth", offset_attr_name=None),
+    K_SenAA: FileInfo("SensorAzimuth", offset_attr_name=None),
 }
 FILE_TYPES[FT_MOD021KM] = {
     K_VIS01: FileInfo("EV_250_Aggr1km_RefSB", 0, "reflectance_scales", "reflectance_offsets"),
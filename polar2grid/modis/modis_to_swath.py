@@ -170,9 +170,9 @@ import os
 import shutil
 
 from polar2grid.core import roles, histogram, containers
-from polar2grid.core.frontend_utils import ProductDict, GeoPairDict
+from polar2grid.core.frontend_utils import ProductDict, GeoPairDict, TASK_RAW, run_dependent_tasks
 from polar2grid.modis import modis_guidebook as guidebook
-from polar2grid.modis.bt import bright_shift
+from polar2grid.modis.bt import bright_shift, bright_shift_scaled
 
 LOG = logging.getLogger(__name__)
 
@@ -441,8 +441,15 @@ MASK_PRODUCTS = [
 class Frontend(roles.FrontendRole):
     FILE_EXTENSIONS = [".hdf"]
 
-    def __init__(self, **kwargs):
+    def __init__(self, geo_cache_dir=None, **kwargs):
         super(Frontend, self).__init__(**kwargs)
+        geo_cache_dir = geo_cache_dir or os.environ.get("P2G_GEO_CACHE_DIR")
+        if geo_cache_dir:
+            from polar2grid.core.geo_cache import GeolocationCache
+            LOG.debug("Using geolocation cache directory '%s'", geo_cache_dir)
+            self.geo_cache = GeolocationCache(geo_cache_dir)
+        else:
+            self.geo_cache = None
         self.file_readers = {}
         self.available_file_types = []
         self.load_files(self.find_files_with_extensions())
@@ -485,24 +492,48 @@ class Frontend(roles.FrontendRole):
         This method should not be called by the user.
         """
         for file_type, file_type_info in guidebook.FILE_TYPES.items():
-            self.file_readers[file_type] = guidebook.MultiFileReader(file_type_info)
+            self.file_readers[file_type] = guidebook.MultiFileReader(file_type_info, geo_cache=self.geo_cache)
+            self.file_readers[file_type].file_catalog = self.file_catalog
 
         # Don't modify the passed list (we use in place operations)
         file_paths_left = []
         for fp in file_paths:
+            # cataloged files aren't opened until their data is read
+            h = None
+            if self.file_catalog is not None:
+                h = self.file_catalog.get_file_handle(fp, guidebook.HDFEOSReader)
+            if h is not None:
+                if h.file_type in self.file_readers:
+                    self.file_readers[h.file_type].add_file(h)
+                else:
+                    # we've seen this file before and didn't know what to do with it
+                    LOG.debug("File catalog says file is not a usable HDF-EOS file: %s", fp)
+                    file_paths_left.append(fp)
+                continue
+
             try:
                 h = guidebook.HDFEOSReader(fp)
                 LOG.debug("Recognize file %s as file type %s", fp, h.file_type)
                 if h.file_type in self.file_readers:
                     self.file_readers[h.file_type].add_file(h)
+                    if self.file_catalog is not None:
+                        self.file_catalog.update_from_reader(self.file_readers[h.file_type].file_readers[-1],
+                                                             h.file_type)
                 else:
                     LOG.debug("Recognized the file type, but don't know anything more about the file")
+                    if self.file_catalog is not None:
+                        self.file_catalog.update(fp, file_type=None)
             except ValueError:
                 LOG.debug("Could not parse HDF file as HDF-EOS file: %s", fp)
                 LOG.debug("File parsing error: ", exc_info=True)
+                if self.file_catalog is not None:
+                    self.file_catalog.update(fp, file_type=None)
                 file_paths_left.append(fp)
                 continue
 
+        if self.file_catalog is not None:
+            self.file_catalog.save()
+
         # Log what files we were given that we didn't understand
         for fp in file_paths_left:
             LOG.debug("Unrecognized file: %s", fp)
@@ -669,7 +700,10 @@ class Frontend(roles.FrontendRole):
         try:
             data_type = file_reader.get_data_type(file_key)
             fill_value = file_reader.get_fill_value(file_key)
-            shape = file_reader.write_var_to_flat_binary(file_key, filename, dtype=data_type)
+            swath_data = file_reader.get_swath_data(file_key, filename=filename, dtype=data_type)
+            shape = swath_data.shape
+            swath_data.flush()
+            del swath_data
             rows_per_scan = GEO_PAIRS[product_def.get_geo_pair_name(self.available_file_types)].rows_per_scan
         except (KeyError, ValueError, OSError):
             LOG.error("Could not extract data from file")
@@ -717,8 +751,7 @@ class Frontend(roles.FrontendRole):
         # Needs to be ordered (least-depended product -> most-depended product)
         products_needed = PRODUCTS.dependency_ordered_products(products)
         geo_pairs_needed = PRODUCTS.geo_pairs_for_products(products_needed, self.available_file_types)
-        # both lists below include raw products that need extra processing/masking
-        raw_products_needed = (p for p in products_needed if PRODUCTS.is_raw(p, geo_is_raw=False))
+        # includes raw products that need extra processing/masking
         secondary_products_needed = [p for p in products_needed if PRODUCTS.needs_processing(p)]
         for p in secondary_products_needed:
             if p not in self.secondary_product_functions:
@@ -752,34 +785,36 @@ class Frontend(roles.FrontendRole):
             swath_def = self.create_swath_definition(lon_swath, lat_swath)
             swath_definitions[swath_def["swath_name"]] = swath_def
 
-        # Create each raw products (products that are loaded directly from the file)
-        for product_name in raw_products_needed:
-            if product_name in products_created:
-                # already created
-                continue
-
-            try:
+        # Create raw products (loaded directly from the file) and dependent/special case products (non-raw products or
+        # raw products that need further processing), independent products may be created at the same time
+        def _create_product(task):
+            stage, product_name = task
+            if stage == TASK_RAW:
                 LOG.info("Creating data product '%s'", product_name)
                 swath_def = swath_definitions[PRODUCTS[product_name].get_geo_pair_name(self.available_file_types)]
-                one_swath = products_created[product_name] = self.create_raw_swath_object(product_name, swath_def)
-            except (ValueError, KeyError):
-                LOG.error("Could not create raw product '%s'", product_name)
-                if self.exit_on_error:
-                    raise
-                continue
-
-            if product_name in products:
-                # the user wants this product
-                scene[product_name] = one_swath
-
-        # Dependent products and Special cases (i.e. non-raw products that need further processing)
-        for product_name in reversed(secondary_products_needed):
-            product_func = self.secondary_product_functions[product_name]
+                return self.create_raw_swath_object(product_name, swath_def)
+            LOG.info("Creating secondary product '%s'", product_name)
             swath_def = swath_definitions[PRODUCTS[product_name].get_geo_pair_name(self.available_file_types)]
+            return self.secondary_product_functions[product_name](product_name, swath_def, products_created)
+
+        task_dependencies = PRODUCTS.product_task_dependencies(products_needed)
+        for (stage, product_name), future in run_dependent_tasks(task_dependencies, _create_product, self.num_workers):
+            if stage == TASK_RAW:
+                try:
+                    one_swath = products_created[product_name] = future.result()
+                except (ValueError, KeyError):
+                    LOG.error("Could not create raw product '%s'", product_name)
+                    if self.exit_on_error:
+                        raise
+                    continue
+
+                if product_name in products:
+                    # the user wants this product
+                    scene[product_name] = one_swath
+                continue
 
             try:
-                LOG.info("Creating secondary product '%s'", product_name)
-                one_swath = product_func(product_name, swath_def, products_created)
+                one_swath = future.result()
             except (ValueError, KeyError, RuntimeError, OSError):
                 LOG.error("Could not create product (unexpected error): '%s'", product_name)
                 LOG.debug("Could not create product (unexpected error): '%s'", product_name, exc_info=True)
@@ -828,6 +863,31 @@ class Frontend(roles.FrontendRole):
 
         return one_swath
 
+    def _bt_from_scaled_radiances(self, ir_product_name, platform, band_number, output_data):
+        """Compute brightness temperatures from the L1B scaled integer radiances with a lookup table.
+
+        :returns: `False` if the radiances aren't available as scaled integers and nothing was written
+        """
+        product_def = PRODUCTS[ir_product_name]
+        try:
+            file_type = product_def.get_file_type(self.available_file_types)
+            file_key = product_def.get_file_key(self.available_file_types)
+            file_reader = self.file_readers[file_type]
+            start_idx = 0
+            for scaled_rad, scale, offset in file_reader.iter_scaled_swath_data(file_key):
+                end_idx = start_idx + scaled_rad.shape[0]
+                bright_shift_scaled(platform, scaled_rad, band_number, scale, offset, dtype=output_data.dtype,
+                                    out=output_data[start_idx:end_idx])
+                start_idx = end_idx
+        except (RuntimeError, KeyError, ValueError):
+            LOG.debug("Can't use scaled radiances for %s, using unscaled radiances", ir_product_name, exc_info=True)
+            return False
+        if start_idx != output_data.shape[0]:
+            LOG.debug("Scaled radiances for %s don't match the radiance product shape", ir_product_name)
+            return False
+        LOG.debug("Computed brightness temperatures from scaled radiances for %s", ir_product_name)
+        return True
+
     def create_bt_from_ir(self, product_name, swath_definition, products_created):
         product_def = PRODUCTS[product_name]
         deps = product_def.dependencies
@@ -867,9 +927,14 @@ class Frontend(roles.FrontendRole):
                 PRODUCT_BT35: 35,
                 PRODUCT_BT36: 36,
             }[product_name]
-            # since the input and output fill value and the invalid calculation value are all NaN we don't have to do
-            # any extra calculations
-            output_data[~ir_mask] = bright_shift(sat.title(), output_data[~ir_mask], band_number)
+            if not self._bt_from_scaled_radiances(ir_product_name, sat.title(), band_number, output_data):
+                # the lookup table may have written some rows before failing
+                output_data[:] = ir_product.get_data_array()
+                # since the input and output fill value and the invalid calculation value are all NaN we don't have
+                # to do any extra calculations
+                output_data[~ir_mask] = bright_shift(sat.title(), output_data[~ir_mask], band_number)
+            else:
+                output_data[ir_mask] = numpy.nan
 
             one_swath = self.create_secondary_swath_object(product_name, swath_definition, filename,
                                                            ir_product["data_type"], products_created)
@@ -1060,6 +1125,14 @@ def add_frontend_argument_groups(parser):
     group = parser.add_argument_group(title=group_title, description="swath extraction initialization options")
     group.add_argument("--list-products", dest="list_products", action="store_true",
                        help="List available frontend products and exit")
+    group.add_argument("--file-catalog", dest="file_catalog",
+                       help="JSON file to cache input file information between runs (default: $P2G_FILE_CATALOG)")
+    group.add_argument("--num-workers", dest="num_workers", type=int,
+                       default=int(os.environ.get("P2G_FRONTEND_NUM_WORKERS", 1)),
+                       help="Number of independent products to create at the same time (default: 1)")
+    group.add_argument("--geo-cache-dir", dest="geo_cache_dir", default=os.environ.get("P2G_GEO_CACHE_DIR"),
+                       help="Directory to cache interpolated 250m/500m geolocation between runs "
+                            "(default: $P2G_GEO_CACHE_DIR)")
     group_title = "Frontend Swath Extraction"
     group = parser.add_argument_group(title=group_title, description="swath extraction options")
     group.add_argument("-p", "--products", dest="products", nargs="+", default=None, action=ExtendAction,
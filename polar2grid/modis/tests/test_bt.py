@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Tests for MODIS brightness temperature calculations.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+
+"""
+__docformat__ = "restructuredtext en"
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# the polar2grid.modis package requires pyhdf
+pytest.importorskip("pyhdf")
+from polar2grid.modis import bt  # noqa: E402
+
+
+class TestBrightShiftScaled(object):
+    @pytest.mark.parametrize(("platform", "band", "units"), [
+        ("Aqua", 31, "micron"),
+        ("Terra", 20, "micron"),
+        ("Terra", 27, "wavenumber"),
+    ])
+    def test_matches_bright_shift(self, platform, band, units):
+        rs = np.random.RandomState(0)
+        scaled_rad = rs.randint(0, 32768, size=(40, 1354)).astype(np.uint16)
+        scaled_rad[0, :10] = [65535, 65534, 65533, 65528, 32768, 0, 1, 2730, 2731, 32767]
+        scale, offset = 0.00084, 2730.0
+
+        expected = bt.bright_shift(platform, (scaled_rad.astype(np.float64) - offset) * scale, band, units=units)
+        expected[scaled_rad > bt.MAX_VALID_SCALED_VALUE] = np.nan
+        result = bt.bright_shift_scaled(platform, scaled_rad, band, scale, offset, units=units)
+        assert result.dtype == np.float32
+        np.testing.assert_array_equal(result, expected.astype(np.float32))
+        # integer inputs with a scale and offset use the lookup table
+        result = bt.bright_shift(platform, scaled_rad, band, units=units, scale=scale, offset=offset)
+        np.testing.assert_array_equal(result, expected)
+
+    def test_signed_input(self):
+        scaled_rad = np.array([-1, -32768, 0, 5000], dtype=np.int16)
+        result = bt.bright_shift_scaled("Aqua", scaled_rad, 31, 0.00084, 2730.0)
+        assert np.isnan(result[:3]).all()
+        assert 150.0 < result[3] < 350.0
+
+    def test_bad_dtype(self):
+        with pytest.raises(ValueError):
+            bt.bright_shift_scaled("Aqua", np.zeros((2, 2), dtype=np.float32), 31, 0.00084, 2730.0)
+
+
+def main():
+    return pytest.main([os.path.realpath(__file__)])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
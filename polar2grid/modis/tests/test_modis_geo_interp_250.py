@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Tests for MODIS 1km geolocation interpolation.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+
+"""
+__docformat__ = "restructuredtext en"
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# the polar2grid.modis package requires pyhdf
+pytest.importorskip("pyhdf")
+from polar2grid.modis import modis_geo_interp_250  # noqa: E402
+
+
+def _fake_1km_nav(num_scans=6, num_cols=200):
+    """Geolocation crossing the anti-meridian at high latitudes."""
+    rs = np.random.RandomState(0)
+    num_rows = num_scans * modis_geo_interp_250.ROWS_PER_SCAN
+    lats = np.linspace(60, 80, num_rows)[:, None] + np.linspace(-5, 5, num_cols)[None, :]
+    lats += rs.rand(num_rows, num_cols) * 0.01
+    lons = np.linspace(170, 200, num_cols)[None, :] + np.linspace(0, 3, num_rows)[:, None]
+    lons = (lons + 180) % 360 - 180
+    return lons.astype(np.float32), lats.astype(np.float32)
+
+
+def _interpolate_geolocation_cartesian_per_scan(lon_array, lat_array, res_factor=4):
+    """Original one scan at a time implementation of `interpolate_geolocation_cartesian` used as a reference."""
+    from scipy.ndimage import map_coordinates
+    rows_per_scan = modis_geo_interp_250.ROWS_PER_SCAN
+    earth_radius = modis_geo_interp_250.EARTH_RADIUS
+    num_rows, num_cols = lon_array.shape
+    num_scans = int(num_rows / rows_per_scan)
+
+    lons_rad = np.radians(lon_array)
+    lats_rad = np.radians(lat_array)
+    x_in = earth_radius * np.cos(lats_rad) * np.cos(lons_rad)
+    y_in = earth_radius * np.cos(lats_rad) * np.sin(lons_rad)
+    z_in = earth_radius * np.sin(lats_rad)
+
+    x = np.arange(res_factor * num_cols, dtype=np.float32) * (1. / res_factor)
+    # 0.375 for 250m, 0.25 for 500m
+    y = np.arange(res_factor * rows_per_scan, dtype=np.float32) * (1. / res_factor) - \
+        (res_factor * (1. / 16) + (1. / 8))
+    x, y = np.meshgrid(x, y)
+    coordinates = np.array([y, x])
+
+    new_x = np.empty((num_rows * res_factor, num_cols * res_factor), dtype=np.float64)
+    new_y = new_x.copy()
+    new_z = new_x.copy()
+    for scan_idx in range(num_scans):
+        j0 = rows_per_scan * scan_idx
+        j1 = j0 + rows_per_scan
+        k0 = rows_per_scan * res_factor * scan_idx
+        k1 = k0 + rows_per_scan * res_factor
+        for nav_array, result_array in [(x_in, new_x), (y_in, new_y), (z_in, new_z)]:
+            map_coordinates(nav_array[j0:j1, :], coordinates, output=result_array[k0:k1, :], order=1, mode='nearest')
+            # linear extrapolation for the pixels along track past the first and last 1km pixel centers
+            if res_factor == 4:
+                extrapolations = [(5, 2, (0, 1)), (37, 34, (38, 39))]
+            else:
+                extrapolations = [(2, 1, (0,)), (18, 17, (19,))]
+            for src_row1, src_row2, dst_rows in extrapolations:
+                m = (result_array[k0 + src_row1, :] - result_array[k0 + src_row2, :]) / \
+                    (y[src_row1, 0] - y[src_row2, 0])
+                b = result_array[k0 + src_row1, :] - m * y[src_row1, 0]
+                for dst_row in dst_rows:
+                    result_array[k0 + dst_row, :] = m * y[dst_row, 0] + b
+
+    new_lons = modis_geo_interp_250.get_lons_from_cartesian(new_x, new_y)
+    new_lats = modis_geo_interp_250.get_lats_from_cartesian(new_x, new_y, new_z)
+    return new_lons.astype(lon_array.dtype), new_lats.astype(lat_array.dtype)
+
+
+class TestInterpolateGeolocationCartesian(object):
+    @pytest.mark.parametrize("res_factor", [4, 2])
+    @pytest.mark.parametrize(("dtype", "scans_per_block"), [
+        (np.float64, None),
+        (np.float64, 4),
+        (np.float32, None),
+        (np.float32, 4),
+    ])
+    def test_matches_per_scan(self, res_factor, dtype, scans_per_block):
+        lons, lats = _fake_1km_nav()
+        exp_lons, exp_lats = _interpolate_geolocation_cartesian_per_scan(
+            lons, lats, res_factor=res_factor)
+        new_lons, new_lats = modis_geo_interp_250.interpolate_geolocation_cartesian(
+            lons, lats, res_factor=res_factor, dtype=dtype, scans_per_block=scans_per_block)
+        assert new_lons.shape == (lons.shape[0] * res_factor, lons.shape[1] * res_factor)
+        assert new_lons.dtype == lons.dtype
+        lon_diff = (new_lons.astype(np.float64) - exp_lons + 180) % 360 - 180
+        np.testing.assert_allclose(lon_diff, 0, atol=1e-4)
+        np.testing.assert_allclose(new_lats, exp_lats, atol=1e-4)
+
+
+def main():
+    return pytest.main([os.path.realpath(__file__)])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
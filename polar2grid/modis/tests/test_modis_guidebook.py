@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Tests for the MODIS HDF-EOS file helpers.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+
+"""
+__docformat__ = "restructuredtext en"
+
+import os
+import sys
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+# the polar2grid.modis package requires pyhdf
+pytest.importorskip("pyhdf")
+from polar2grid.modis import modis_guidebook  # noqa: E402
+
+CORE_METADATA = """
+GROUP                  = INVENTORYMETADATA
+  GROUPTYPE            = MASTERGROUP
+
+  GROUP                  = RANGEDATETIME
+
+    OBJECT                 = RANGEBEGINNINGDATE
+      NUM_VAL              = 1
+      VALUE                = "2013-06-23"
+    END_OBJECT             = RANGEBEGINNINGDATE
+
+  END_GROUP              = RANGEDATETIME
+
+  GROUP                  = ASSOCIATEDPLATFORMINSTRUMENTSENSOR
+
+    OBJECT                 = ASSOCIATEDPLATFORMINSTRUMENTSENSORCONTAINER
+      CLASS                = "1"
+
+      OBJECT                 = ASSOCIATEDINSTRUMENTSHORTNAME
+        CLASS                = "1"
+        NUM_VAL              = 1
+        VALUE                = "MODIS"
+      END_OBJECT             = ASSOCIATEDINSTRUMENTSHORTNAME
+
+    END_OBJECT             = ASSOCIATEDPLATFORMINSTRUMENTSENSORCONTAINER
+
+  END_GROUP              = ASSOCIATEDPLATFORMINSTRUMENTSENSOR
+
+  GROUP                  = SPATIALDOMAINCONTAINER
+
+    OBJECT                 = GRINGPOINTLONGITUDE
+      NUM_VAL              = 4
+      VALUE                = (-100.5, -70.25,
+                              -75.0, -110.125)
+    END_OBJECT             = GRINGPOINTLONGITUDE
+
+  END_GROUP              = SPATIALDOMAINCONTAINER
+
+END_GROUP              = INVENTORYMETADATA
+
+END
+\x00"""
+
+RANGE_METADATA = """
+GROUP                  = INVENTORYMETADATA
+  GROUP                  = RANGEDATETIME
+    OBJECT                 = RANGEBEGINNINGDATE
+      NUM_VAL              = 1
+      VALUE                = "2013-06-23"
+    END_OBJECT             = RANGEBEGINNINGDATE
+    OBJECT                 = RANGEBEGINNINGTIME
+      NUM_VAL              = 1
+      VALUE                = "19:20:00.000000"
+    END_OBJECT             = RANGEBEGINNINGTIME
+    OBJECT                 = RANGEENDINGDATE
+      NUM_VAL              = 1
+      VALUE                = "2013-06-23"
+    END_OBJECT             = RANGEENDINGDATE
+    OBJECT                 = RANGEENDINGTIME
+      NUM_VAL              = 1
+      VALUE                = "19:25:00.000000"
+    END_OBJECT             = RANGEENDINGTIME
+  END_GROUP              = RANGEDATETIME
+  GROUP                  = COLLECTIONDESCRIPTIONCLASS
+    OBJECT                 = SHORTNAME
+      NUM_VAL              = 1
+      VALUE                = "MYD021KM"
+    END_OBJECT             = SHORTNAME
+  END_GROUP              = COLLECTIONDESCRIPTIONCLASS
+  GROUP                  = ASSOCIATEDPLATFORMINSTRUMENTSENSOR
+    OBJECT                 = ASSOCIATEDPLATFORMINSTRUMENTSENSORCONTAINER
+      OBJECT                 = ASSOCIATEDINSTRUMENTSHORTNAME
+        NUM_VAL              = 1
+        VALUE                = "MODIS"
+      END_OBJECT             = ASSOCIATEDINSTRUMENTSHORTNAME
+    END_OBJECT             = ASSOCIATEDPLATFORMINSTRUMENTSENSORCONTAINER
+  END_GROUP              = ASSOCIATEDPLATFORMINSTRUMENTSENSOR
+END_GROUP              = INVENTORYMETADATA
+END
+"""
+
+STRUCT_METADATA = """GROUP=SwathStructure
+\tGROUP=SWATH_1
+\t\tSwathName="MODIS_SWATH_Type_L1B"
+\t\tGROUP=DimensionMap
+\t\t\tOBJECT=DimensionMap_1
+\t\t\t\tGeoDimension="2*nscans"
+\t\t\t\tOffset=2
+\t\t\tEND_OBJECT=DimensionMap_1
+\t\tEND_GROUP=DimensionMap
+\tEND_GROUP=SWATH_1
+END_GROUP=SwathStructure
+END
+"""
+
+
+class _FakeHDFEOSReader(object):
+    get_metadata = modis_guidebook.HDFEOSReader.get_metadata
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.reads = 0
+
+    def __getitem__(self, item):
+        self.reads += 1
+        return CORE_METADATA
+
+
+class _MetadataHDFEOSReader(modis_guidebook.HDFEOSReader):
+    """HDF-EOS reader whose only contents are the 'CoreMetadata.0' attribute."""
+    def __init__(self, filename, metadata_str=RANGE_METADATA):
+        self.metadata_str = metadata_str
+        self.reads = 0
+        super(_MetadataHDFEOSReader, self).__init__(filename)
+
+    def __getitem__(self, item):
+        self.reads += 1
+        return self.metadata_str
+
+
+@pytest.fixture
+def metadata_reader_files(tmpdir, monkeypatch):
+    """Don't open files when creating readers and start with an empty metadata cache."""
+    def _init_hdf_reader(self, filename):
+        self.filename = os.path.basename(filename)
+        self.filepath = os.path.realpath(filename)
+
+    monkeypatch.setattr(modis_guidebook.HDFReader, "__init__", _init_hdf_reader)
+    monkeypatch.setattr(modis_guidebook, "_METADATA_CACHE", OrderedDict())
+
+    def _create_file(fn):
+        fn = tmpdir.join(fn)
+        fn.write_binary(b"fake")
+        return str(fn)
+    return _create_file
+
+
+class TestHDFEOSReader(object):
+    def test_end_time_from_metadata(self, metadata_reader_files):
+        reader = _MetadataHDFEOSReader(metadata_reader_files("a1.13174.1920.1000m.hdf"))
+        assert reader.begin_time == datetime(2013, 6, 23, 19, 20)
+        # metadata isn't read until it is needed
+        assert reader.reads == 0
+        file_reader = modis_guidebook.FileReader(reader, modis_guidebook.FILE_TYPES[modis_guidebook.FT_MOD021KM])
+        assert reader.reads == 0
+        assert file_reader.end_time == datetime(2013, 6, 23, 19, 25)
+        assert reader.reads == 1
+        file_reader.end_time = datetime(2013, 6, 23, 19, 30)
+        assert file_reader.end_time == datetime(2013, 6, 23, 19, 30)
+
+    def test_end_time_no_metadata(self, metadata_reader_files):
+        reader = _MetadataHDFEOSReader(metadata_reader_files("a1.13174.1920.1000m.hdf"), metadata_str=CORE_METADATA)
+        assert reader.end_time == reader.begin_time
+
+    def test_info_from_metadata(self, metadata_reader_files):
+        reader = _MetadataHDFEOSReader(metadata_reader_files("unknown_modis_file.hdf"))
+        assert reader.satellite == "aqua"
+        assert reader.instrument == "modis"
+        assert reader.file_type == modis_guidebook.FT_1000M
+        assert reader.begin_time == datetime(2013, 6, 23, 19, 20)
+        assert reader.end_time == datetime(2013, 6, 23, 19, 25)
+        with pytest.raises(ValueError):
+            _MetadataHDFEOSReader(metadata_reader_files("unknown_modis_file2.hdf"), metadata_str=CORE_METADATA)
+
+    def test_metadata_cache_size(self, metadata_reader_files, monkeypatch):
+        monkeypatch.setattr(modis_guidebook, "MAX_METADATA_CACHE_SIZE", 2)
+        readers = [_MetadataHDFEOSReader(metadata_reader_files("a1.13174.19%d0.1000m.hdf" % (idx,)))
+                   for idx in range(3)]
+        readers[0].get_metadata()
+        readers[1].get_metadata()
+        # the first file was used more recently than the second
+        readers[0].get_metadata()
+        readers[2].get_metadata()
+        assert len(modis_guidebook._METADATA_CACHE) == 2
+        readers[0].get_metadata()
+        readers[1].get_metadata()
+        assert [reader.reads for reader in readers] == [1, 2, 1]
+
+
+class TestHDFEOSMetadata(object):
+    def test_core_metadata(self):
+        meta = modis_guidebook.HDFEOSMetadata(CORE_METADATA)
+        assert meta == {
+            "/INVENTORYMETADATA/RANGEDATETIME/RANGEBEGINNINGDATE": "2013-06-23",
+            modis_guidebook.HDFEOSReader.METADATA_INSTRUMENT: "MODIS",
+            "/INVENTORYMETADATA/SPATIALDOMAINCONTAINER/GRINGPOINTLONGITUDE":
+                ("-100.5", " -70.25", "-75.0", " -110.125"),
+        }
+
+    def test_struct_metadata(self):
+        meta = modis_guidebook.HDFEOSMetadata(STRUCT_METADATA)
+        assert meta["/SwathStructure/SWATH_1/SwathName"] == "MODIS_SWATH_Type_L1B"
+        assert meta["/SwathStructure/SWATH_1/DimensionMap/DimensionMap_1/GeoDimension"] == "2*nscans"
+        assert meta["/SwathStructure/SWATH_1/DimensionMap/DimensionMap_1/Offset"] == "2"
+
+    @pytest.mark.parametrize("metadata_str", [
+        CORE_METADATA.replace("END\n", ""),
+        CORE_METADATA.replace("END_GROUP              = INVENTORYMETADATA", ""),
+    ])
+    def test_bad_metadata(self, metadata_str):
+        with pytest.raises(ValueError):
+            modis_guidebook.HDFEOSMetadata(metadata_str)
+
+    def test_metadata_cache(self, tmpdir):
+        fn = tmpdir.join("a1.13174.1920.1000m.hdf")
+        fn.write_binary(b"fake")
+        reader1 = _FakeHDFEOSReader(str(fn))
+        reader2 = _FakeHDFEOSReader(str(fn))
+        meta = reader1.get_metadata()
+        assert reader2.get_metadata() is meta
+        assert reader1.reads == 1 and reader2.reads == 0
+        # a different attribute is parsed separately
+        reader2.get_metadata("ArchiveMetadata\\.0")
+        assert reader2.reads == 1
+
+
+class _FakeVariable(object):
+    def __init__(self, data):
+        self.data = data
+
+    def get(self):
+        return self.data
+
+    def info(self):
+        # pyhdf gives an integer instead of a list for 1D variables
+        dims = list(self.data.shape) if self.data.ndim > 1 else self.data.shape[0]
+        return "fake_var", self.data.ndim, dims, 0, 0
+
+
+class _FakeL1BHandle(object):
+    filepath = "/tmp/a1.13174.1920.1000m.hdf"
+    filename = "a1.13174.1920.1000m.hdf"
+    instrument = "modis"
+    satellite = "aqua"
+    begin_time = end_time = None
+
+    def __init__(self, items):
+        self.items = items
+
+    def __getitem__(self, item):
+        return self.items[item]
+
+
+class TestScaledSwathData(object):
+    def test_scaled_band(self):
+        emissive = np.arange(16 * 4 * 3, dtype=np.uint16).reshape((16, 4, 3))
+        handle = _FakeL1BHandle({
+            "EV_1KM_Emissive": _FakeVariable(emissive),
+            "EV_1KM_Emissive.radiance_scales": np.linspace(0.001, 0.016, 16),
+            "EV_1KM_Emissive.radiance_offsets": np.arange(16, dtype=np.float32) + 2000.,
+        })
+        file_reader = modis_guidebook.FileReader(handle, modis_guidebook.FILE_TYPES[modis_guidebook.FT_MOD021KM])
+        data, scale, offset = file_reader.get_scaled_swath_data(modis_guidebook.K_IR31)
+        np.testing.assert_array_equal(data, emissive[10])
+        assert scale == pytest.approx(0.011)
+        assert offset == 2010.
+
+    def test_not_scaled_integers(self):
+        handle = _FakeL1BHandle({"EV_1KM_Emissive": _FakeVariable(np.zeros((16, 4, 3), dtype=np.float32))})
+        file_reader = modis_guidebook.FileReader(handle, modis_guidebook.FILE_TYPES[modis_guidebook.FT_MOD021KM])
+        with pytest.raises(ValueError):
+            file_reader.get_scaled_swath_data(modis_guidebook.K_IR31)
+        # geolocation isn't scaled
+        with pytest.raises(ValueError):
+            file_reader.get_scaled_swath_data(modis_guidebook.K_LONGITUDE_250)
+
+
+class TestSwathShape(object):
+    def test_band_shape(self):
+        handle = _FakeL1BHandle({"EV_1KM_Emissive": _FakeVariable(np.zeros((16, 4, 3), dtype=np.uint16))})
+        file_reader = modis_guidebook.FileReader(handle, modis_guidebook.FILE_TYPES[modis_guidebook.FT_MOD021KM])
+        assert file_reader.get_swath_shape(modis_guidebook.K_IR31) == (4, 3)
+
+        multi_reader = modis_guidebook.MultiFileReader(modis_guidebook.FILE_TYPES[modis_guidebook.FT_MOD021KM])
+        multi_reader.add_file(handle)
+        multi_reader.add_file(_FakeL1BHandle({"EV_1KM_Emissive": _FakeVariable(np.zeros((16, 6, 3), np.uint16))}))
+        assert multi_reader.get_swath_shape(modis_guidebook.K_IR31) == (10, 3)
+
+    def test_interpolated_shape(self):
+        handle = _FakeL1BHandle({"Longitude": _FakeVariable(np.zeros((4, 3), dtype=np.float32))})
+        file_reader = modis_guidebook.FileReader(handle, modis_guidebook.FILE_TYPES[modis_guidebook.FT_MOD03])
+        assert file_reader.get_swath_shape(modis_guidebook.K_LONGITUDE) == (4, 3)
+        assert file_reader.get_swath_shape(modis_guidebook.K_LONGITUDE_250) == (16, 12)
+        assert file_reader.get_swath_shape(modis_guidebook.K_LONGITUDE_500) == (8, 6)
+
+
+def main():
+    return pytest.main([os.path.realpath(__file__)])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Tests for the legacy MODIS frontend.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+"""
+__docformat__ = "restructuredtext en"
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# the polar2grid.modis package requires pyhdf
+pytest.importorskip("pyhdf")
+from polar2grid.modis import bt, modis_guidebook, modis_to_swath  # noqa: E402
+
+SCALE, OFFSET = 0.00084, 2730.0
+
+
+class _FakeMultiFileReader(object):
+    def __init__(self, granules):
+        self.granules = granules
+
+    def iter_scaled_swath_data(self, item):
+        assert item == modis_guidebook.K_IR31
+        for scaled_rad, scale, offset in self.granules:
+            yield scaled_rad, scale, offset
+
+
+def _frontend(granules):
+    frontend = modis_to_swath.Frontend.__new__(modis_to_swath.Frontend)
+    frontend.available_file_types = [modis_guidebook.FT_MOD021KM]
+    frontend.file_readers = {modis_guidebook.FT_MOD021KM: _FakeMultiFileReader(granules)}
+    return frontend
+
+
+class TestBTFromScaledRadiances(object):
+    def test_lookup_table_per_granule(self):
+        rs = np.random.RandomState(0)
+        granules = [
+            (rs.randint(0, 32768, size=(20, 30)).astype(np.uint16), SCALE, OFFSET),
+            (rs.randint(0, 32768, size=(10, 30)).astype(np.uint16), SCALE * 2, OFFSET - 100.),
+        ]
+        granules[0][0][0, :2] = 65535
+        output_data = np.zeros((30, 30), dtype=np.float32)
+        assert _frontend(granules)._bt_from_scaled_radiances(modis_to_swath.PRODUCT_IR31, "Aqua", 31, output_data)
+
+        for (scaled_rad, scale, offset), rows in zip(granules, (slice(0, 20), slice(20, 30))):
+            expected = bt.bright_shift("Aqua", (scaled_rad.astype(np.float64) - offset) * scale, 31)
+            expected[scaled_rad > bt.MAX_VALID_SCALED_VALUE] = np.nan
+            np.testing.assert_array_equal(output_data[rows], expected.astype(np.float32))
+        assert np.isnan(output_data[0, :2]).all()
+
+    def test_no_scaled_radiances(self):
+        class _NoScaledReader(object):
+            def iter_scaled_swath_data(self, item):
+                raise ValueError("not scaled integers")
+                yield
+
+        frontend = _frontend([])
+        frontend.file_readers[modis_guidebook.FT_MOD021KM] = _NoScaledReader()
+        output_data = np.zeros((3, 3), dtype=np.float32)
+        assert not frontend._bt_from_scaled_radiances(modis_to_swath.PRODUCT_IR31, "Aqua", 31, output_data)
+
+    def test_shape_mismatch(self):
+        granules = [(np.zeros((2, 3), dtype=np.uint16), SCALE, OFFSET)]
+        output_data = np.zeros((3, 3), dtype=np.float32)
+        assert not _frontend(granules)._bt_from_scaled_radiances(modis_to_swath.PRODUCT_IR31, "Aqua", 31, output_data)
+
+
+def main():
+    return pytest.main([os.path.realpath(__file__)])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
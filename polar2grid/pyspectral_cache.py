@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Validate the local pyspectral data and cache it for quick loading.
+
+Rayleigh correction (pyspectral) reads a 4D lookup table (wavelength, azimuth
+difference, satellite zenith secant, sun zenith secant) from an HDF5 file for
+every corrected band and reads the relative spectral response (RSR) of the
+instrument to find each band's effective wavelength. On systems without
+internet access a missing file is only noticed once the first composite that
+needs it is computed.
+
+This script checks that the lookup tables and RSR data configured in
+``etc/pyspectral.yaml`` exist for the rayleigh corrected bands of the
+requested sensors and composites, then stores the lookup tables as ``.npy``
+files and the effective wavelength of every band in a cache directory. When
+the cache directory exists, `install_lut_cache` (called by the glue script)
+makes pyspectral load the tables as memory maps, so only the wavelengths
+needed by a band are read from disk, and look up effective wavelengths
+without reading the RSR files.
+
+Usage::
+
+    p2g_pyspectral_cache.sh abi viirs
+    p2g_pyspectral_cache.sh --check-only --composites true_color -- abi
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+"""
+__docformat__ = "restructuredtext en"
+
+import os
+import sys
+import json
+import logging
+import tempfile
+from collections import defaultdict
+
+import numpy
+
+LOG = logging.getLogger(__name__)
+
+# change this when the way cached tables are created changes so old entries aren't used
+CACHE_VERSION = 1
+CACHE_DIR_NAME = "p2g_lut_cache"
+MANIFEST_FILENAME = "manifest.json"
+LUT_ARRAY_NAMES = ("reflectance", "wavelengths", "azimuth_difference", "satellite_zenith_secant",
+                   "sun_zenith_secant")
+# platforms checked for each sensor when none are specified
+SENSOR_PLATFORMS = {
+    "abi": ["GOES-16", "GOES-17"],
+    "ahi": ["Himawari-8"],
+    "viirs": ["Suomi-NPP", "NOAA-20"],
+    "modis": ["EOS-Terra", "EOS-Aqua"],
+    "mersi-2": ["FY-3D"],
+}
+
+
+def get_default_cache_dir():
+    """Cache directory from ``P2G_PYSPECTRAL_CACHE_DIR`` or next to the pyspectral data (``PSP_DATA_ROOT``)."""
+    cache_dir = os.environ.get("P2G_PYSPECTRAL_CACHE_DIR")
+    if cache_dir is None and os.environ.get("PSP_DATA_ROOT"):
+        cache_dir = os.path.join(os.environ["PSP_DATA_ROOT"], CACHE_DIR_NAME)
+    return cache_dir
+
+
+class RayleighLUTCache(object):
+    """Directory of rayleigh lookup tables saved as ``.npy`` files and band effective wavelengths.
+
+    Tables are identified by their aerosol directory, file name, and file size so a cache created when the
+    software bundle is built is still valid after the bundle is moved.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = os.path.realpath(cache_dir)
+        self.manifest_filename = os.path.join(self.cache_dir, MANIFEST_FILENAME)
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_filename) as manifest_file:
+                manifest = json.load(manifest_file)
+        except (IOError, OSError, ValueError):
+            manifest = {}
+        if manifest.get("version") != CACHE_VERSION:
+            manifest = {"version": CACHE_VERSION, "luts": {}, "wavelengths": {}}
+        return manifest
+
+    def save(self):
+        """Write the manifest to a temporary name and move it in to place."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_fn = tempfile.mkstemp(prefix=".manifest_", suffix=".json", dir=self.cache_dir)
+        with os.fdopen(fd, "w") as tmp_file:
+            json.dump(self.manifest, tmp_file, indent=4, sort_keys=True)
+        os.replace(tmp_fn, self.manifest_filename)
+
+    @staticmethod
+    def lut_key(lut_filename):
+        return "/".join(os.path.normpath(lut_filename).split(os.sep)[-2:])
+
+    @staticmethod
+    def wavelength_key(platform_name, sensor, band_name):
+        return "|".join([str(platform_name), str(sensor), str(band_name)])
+
+    def put_lut(self, lut_filename, arrays):
+        """Save the arrays of a rayleigh lookup table file (see `LUT_ARRAY_NAMES`)."""
+        key = self.lut_key(lut_filename)
+        entry_dir = os.path.join(self.cache_dir, key.replace("/", "_").replace(".h5", ""))
+        os.makedirs(entry_dir, exist_ok=True)
+        for array_name, arr in zip(LUT_ARRAY_NAMES, arrays):
+            numpy.save(os.path.join(entry_dir, array_name + ".npy"), numpy.asarray(arr))
+        self.manifest["luts"][key] = {
+            "size": os.path.getsize(lut_filename),
+            "directory": os.path.basename(entry_dir),
+        }
+        LOG.debug("Cached rayleigh lookup table '%s'", lut_filename)
+
+    def get_lut(self, lut_filename):
+        """Get read-only memory maps of a cached lookup table or `None` if it isn't cached or has changed."""
+        entry = self.manifest["luts"].get(self.lut_key(lut_filename))
+        try:
+            if entry is None or os.path.getsize(lut_filename) != entry["size"]:
+                return None
+            entry_dir = os.path.join(self.cache_dir, entry["directory"])
+            return tuple(numpy.load(os.path.join(entry_dir, array_name + ".npy"), mmap_mode="r")
+                         for array_name in LUT_ARRAY_NAMES)
+        except (IOError, OSError, ValueError):
+            LOG.debug("Could not load cached rayleigh lookup table for '%s'", lut_filename, exc_info=True)
+            return None
+
+    def put_wavelength(self, platform_name, sensor, band_name, wavelength):
+        self.manifest["wavelengths"][self.wavelength_key(platform_name, sensor, band_name)] = float(wavelength)
+
+    def get_wavelength(self, platform_name, sensor, band_name):
+        return self.manifest["wavelengths"].get(self.wavelength_key(platform_name, sensor, band_name))
+
+
+def _prereq_field(prereq, key):
+    if isinstance(prereq, str):
+        return prereq if key == "name" else None
+    try:
+        return prereq.get(key)
+    except (AttributeError, KeyError):
+        return None
+
+
+def _load_sensor_compositors(sensor):
+    try:
+        from satpy.composites.config_loader import load_compositor_configs_for_sensors
+        comps, mods = load_compositor_configs_for_sensors([sensor])
+    except ImportError:
+        from satpy.composites import CompositorLoader
+        comps, mods = CompositorLoader().load_compositors([sensor])
+    return comps.get(sensor, {}), mods.get(sensor, {})
+
+
+def get_rayleigh_requirements(sensors, composites=None):
+    """Find the rayleigh corrected bands of each sensor's composites.
+
+    :param composites: only check these composites (default: all composites of the sensor)
+    :returns: ``{(sensor, atmosphere, aerosol_type): set of band names}``
+    """
+    requirements = defaultdict(set)
+    for sensor in sensors:
+        sensor_comps, sensor_mods = _load_sensor_compositors(sensor)
+        rayleigh_mods = {}
+        for mod_name, (mod_loader, mod_options) in sensor_mods.items():
+            if "rayleigh" in getattr(mod_loader, "__name__", "").lower():
+                rayleigh_mods[mod_name] = (mod_options.get("atmosphere", "us-standard"),
+                                           mod_options.get("aerosol_type", "marine_clean_aerosol"))
+        for comp_id, compositor in sensor_comps.items():
+            comp_name = _prereq_field(comp_id, "name")
+            if composites and comp_name not in composites:
+                continue
+            prereqs = list(compositor.attrs.get("prerequisites", []))
+            prereqs += list(compositor.attrs.get("optional_prerequisites", []))
+            for prereq in prereqs:
+                band_name = _prereq_field(prereq, "name")
+                for mod_name in _prereq_field(prereq, "modifiers") or []:
+                    if band_name and mod_name in rayleigh_mods:
+                        requirements[(sensor,) + rayleigh_mods[mod_name]].add(band_name)
+    return requirements
+
+
+def _get_pyspectral_config():
+    try:
+        from pyspectral.config import get_config
+    except ImportError:
+        from pyspectral.utils import get_config
+    return get_config()
+
+
+def get_expected_filenames(platform_name, sensor, atmosphere, aerosol_type):
+    """Paths pyspectral will read the rayleigh lookup table and RSR data from.
+
+    The paths come from the pyspectral configuration (``rayleigh_dir`` and ``rsr_dir``) so they can be checked
+    without creating a `Rayleigh` object, which downloads any missing file when it is created.
+
+    :returns: (lookup table filename, RSR filename)
+    """
+    config = _get_pyspectral_config()
+    lut_filename = os.path.join(os.path.expanduser(config["rayleigh_dir"]), aerosol_type,
+                                "rayleigh_lut_{}.h5".format(atmosphere.replace(" ", "_")))
+    rsr_filename = os.path.join(os.path.expanduser(config["rsr_dir"]),
+                                "rsr_{}_{}.h5".format(sensor, platform_name))
+    return lut_filename, rsr_filename
+
+
+def prepare_cache(cache_dir, requirements, platforms=None, check_only=False):
+    """Check that the pyspectral data needed for `requirements` exists and cache it in `cache_dir`.
+
+    :param requirements: ``{(sensor, atmosphere, aerosol_type): band names}`` (see `get_rayleigh_requirements`)
+    :param platforms: platform names to check for every sensor (default: `SENSOR_PLATFORMS`)
+    :returns: list of problems found, empty if everything needed is available
+    """
+    import pyspectral.rayleigh as psp_rayleigh
+    cache = RayleighLUTCache(cache_dir)
+    problems = []
+    for (sensor, atmosphere, aerosol_type), band_names in sorted(requirements.items()):
+        for platform_name in (platforms or SENSOR_PLATFORMS.get(sensor, [])):
+            desc = "{} {} ({}, {})".format(platform_name, sensor, atmosphere, aerosol_type)
+            try:
+                lut_filename, rsr_filename = get_expected_filenames(platform_name, sensor, atmosphere,
+                                                                    aerosol_type)
+            except (IOError, OSError, ValueError, KeyError) as err:
+                problems.append("Could not read the pyspectral configuration for {}: {}".format(desc, err))
+                continue
+            # pyspectral downloads missing files so check before it gets the chance
+            if not os.path.isfile(lut_filename):
+                problems.append("Missing rayleigh lookup table for {}: {}".format(desc, lut_filename))
+                continue
+            if not os.path.isfile(rsr_filename):
+                problems.append("Missing spectral response data for {}: {}".format(desc, rsr_filename))
+                continue
+            try:
+                corrector = psp_rayleigh.Rayleigh(platform_name, sensor, atmosphere=atmosphere,
+                                                  aerosol_type=aerosol_type)
+            except (IOError, OSError, ValueError, KeyError, AttributeError) as err:
+                problems.append("Could not configure rayleigh correction for {}: {}".format(desc, err))
+                continue
+            lut = psp_rayleigh.get_reflectance_lut_from_file(lut_filename)
+            wvl_coord = numpy.asarray(lut[1])
+            for band_name in sorted(band_names):
+                try:
+                    # micrometers, the lookup table is in nanometers
+                    wavelength = corrector.get_effective_wavelength(band_name)
+                except (IOError, OSError, ValueError, KeyError) as err:
+                    problems.append("No spectral response for {} band {}: {}".format(desc, band_name, err))
+                    continue
+                if not wvl_coord[0] <= wavelength * 1000. <= wvl_coord[-1]:
+                    problems.append("Band {} of {} ({} um) is outside of the lookup table wavelengths".format(
+                        band_name, desc, wavelength))
+                    continue
+                cache.put_wavelength(platform_name, sensor, band_name, wavelength)
+                LOG.info("Found rayleigh data for %s band %s", desc, band_name)
+            if not check_only and cache.get_lut(lut_filename) is None:
+                cache.put_lut(lut_filename, lut)
+    if not check_only:
+        cache.save()
+    return problems
+
+
+def install_lut_cache(cache_dir=None):
+    """Make pyspectral load rayleigh lookup tables and band effective wavelengths from a `RayleighLUTCache`.
+
+    Does nothing if pyspectral isn't installed or the cache directory doesn't exist. Anything that isn't in the
+    cache is read by pyspectral as usual.
+
+    :returns: The installed `RayleighLUTCache` or `None`
+    """
+    cache_dir = cache_dir or get_default_cache_dir()
+    if not cache_dir or not os.path.isfile(os.path.join(cache_dir, MANIFEST_FILENAME)):
+        return None
+    try:
+        import pyspectral.rayleigh as psp_rayleigh
+    except ImportError:
+        return None
+    get_lut_from_file = psp_rayleigh.get_reflectance_lut_from_file
+    if getattr(get_lut_from_file, "lut_cache", None) is not None:
+        return get_lut_from_file.lut_cache
+    cache = RayleighLUTCache(cache_dir)
+    get_effective_wavelength = psp_rayleigh.Rayleigh.get_effective_wavelength
+
+    def _cached_get_lut_from_file(filename):
+        arrays = cache.get_lut(filename)
+        if arrays is None:
+            return get_lut_from_file(filename)
+        LOG.debug("Using cached rayleigh lookup table for '%s'", filename)
+        if getattr(psp_rayleigh, "HAVE_DASK", False):
+            import dask.array as da
+            arrays = (da.from_array(arrays[0], chunks=arrays[0].shape),) + arrays[1:]
+        return arrays
+
+    def _cached_get_effective_wavelength(self, bandname):
+        wavelength = cache.get_wavelength(getattr(self, "platform_name", None), getattr(self, "sensor", None),
+                                          bandname)
+        if wavelength is None:
+            return get_effective_wavelength(self, bandname)
+        return wavelength
+
+    _cached_get_lut_from_file.lut_cache = cache
+    psp_rayleigh.get_reflectance_lut_from_file = _cached_get_lut_from_file
+    psp_rayleigh.Rayleigh.get_effective_wavelength = _cached_get_effective_wavelength
+    LOG.debug("Using pyspectral lookup table cache '%s'", cache.cache_dir)
+    return cache
+
+
+def main(argv=sys.argv[1:]):
+    import argparse
+    from polar2grid.core.script_utils import setup_logging
+    parser = argparse.ArgumentParser(description="Check that the pyspectral rayleigh correction data needed "
+                                                 "by a sensor's composites exists and cache it for quick loading")
+    parser.add_argument("sensors", nargs="+", help="sensors to check (ex. abi, ahi, viirs)")
+    parser.add_argument("--composites", nargs="*",
+                        help="only check the rayleigh corrected bands of these composites (default: all)")
+    parser.add_argument("--platforms", nargs="*",
+                        help="platform names to check for every sensor (default: all known for the sensor)")
+    parser.add_argument("--cache-dir", default=get_default_cache_dir(),
+                        help="directory to write the cache to (default: $P2G_PYSPECTRAL_CACHE_DIR or "
+                             "$PSP_DATA_ROOT/" + CACHE_DIR_NAME + ")")
+    parser.add_argument("--check-only", action="store_true",
+                        help="check that the data exists without writing the cache")
+    parser.add_argument("-v", "--verbose", dest="verbosity", action="count", default=0,
+                        help="each occurrence increases verbosity 1 level through ERROR-WARNING-INFO-DEBUG")
+    args = parser.parse_args(argv)
+    levels = [logging.ERROR, logging.WARN, logging.INFO, logging.DEBUG]
+    setup_logging(console_level=levels[min(3, args.verbosity + 1)], log_filename=None)
+    os.environ.setdefault("PPP_CONFIG_DIR", os.path.join(sys.prefix, 'etc', 'polar2grid'))
+    if not args.cache_dir and not args.check_only:
+        parser.error("No cache directory (--cache-dir, P2G_PYSPECTRAL_CACHE_DIR, or PSP_DATA_ROOT)")
+
+    requirements = get_rayleigh_requirements(args.sensors, args.composites)
+    if not requirements:
+        LOG.warning("No rayleigh corrected bands found for %s", ", ".join(args.sensors))
+        return 0
+    try:
+        problems = prepare_cache(args.cache_dir, requirements, platforms=args.platforms,
+                                 check_only=args.check_only)
+    except ImportError:
+        LOG.error("pyspectral is not installed")
+        return 1
+    for problem in problems:
+        LOG.error(problem)
+    if problems:
+        return 1
+    if not args.check_only:
+        LOG.info("Wrote pyspectral cache to '%s'", args.cache_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
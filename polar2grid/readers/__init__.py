@@ -71,7 +71,21 @@ def normalize_satellite_name(input_sat):
     return input_sat
 
 
-def area_to_swath_def(area, chunks=4096, overwrite_existing=False):
+def _store(source, target, store_sources=None, store_targets=None):
+    """Store a dask array to a numpy memmap now or add it to lists to be stored later.
+
+    Storing many arrays with a single ``da.store`` call means that any
+    computations they share (geolocation, calibration, etc) are only done
+    once and all of the arrays are written in one parallel pass.
+    """
+    if store_sources is None:
+        da.store(source, target)
+    else:
+        store_sources.append(source)
+        store_targets.append(target)
+
+
+def area_to_swath_def(area, chunks=4096, overwrite_existing=False, store_sources=None, store_targets=None):
     if hasattr(area, 'lons') and area.lons is not None:
         lons = area.lons
         lats = area.lats
@@ -111,7 +125,7 @@ def area_to_swath_def(area, chunks=4096, overwrite_existing=False):
             LOG.warning("Binary file already exists, will overwrite: %s", filename)
     LOG.info("Writing longitude data to disk cache...")
     lon_arr = np.memmap(filename, mode="w+", dtype=lons.dtype, shape=lons.shape)
-    da.store(lons, lon_arr)
+    _store(lons, lon_arr, store_sources, store_targets)
 
     # Write lats to disk
     filename = info["latitude"]
@@ -123,7 +137,7 @@ def area_to_swath_def(area, chunks=4096, overwrite_existing=False):
             LOG.warning("Binary file already exists, will overwrite: %s", filename)
     LOG.info("Writing latitude data to disk cache...")
     lat_arr = np.memmap(filename, mode="w+", dtype=lats.dtype, shape=lats.shape)
-    da.store(lats, lat_arr)
+    _store(lats, lat_arr, store_sources, store_targets)
     return containers.SwathDefinition(**info)
 
 
@@ -155,7 +169,7 @@ def area_to_grid_definition(area, overwrite_existing=False):
         )
 
 
-def dataarray_to_swath_product(ds, swath_def, overwrite_existing=False):
+def dataarray_to_swath_product(ds, swath_def, overwrite_existing=False, store_sources=None, store_targets=None):
     info = ds.attrs.copy()
     info.pop("area")
     if ds.ndim == 3:
@@ -218,7 +232,7 @@ def dataarray_to_swath_product(ds, swath_def, overwrite_existing=False):
         LOG.info("Writing band data to disk cache...")
         p2g_arr = np.memmap(filename, mode="w+", dtype=dtype, shape=ds.shape)
         ds = ds.where(ds.notnull(), np.nan)
-        da.store(ds.data.astype(dtype), p2g_arr)
+        _store(ds.data.astype(dtype), p2g_arr, store_sources, store_targets)
         yield containers.SwathProduct(**info)
     else:
         for chn_idx in range(channels):
@@ -234,11 +248,11 @@ def dataarray_to_swath_product(ds, swath_def, overwrite_existing=False):
                     LOG.warning("Binary file already exists, will overwrite: %s", filename)
             LOG.info("Writing band data to disk cache...")
             p2g_arr = np.memmap(filename, mode="w+", dtype=dtype, shape=ds.shape[-2:])
-            da.store(ds.data[chn_idx].astype(dtype), p2g_arr)
+            _store(ds.data[chn_idx].astype(dtype), p2g_arr, store_sources, store_targets)
             yield containers.SwathProduct(**tmp_info)
 
 
-def dataarray_to_gridded_product(ds, grid_def, overwrite_existing=False):
+def dataarray_to_gridded_product(ds, grid_def, overwrite_existing=False, store_sources=None, store_targets=None):
     info = ds.attrs.copy()
     info.pop("area", None)
     if ds.ndim == 3:
@@ -285,7 +299,7 @@ def dataarray_to_gridded_product(ds, grid_def, overwrite_existing=False):
         else:
             LOG.warning("Binary file already exists, will overwrite: %s", filename)
     p2g_arr = np.memmap(filename, mode="w+", dtype=dtype, shape=ds.shape)
-    da.store(ds.data.astype(dtype), p2g_arr)
+    _store(ds.data.astype(dtype), p2g_arr, store_sources, store_targets)
     return containers.GriddedProduct(**info)
 
 
@@ -297,10 +311,15 @@ def convert_satpy_to_p2g_swath(frontend, scene, convert_area_defs=True):
     their longitude and latitude arrays. If ``False`` then an exception
     is raised when an `AreaDefinition` is encountered.
 
+    All geolocation and product arrays are written to disk with a single
+    ``da.store`` call so dependencies they share are only computed once.
+
     """
     p2g_scene = containers.SwathScene()
     overwrite_existing = frontend.overwrite_existing
     areas = {}
+    store_sources = []
+    store_targets = []
     for ds in scene:
         a = ds.attrs['area']
         area_name = getattr(a, 'name', getattr(a, 'description', None))
@@ -314,14 +333,19 @@ def convert_satpy_to_p2g_swath(frontend, scene, convert_area_defs=True):
         else:
             areas[area_name] = swath_def = area_to_swath_def(ds.attrs["area"],
                                                              chunks=ds.data.chunks,
-                                                             overwrite_existing=overwrite_existing)
+                                                             overwrite_existing=overwrite_existing,
+                                                             store_sources=store_sources,
+                                                             store_targets=store_targets)
             def_rps = ds.shape[0] if ds.ndim <= 2 else ds.shape[-2]
             swath_def.setdefault("rows_per_scan", ds.attrs.get("rows_per_scan", def_rps))
 
-        for swath_product in dataarray_to_swath_product(ds, swath_def, overwrite_existing=overwrite_existing):
+        for swath_product in dataarray_to_swath_product(ds, swath_def, overwrite_existing=overwrite_existing,
+                                                        store_sources=store_sources, store_targets=store_targets):
             swath_product.setdefault('reader', frontend.reader)
             p2g_scene[swath_product["product_name"]] = swath_product
 
+    LOG.info("Writing geolocation and band data to disk cache...")
+    da.store(store_sources, store_targets)
     return p2g_scene
 
 
@@ -329,16 +353,21 @@ def convert_satpy_to_p2g_gridded(frontend, scene):
     p2g_scene = containers.GriddedScene()
     overwrite_existing = frontend.overwrite_existing
     areas = {}
+    store_sources = []
+    store_targets = []
     for ds in scene:
         if ds.attrs["area"].name in areas:
             grid_def = areas[ds.attrs["area"].name]
         else:
             areas[ds.attrs["area"].name] = grid_def = area_to_grid_definition(ds.attrs["area"],
                                                                              overwrite_existing=overwrite_existing)
-        gridded_product = dataarray_to_gridded_product(ds, grid_def, overwrite_existing=overwrite_existing)
+        gridded_product = dataarray_to_gridded_product(ds, grid_def, overwrite_existing=overwrite_existing,
+                                                       store_sources=store_sources, store_targets=store_targets)
         gridded_product.setdefault('reader', frontend.reader)
         p2g_scene[gridded_product["name"]] = gridded_product
 
+    LOG.info("Writing gridded data to disk cache...")
+    da.store(store_sources, store_targets)
     return p2g_scene
 
 
@@ -88,6 +88,7 @@ from scipy.interpolate.interpnd import _ndim_coords_from_arrays
 from scipy.spatial import cKDTree
 
 from polar2grid.core.containers import GriddedProduct, GriddedScene, SwathScene
+from polar2grid.core.statistics import get_statistics
 from polar2grid.grids import GridManager
 from pyresample.ewa import fornav, ll2cr
 
@@ -368,7 +369,13 @@ class Remapper(object):
                 gridded_product["grid_data"] = fornav_fp
 
                 grid_coverage = kwargs.get("grid_coverage", GRID_COVERAGE)
-                grid_covered_ratio = valid_points / float(grid_def["width"] * grid_def["height"])
+                num_points = grid_def["width"] * grid_def["height"]
+                # fornav already counted the valid output pixels
+                stats = get_statistics().start("remap", product_name, grid_def["grid_name"])
+                if stats is not None:
+                    stats.add(valid_points, num_points - valid_points)
+                get_statistics().finish(stats)
+                grid_covered_ratio = valid_points / float(num_points)
                 grid_covered = grid_covered_ratio > grid_coverage
                 if not grid_covered:
                     msg = "EWA resampling only found %f%% of the grid covered (need %f%%) for %s" % (grid_covered_ratio * 100, grid_coverage * 100, product_name)
@@ -471,6 +478,9 @@ class Remapper(object):
                     values = numpy.append(image_array[good_mask], image_array.dtype.type(fill_value))
                     output_array = values[i]
                     output_array.tofile(output_fn)
+                    # count the valid pixels while the output is still in memory instead of reading the file again
+                    num_points = output_array.size
+                    valid_points = num_points - numpy.count_nonzero(mask_helper(output_array, fill_value))
 
                     # Give the gridded product ownership of the remapped data
                     swath_product = swath_scene[product_name]
@@ -481,8 +491,11 @@ class Remapper(object):
                     gridded_product["grid_data"] = output_fn
 
                     # Check grid coverage
-                    valid_points = numpy.count_nonzero(~gridded_product.get_data_mask())
-                    grid_covered_ratio = valid_points / float(grid_def["width"] * grid_def["height"])
+                    stats = get_statistics().start("remap", product_name, grid_def["grid_name"])
+                    if stats is not None:
+                        stats.add(valid_points, num_points - valid_points)
+                    get_statistics().finish(stats)
+                    grid_covered_ratio = valid_points / float(num_points)
                     grid_covered = grid_covered_ratio > grid_coverage
                     if not grid_covered:
                         msg = "Nearest neighbor resampling only found %f%% of the grid covered (need %f%%) for %s" % (grid_covered_ratio * 100, grid_coverage * 100, product_name)
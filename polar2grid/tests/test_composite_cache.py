@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Tests for the run-scoped SatPy composite cache.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+
+"""
+__docformat__ = "restructuredtext en"
+
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from polar2grid.composite_cache import CompositeCache, CachedCompositor
+
+
+class _FakeCompositor(object):
+    def __init__(self, comp_id):
+        self.id = comp_id
+        self.attrs = {"name": comp_id}
+        self.calls = 0
+
+    def __call__(self, projectables, optional_datasets=None, **info):
+        self.calls += 1
+        return sum(projectables) * 2
+
+
+def _data_arr(area, value=1.):
+    xr = pytest.importorskip("xarray")
+    return xr.DataArray(np.full((2, 3), value), dims=("y", "x"), attrs={"area": area})
+
+
+def _area(area_id, width=3):
+    from pyresample.geometry import AreaDefinition
+    return AreaDefinition(area_id, area_id, area_id, "+proj=latlong", width, 2, (-10., -10., 10., 10.))
+
+
+class TestCompositeCache(object):
+    def test_same_id_and_area(self):
+        cache = CompositeCache()
+        compositor = _FakeCompositor("sunz_corrected")
+        cached = CachedCompositor(compositor, cache)
+        assert cached.attrs["name"] == "sunz_corrected"
+
+        first = cached([_data_arr(_area("a"))])
+        first.attrs["modified"] = True
+        # equal area definitions with different names are the same area
+        second = cached([_data_arr(_area("b"))])
+        assert compositor.calls == 1
+        assert cache.hits["sunz_corrected"] == 1
+        assert "modified" not in second.attrs
+        np.testing.assert_array_equal(second, first)
+
+        cached([_data_arr(_area("c", width=4))])
+        assert compositor.calls == 2
+        assert cache.misses["sunz_corrected"] == 2
+
+    def test_install(self):
+        from satpy.node import CompositorNode, Node
+        cache = CompositeCache()
+        compositor = _FakeCompositor("rayleigh_corrected")
+        comp_node = CompositorNode(compositor)
+        comp_node.add_child(Node("C01"))
+        root = Node(None)
+        root.add_child(comp_node)
+
+        class _FakeScene(object):
+            _dependency_tree = root
+
+        assert cache.install(_FakeScene()) == 1
+        assert isinstance(comp_node.compositor, CachedCompositor)
+        # already installed
+        assert cache.install(_FakeScene()) == 0
+        comp_node.compositor([_data_arr(_area("a"))])
+        comp_node.compositor([_data_arr(_area("a"))])
+        assert compositor.calls == 1
+
+
+def main():
+    return pytest.main([os.path.realpath(__file__)])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Tests for the compiled SatPy enhancement chains.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+
+"""
+__docformat__ = "restructuredtext en"
+
+
+import pickle
+
+import dask
+import numpy as np
+import pytest
+
+pytest.importorskip("satpy")
+da = pytest.importorskip("dask.array")
+xr = pytest.importorskip("xarray")
+from trollimage.xrimage import XRImage  # noqa: E402
+try:
+    from satpy.enhancements.contrast import stretch, gamma, invert  # noqa: E402
+except ImportError:
+    from satpy.enhancements import stretch, gamma, invert  # noqa: E402
+
+from polar2grid.writers.enhancement_compiler import CompilingEnhancer, FusedOperations, is_elementwise  # noqa: E402
+
+OPERATIONS = [
+    {"name": "stretch", "method": stretch, "kwargs": {"stretch": "crude", "min_stretch": 10., "max_stretch": 90.}},
+    {"name": "gamma", "method": gamma, "kwargs": {"gamma": 1.5}},
+    {"name": "invert", "method": invert, "args": [True]},
+]
+
+
+class _FakeTree(object):
+    match_keys = ("name", "sensor")
+
+    def __init__(self, operations):
+        self.operations = operations
+        self.calls = 0
+
+    def find_match(self, **info):
+        self.calls += 1
+        return {"operations": self.operations}
+
+
+RGB_OPERATIONS = [
+    {"name": "stretch", "method": stretch,
+     "kwargs": {"stretch": "crude", "min_stretch": [0., 10., 20.], "max_stretch": [100., 90., 80.]}},
+    {"name": "gamma", "method": gamma, "kwargs": {"gamma": [1., 1.5, 2.]}},
+    {"name": "invert", "method": invert, "args": [[False, True, False]]},
+]
+
+
+def _image(bands=None):
+    data = np.linspace(-5., 105., 40 * 30, dtype=np.float32).reshape((40, 30))
+    if bands is None:
+        return XRImage(xr.DataArray(da.from_array(data, chunks=10), dims=("y", "x"), attrs={"name": "test"}))
+    data = da.from_array(np.array([data] * len(bands)), chunks=(1, 10, 10))
+    return XRImage(xr.DataArray(data, dims=("bands", "y", "x"), coords={"bands": bands}, attrs={"name": "test"}))
+
+
+def _apply_sequential(img, operations):
+    for op in operations:
+        op["method"](img, *op.get("args", []), **op.get("kwargs", {}))
+    return img
+
+
+def _enhancer(operations, cache_filename=None):
+    enhancer = CompilingEnhancer(cache_filename=cache_filename)
+    enhancer.enhancement_tree = _FakeTree(operations)
+    return enhancer
+
+
+class TestCompilingEnhancer(object):
+    def test_is_elementwise(self):
+        assert all(is_elementwise(op) for op in OPERATIONS)
+        assert not is_elementwise({"method": stretch, "kwargs": {"stretch": "linear"}})
+        assert not is_elementwise({"method": stretch, "kwargs": {"stretch": "crude"}})
+
+    def test_fused_matches_sequential(self):
+        expected = _apply_sequential(_image(), OPERATIONS)
+
+        enhancer = _enhancer(OPERATIONS)
+        pipeline = enhancer.get_pipeline(name="test", sensor={"viirs"})
+        assert len(pipeline) == 1 and isinstance(pipeline[0], FusedOperations)
+        img = _image()
+        enhancer.apply(img, name="test", sensor={"viirs"})
+        assert enhancer.enhancement_tree.calls == 1
+
+        assert img.data.dtype == expected.data.dtype
+        assert len(img.data.data.__dask_graph__().layers) < len(expected.data.data.__dask_graph__().layers)
+        np.testing.assert_array_equal(img.data.values, expected.data.values)
+        history = img.data.attrs["enhancement_history"]
+        assert len(history) == len(expected.data.attrs["enhancement_history"])
+        assert history[1] == {"gamma": 1.5}
+
+    def test_per_band_parameters(self):
+        bands = ["R", "G", "B"]
+        expected = _apply_sequential(_image(bands), RGB_OPERATIONS)
+        img = _image(bands)
+        _enhancer(RGB_OPERATIONS).apply(img, name="test", sensor="viirs")
+        assert img.data.dtype == expected.data.dtype
+        # float32 power of broadcast per-band exponents may differ by one ulp
+        np.testing.assert_allclose(img.data.values, expected.data.values, rtol=1e-6)
+
+    def test_threaded_compute_keeps_dask_config(self):
+        img = _image()
+        _enhancer(OPERATIONS).apply(img, name="test", sensor="viirs")
+        with dask.config.set(scheduler="threads"):
+            img.data.compute()
+        assert dask.config.get("scheduler", None) is None
+
+    def test_cache_file(self, tmp_path):
+        cache_fn = str(tmp_path / "enhancements.pkl")
+        enhancer = _enhancer(OPERATIONS, cache_filename=cache_fn)
+        enhancer.get_pipeline(name="test", sensor={"viirs"})
+        enhancer.save_cache()
+        with open(cache_fn, "rb") as cache_file:
+            assert len(pickle.load(cache_file)) == 1
+
+        enhancer = _enhancer(OPERATIONS, cache_filename=cache_fn)
+        enhancer.get_pipeline(name="test", sensor={"viirs"})
+        assert enhancer.enhancement_tree.calls == 0
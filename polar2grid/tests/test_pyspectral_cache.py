@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Tests for the pyspectral lookup table cache.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+
+"""
+__docformat__ = "restructuredtext en"
+
+
+import os
+import sys
+import types
+
+import numpy as np
+import pytest
+
+from polar2grid.pyspectral_cache import RayleighLUTCache, get_rayleigh_requirements, install_lut_cache, \
+    prepare_cache
+
+
+def _fake_lut(tmpdir):
+    lut_dir = tmpdir.mkdir("rayleigh_only")
+    lut_filename = str(lut_dir.join("rayleigh_lut_us-standard.h5"))
+    with open(lut_filename, "wb") as lut_file:
+        lut_file.write(b"\0" * 128)
+    arrays = (np.random.RandomState(0).uniform(size=(4, 3, 5, 6)).astype(np.float32),
+              np.linspace(400., 800., 4), np.linspace(0., 180., 3), np.linspace(1., 3., 5), np.linspace(1., 25., 6))
+    return lut_filename, arrays
+
+
+class TestRayleighLUTCache(object):
+    def test_round_trip(self, tmpdir):
+        lut_filename, arrays = _fake_lut(tmpdir)
+        cache = RayleighLUTCache(str(tmpdir.join("cache")))
+        assert cache.get_lut(lut_filename) is None
+        cache.put_lut(lut_filename, arrays)
+        cache.put_wavelength("GOES-16", "abi", "C01", 0.47)
+        cache.save()
+
+        # new instance reads the manifest
+        cache = RayleighLUTCache(str(tmpdir.join("cache")))
+        cached = cache.get_lut(lut_filename)
+        assert isinstance(cached[0], np.memmap)
+        for expected, result in zip(arrays, cached):
+            np.testing.assert_array_equal(result, expected)
+        assert cache.get_wavelength("GOES-16", "abi", "C01") == 0.47
+        assert cache.get_wavelength("GOES-16", "abi", "C02") is None
+
+        # a changed lookup table file isn't used
+        with open(lut_filename, "ab") as lut_file:
+            lut_file.write(b"\0")
+        assert cache.get_lut(lut_filename) is None
+
+    def test_install_without_cache(self, tmpdir):
+        assert install_lut_cache(str(tmpdir.join("missing"))) is None
+
+    def test_rayleigh_requirements(self):
+        pytest.importorskip("satpy")
+        requirements = get_rayleigh_requirements(["abi"], ["true_color"])
+        rayleigh_bands = set(band for bands in requirements.values() for band in bands)
+        assert rayleigh_bands
+        assert rayleigh_bands <= {"C01", "C02", "C03"}
+        assert not get_rayleigh_requirements(["abi"], ["not_a_composite"])
+
+
+@pytest.fixture
+def fake_pyspectral(tmpdir, monkeypatch):
+    """Replace pyspectral with modules that record every attempt to use (and download) its data."""
+    calls = []
+
+    class _Rayleigh(object):
+        def __init__(self, *args, **kwargs):
+            calls.append(("Rayleigh", args, kwargs))
+
+    config = {"rayleigh_dir": str(tmpdir.join("rayleigh")), "rsr_dir": str(tmpdir.join("rsr"))}
+    psp = types.ModuleType("pyspectral")
+    psp_rayleigh = types.ModuleType("pyspectral.rayleigh")
+    psp_rayleigh.Rayleigh = _Rayleigh
+    psp_rayleigh.get_reflectance_lut_from_file = lambda filename: calls.append(("get_lut", filename))
+    psp_config = types.ModuleType("pyspectral.config")
+    psp_config.get_config = lambda: config
+    psp.rayleigh = psp_rayleigh
+    psp.config = psp_config
+    monkeypatch.setitem(sys.modules, "pyspectral", psp)
+    monkeypatch.setitem(sys.modules, "pyspectral.rayleigh", psp_rayleigh)
+    monkeypatch.setitem(sys.modules, "pyspectral.config", psp_config)
+    return config, calls
+
+
+class TestPrepareCache(object):
+    def test_missing_lut(self, tmpdir, fake_pyspectral):
+        config, calls = fake_pyspectral
+        requirements = {("abi", "us-standard", "rayleigh_only"): {"C01"}}
+        problems = prepare_cache(str(tmpdir.join("cache")), requirements, platforms=["GOES-16"], check_only=True)
+        expected_fn = os.path.join(config["rayleigh_dir"], "rayleigh_only", "rayleigh_lut_us-standard.h5")
+        assert len(problems) == 1
+        assert "Missing rayleigh lookup table" in problems[0]
+        assert expected_fn in problems[0]
+        # nothing that could download the missing file was called
+        assert not calls
+
+    def test_missing_rsr(self, tmpdir, fake_pyspectral):
+        config, calls = fake_pyspectral
+        lut_dir = tmpdir.mkdir("rayleigh").mkdir("rayleigh_only")
+        lut_dir.join("rayleigh_lut_us-standard.h5").write(b"\0", mode="wb")
+        requirements = {("abi", "us-standard", "rayleigh_only"): {"C01"}}
+        problems = prepare_cache(str(tmpdir.join("cache")), requirements, platforms=["GOES-16"], check_only=True)
+        assert len(problems) == 1
+        assert os.path.join(config["rsr_dir"], "rsr_abi_GOES-16.h5") in problems[0]
+        assert not calls
+
+
+def main():
+    return pytest.main([os.path.realpath(__file__)])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Tests for converting SatPy Scenes to Polar2Grid swath and gridded scenes.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+"""
+__docformat__ = "restructuredtext en"
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+pytest.importorskip("satpy")
+da = pytest.importorskip("dask.array")
+xr = pytest.importorskip("xarray")
+from pyresample.geometry import SwathDefinition  # noqa: E402
+
+from polar2grid.readers import convert_satpy_to_p2g_swath, convert_satpy_to_p2g_gridded  # noqa: E402
+
+
+class _FakeFrontend(object):
+    overwrite_existing = False
+    reader = "fake"
+
+
+def _scene():
+    lons = xr.DataArray(da.from_array(np.tile(np.linspace(-10., 10., 6), (4, 1)), chunks=2), dims=("y", "x"),
+                        attrs={"name": "longitude"})
+    lats = xr.DataArray(da.from_array(np.tile(np.linspace(10., -10., 4)[:, None], (1, 6)), chunks=2),
+                        dims=("y", "x"), attrs={"name": "latitude"})
+    area = SwathDefinition(lons, lats)
+    area.name = "test_swath"
+    attrs = {
+        "platform_name": "npp",
+        "sensor": "viirs",
+        "standard_name": "toa_bidirectional_reflectance",
+        "start_time": datetime(2021, 1, 1, 12, 0),
+        "end_time": datetime(2021, 1, 1, 12, 5),
+        "rows_per_scan": 2,
+        "calibration": "reflectance",
+        "resolution": 742,
+        "area": area,
+    }
+    data = np.arange(24, dtype=np.float64).reshape((4, 6))
+    return [
+        xr.DataArray(da.from_array(data, chunks=2), dims=("y", "x"), attrs=dict(attrs, name="M01")),
+        xr.DataArray(da.ones((4, 6), chunks=2), dims=("y", "x"), attrs=dict(attrs, name="M02")),
+    ]
+
+
+class TestConvertSatpy(object):
+    def test_swath(self, tmpdir, monkeypatch):
+        monkeypatch.chdir(tmpdir)
+        scene = _scene()
+        p2g_scene = convert_satpy_to_p2g_swath(_FakeFrontend(), scene)
+        for ds in scene:
+            np.testing.assert_array_equal(p2g_scene[ds.attrs["name"]].get_data_array(), ds.values)
+        swath_def = p2g_scene["M01"]["swath_definition"]
+        np.testing.assert_allclose(swath_def.get_longitude_array(), scene[0].attrs["area"].lons.values)
+        np.testing.assert_allclose(swath_def.get_latitude_array(), scene[0].attrs["area"].lats.values)
+
+    def test_gridded(self, tmpdir, monkeypatch):
+        monkeypatch.chdir(tmpdir)
+        scene = _scene()
+        p2g_scene = convert_satpy_to_p2g_gridded(_FakeFrontend(), scene)
+        for ds in scene:
+            np.testing.assert_array_equal(p2g_scene[ds.attrs["name"]].get_data_array(), ds.values)
@@ -47,7 +47,7 @@ import logging
 import numpy
 import os
 
-from polar2grid.core.frontend_utils import BaseMultiFileReader, BaseFileReader
+from polar2grid.core.frontend_utils import BaseMultiFileReader, BaseFileReader, file_access
 from polar2grid.viirs import guidebook
 from polar2grid.viirs.guidebook import K_MOONILLUM
 from polar2grid.readers import normalize_satellite_name
@@ -58,35 +58,56 @@ ORBIT_TRANSITION_THRESHOLD = timedelta(seconds=10)
 
 class HDF5Reader(object):
     """Generic HDF5 reading class.
+
+    Variables are accessed by their path in the file (ex. "All_Data/VIIRS-M1-SDR_All/Radiance"), variable
+    attributes by "<variable path>.<attribute name>", and global attributes by ".<attribute name>". Keys are
+    resolved the first time they are requested instead of walking the entire file when it is opened, the resolved
+    h5py object or attribute value is remembered for later requests.
     """
     def __init__(self, filename):
         self.filename = os.path.basename(filename)
         self.filepath = os.path.realpath(filename)
         self._h5_handle = h5py.File(filename, 'r')
         self.file_items = {}
-        self._h5_handle.visititems(self._visit_items)
-        # Also add the global attributes
-        for attr_name, attr_val in self._h5_handle.attrs.items():
-            try:    
-                self.file_items["." + attr_name] = attr_val[0][0]
-            except TypeError:
-                self.file_items["." + attr_name] = attr_val[0]        
-
-    def _visit_items(self, name, obj):
-        """Look at each variable in the HDF file and record its attributes.
-
-        We also store the variable name because sometimes h5py gives you an
-        unhelpful/weird KeyError if it doesn't have that key.
+
+    def _get_global_attribute(self, attr_name):
+        attr_val = self._h5_handle.attrs[attr_name]
+        try:
+            return attr_val[0][0]
+        except TypeError:
+            return attr_val[0]
+
+    def _resolve_key(self, key):
+        """Find the HDF5 object or attribute represented by `key`.
+
+        :raises: KeyError if `key` doesn't exist in the file
         """
-        self.file_items[name] = obj
-        for attr_name, attr_obj in obj.attrs.items():
-            self.file_items[name + "." + attr_name] = attr_obj
+        if key.startswith("."):
+            return self._get_global_attribute(key[1:])
 
-    def __contains__(self, key):
-        if key.startswith("/"):
-            key = key[1:]
+        try:
+            return self._h5_handle[key]
+        except (KeyError, ValueError):
+            pass
+
+        # variable attribute, either name could have a period in it so try every possible split
+        dot_idx = key.find(".")
+        while dot_idx != -1:
+            var_name, attr_name = key[:dot_idx], key[dot_idx + 1:]
+            try:
+                return self._h5_handle[var_name].attrs[attr_name]
+            except (KeyError, ValueError):
+                dot_idx = key.find(".", dot_idx + 1)
+
+        # h5py sometimes gives you an unhelpful/weird KeyError if it doesn't have the key
+        raise KeyError("'%s' not found in HDF5 file '%s'" % (key, self.filepath))
 
-        return key in self.file_items
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
 
     def __getitem__(self, key):
         """Get HDF5 variable, making it easier to access attributes.
@@ -94,7 +115,11 @@ class HDF5Reader(object):
         if key.startswith("/"):
             key = key[1:]
 
-        return self.file_items[key]
+        try:
+            return self.file_items[key]
+        except KeyError:
+            self.file_items[key] = val = self._resolve_key(key)
+            return val
 
 
 def file_time_to_datetime(file_time):
@@ -125,6 +150,8 @@ class VIIRSSDRReader(BaseFileReader):
         :param file_type_info: Dictionary mapping file key constants to the variable path in the file
         """
         super(VIIRSSDRReader, self).__init__(file_handle, file_type_info)
+        if self._load_cataloged_info():
+            return
 
         self.satellite = self[guidebook.K_SATELLITE]
         self.satellite = normalize_satellite_name(self.satellite)
@@ -225,6 +252,7 @@ class VIIRSSDRMultiReader(BaseMultiFileReader):
         """
         super(VIIRSSDRMultiReader, self).__init__(file_type_info, VIIRSSDRReader)
 
+    @file_access
     def get_orbit_rows(self, data_key):
         """List of number of rows for each orbit being processed.
 
@@ -237,7 +265,7 @@ class VIIRSSDRMultiReader(BaseMultiFileReader):
         orbit_rows = []
         begin_times = [fr.begin_time for fr in self.file_readers]
         end_times = [fr.end_time for fr in self.file_readers]
-        num_rows = [fr[data_key].shape[0] for fr in self.file_readers]
+        num_rows = [self._get_file_swath_shape(fr, data_key)[0] for fr in self.file_readers]
         prev_end = end_times[0]
         current_num_rows = num_rows[0]
         for idx in range(1, len(begin_times)):
@@ -252,6 +280,7 @@ class VIIRSSDRMultiReader(BaseMultiFileReader):
 
         return orbit_rows
 
+    @file_access
     def __getitem__(self, item):
         val = super(VIIRSSDRMultiReader, self).__getitem__(item)
         if item == K_MOONILLUM:
@@ -46,7 +46,8 @@ __docformat__ = "restructuredtext en"
 
 import logging
 import numpy
-from polar2grid.core.histogram import local_histogram_equalization, histogram_equalization
+from polar2grid.core.histogram import local_histogram_equalization, histogram_equalization, \
+    histogram_equalization_chunked
 
 # from mpl_toolkits.basemap import maskoceans
 
@@ -262,16 +263,16 @@ def dnb_scale(img, fillValue=-999.0, solarZenithAngle=None,
 
     if day_mask is not None and day_mask.any():
         LOG.debug("  scaling DNB in day mask")
-        histogram_equalization(img, day_mask, out=out)
+        histogram_equalization_chunked(img, day_mask, out=out)
 
     if mixed_mask is not None and (len(mixed_mask) > 0):
         LOG.debug("  scaling DNB in twilight mask")
         for mask in mixed_mask:
-            histogram_equalization(img, mask, out=out)
+            histogram_equalization_chunked(img, mask, out=out)
 
     if night_mask is not None and night_mask.any():
         LOG.debug("  scaling DNB in night mask")
-        histogram_equalization(img, night_mask, out=out)
+        histogram_equalization_chunked(img, night_mask, out=out)
 
     # set any data that's not in the good areas to fill
     out[~good_mask] = fillValue
@@ -207,7 +207,7 @@ import os
 from scipy.special import erf
 
 from polar2grid.core import containers, histogram, roles
-from polar2grid.core.frontend_utils import ProductDict, GeoPairDict
+from polar2grid.core.frontend_utils import ProductDict, GeoPairDict, TASK_RAW, run_dependent_tasks
 from . import guidebook
 # FIXME: Actually use the Geo Readers
 from .io import VIIRSSDRMultiReader, HDF5Reader
@@ -480,6 +480,58 @@ PRODUCTS.add_product(PRODUCT_ADAPTIVE_M15, PAIR_MNAV, "equalized_brightness_temp
 PRODUCTS.add_product(PRODUCT_ADAPTIVE_M16, PAIR_MNAV, "equalized_brightness_temperature", dependencies=(PRODUCT_M16,), units='1', valid_min=0, valid_max=1)
 
 
+def dnb_saturation_steps(dnb_data, max_val, max_saturation=0.005, step=1.1):
+    """Number of times `max_val` must be multiplied by `step` so at most `max_saturation` of `dnb_data` is above it.
+
+    This gives the same answer as::
+
+        while float(numpy.count_nonzero(dnb_data > max_val)) / dnb_data.size > max_saturation:
+            max_val *= step
+
+    but only compares the entire swath once. Pixels that are not saturated by the original `max_val` can never be
+    saturated by a larger one so the rest of the search only looks at the saturated pixels. The number of steps is
+    estimated from the distribution of ``dnb_data / max_val`` for those pixels and then checked (and adjusted) by
+    doing the same repeated multiplications as the loop above so the result is exact.
+    """
+    size = dnb_data.size
+    max_val = numpy.broadcast_to(max_val, dnb_data.shape)
+
+    def _too_saturated(num_saturated):
+        return float(num_saturated) / size > max_saturation
+
+    sat_mask = dnb_data > max_val
+    num_saturated = numpy.count_nonzero(sat_mask)
+    LOG.debug("Dynamic DNB saturation percentage: %f", float(num_saturated) / size)
+    if not _too_saturated(num_saturated):
+        return 0
+
+    sat_data = dnb_data[sat_mask]
+    sat_max = max_val[sat_mask]
+    # the answer is about the number of steps needed by the pixel that is the (allowed + 1)th brightest relative to
+    # its max value
+    allowed = min(int(max_saturation * size), num_saturated - 1)
+    with numpy.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        pixel_steps = numpy.ceil(numpy.log(sat_data / sat_max) / numpy.log(step))
+    kth = num_saturated - allowed - 1
+    estimate = numpy.partition(pixel_steps, kth)[kth]
+    # leave room for rounding differences between the estimate and repeated multiplication
+    steps = int(estimate) - 2 if numpy.isfinite(estimate) and estimate > 2 else 0
+    for _ in range(steps):
+        sat_max *= step
+    if steps and not _too_saturated(numpy.count_nonzero(sat_data > sat_max)):
+        LOG.debug("Dynamic DNB saturation estimate was too high, searching from the original max value")
+        sat_max = max_val[sat_mask]
+        steps = 0
+
+    num_saturated = numpy.count_nonzero(sat_data > sat_max)
+    while _too_saturated(num_saturated):
+        sat_max *= step
+        steps += 1
+        num_saturated = numpy.count_nonzero(sat_data > sat_max)
+    LOG.debug("Dynamic DNB saturation percentage after %d steps: %f", steps, float(num_saturated) / size)
+    return steps
+
+
 class Frontend(roles.FrontendRole):
     FILE_EXTENSIONS = [".h5"]
     DEFAULT_FILE_READER = VIIRSSDRMultiReader
@@ -542,17 +594,37 @@ class Frontend(roles.FrontendRole):
         for file_type, file_type_info in guidebook.FILE_TYPES.items():
             cls = file_type_info.get("file_type_class", self.DEFAULT_FILE_READER)
             self.file_readers[file_type] = cls(file_type_info)
+            self.file_readers[file_type].file_catalog = self.file_catalog
         # Don't modify the passed list (we use in place operations)
         file_paths_left = []
         for fp in file_paths:
+            # cataloged files aren't opened until their data is read
+            h = None
+            if self.file_catalog is not None:
+                h = self.file_catalog.get_file_handle(fp, HDF5Reader)
+            if h is not None:
+                if h.file_type in self.file_readers:
+                    self.file_readers[h.file_type].add_file(h)
+                else:
+                    # we've seen this file before and didn't know what to do with it
+                    file_paths_left.append(fp)
+                continue
+
             h = HDF5Reader(fp)
             for data_path, file_type in guidebook.DATA_PATHS.items():
                 if data_path in h:
                     self.file_readers[file_type].add_file(h)
+                    if self.file_catalog is not None:
+                        self.file_catalog.update_from_reader(self.file_readers[file_type].file_readers[-1], file_type)
                     break
             else:
+                if self.file_catalog is not None:
+                    self.file_catalog.update(fp, file_type=None)
                 file_paths_left.append(fp)
 
+        if self.file_catalog is not None:
+            self.file_catalog.save()
+
         # Log what files we were given that we didn't understand
         for fp in file_paths_left:
             LOG.debug("Unrecognized file: %s", fp)
@@ -684,7 +756,10 @@ class Frontend(roles.FrontendRole):
 
         try:
             # TODO: Do something with data type
-            shape = file_reader.write_var_to_flat_binary(file_key, filename)
+            swath_data = file_reader.get_swath_data(file_key, filename=filename, dtype=numpy.float32)
+            shape = swath_data.shape
+            swath_data.flush()
+            del swath_data
             rows_per_scan = self.GEO_PAIRS[product_def.geo_pair_name].rows_per_scan
         except (RuntimeError, ValueError, KeyError, OSError):
             LOG.error("Could not extract data from file. Use '--no-tc' flag if terrain-corrected data is not available")
@@ -748,8 +823,7 @@ class Frontend(roles.FrontendRole):
         # Needs to be ordered (least-depended product -> most-depended product)
         products_needed = self.PRODUCTS.dependency_ordered_products(products)
         geo_pairs_needed = self.PRODUCTS.geo_pairs_for_products(products_needed)
-        # both lists below include raw products that need extra processing/masking
-        raw_products_needed = (p for p in products_needed if self.PRODUCTS.is_raw(p, geo_is_raw=False))
+        # includes raw products that need extra processing/masking
         secondary_products_needed = [p for p in products_needed if self.PRODUCTS.needs_processing(p)]
         for p in secondary_products_needed:
             if p not in self.secondary_product_functions:
@@ -782,34 +856,36 @@ class Frontend(roles.FrontendRole):
             swath_def = self.create_swath_definition(lon_swath, lat_swath)
             swath_definitions[swath_def["swath_name"]] = swath_def
 
-        # Create each raw products (products that are loaded directly from the file)
-        for product_name in raw_products_needed:
-            if product_name in products_created:
-                # already created
-                continue
-
-            try:
+        # Create raw products (loaded directly from the file) and dependent/special case products (non-raw products or
+        # raw products that need further processing), independent products may be created at the same time
+        def _create_product(task):
+            stage, product_name = task
+            if stage == TASK_RAW:
                 LOG.info("Creating data product '%s'", product_name)
                 swath_def = swath_definitions[self.PRODUCTS[product_name].geo_pair_name]
-                one_swath = products_created[product_name] = self.create_raw_swath_object(product_name, swath_def)
-            except (RuntimeError, ValueError, KeyError, OSError):
-                LOG.error("Could not create raw product '%s'", product_name)
-                if self.exit_on_error:
-                    raise
-                continue
-
-            if product_name in products:
-                # the user wants this product
-                scene[product_name] = one_swath
-
-        # Dependent products and Special cases (i.e. non-raw products that need further processing)
-        for product_name in reversed(secondary_products_needed):
-            product_func = self.secondary_product_functions[product_name]
+                return self.create_raw_swath_object(product_name, swath_def)
+            LOG.info("Creating secondary product '%s'", product_name)
             swath_def = swath_definitions[self.PRODUCTS[product_name].geo_pair_name]
+            return self.secondary_product_functions[product_name](product_name, swath_def, products_created)
+
+        task_dependencies = self.PRODUCTS.product_task_dependencies(products_needed)
+        for (stage, product_name), future in run_dependent_tasks(task_dependencies, _create_product, self.num_workers):
+            if stage == TASK_RAW:
+                try:
+                    one_swath = products_created[product_name] = future.result()
+                except (RuntimeError, ValueError, KeyError, OSError):
+                    LOG.error("Could not create raw product '%s'", product_name)
+                    if self.exit_on_error:
+                        raise
+                    continue
+
+                if product_name in products:
+                    # the user wants this product
+                    scene[product_name] = one_swath
+                continue
 
             try:
-                LOG.info("Creating secondary product '%s'", product_name)
-                one_swath = product_func(product_name, swath_def, products_created)
+                one_swath = future.result()
             except (RuntimeError, ValueError, KeyError, OSError):
                 LOG.error("Could not create product (unexpected error): '%s'", product_name)
                 LOG.debug("Could not create product (unexpected error): '%s'", product_name, exc_info=True)
@@ -828,6 +904,9 @@ class Frontend(roles.FrontendRole):
                 # the user wants this product
                 scene[product_name] = one_swath
 
+        if self.file_catalog is not None:
+            # remember any swath shapes we had to look up
+            self.file_catalog.save()
         return scene
 
     ### Secondary Product Functions
@@ -1047,12 +1126,8 @@ class Frontend(roles.FrontendRole):
 
             # Update from Curtis Seaman, increase max radiance curve until less than 0.5% is saturated
             if self.dnb_saturation_correction:
-                saturation_pct = float(numpy.count_nonzero(dnb_data > max_val)) / dnb_data.size
-                LOG.debug("Dynamic DNB saturation percentage: %f", saturation_pct)
-                while saturation_pct > 0.005:
+                for _ in range(dnb_saturation_steps(dnb_data, max_val, max_saturation=0.005, step=1.1)):
                     max_val *= 1.1
-                    saturation_pct = float(numpy.count_nonzero(dnb_data > max_val)) / dnb_data.size
-                    LOG.debug("Dynamic DNB saturation percentage: %f", saturation_pct)
 
             inner_sqrt = (dnb_data - min_val) / (max_val - min_val)
             # clip negative values to 0 before the sqrt
@@ -1182,6 +1257,11 @@ def add_frontend_argument_groups(parser):
                        help="Angle threshold of solar zenith angle used when deciding day or night")
     group.add_argument("--dnb-saturation-correction", action="store_true",
                        help="Enable dynamic DNB saturation correction (normally used for aurora scenes)")
+    group.add_argument("--file-catalog", dest="file_catalog",
+                       help="JSON file to cache input file information between runs (default: $P2G_FILE_CATALOG)")
+    group.add_argument("--num-workers", dest="num_workers", type=int,
+                       default=int(os.environ.get("P2G_FRONTEND_NUM_WORKERS", 1)),
+                       help="Number of independent products to create at the same time (default: 1)")
     group_title = "Frontend Swath Extraction"
     group = parser.add_argument_group(title=group_title, description="swath extraction options")
     # FIXME: Probably need some proper defaults
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Tests for the VIIRS SDR file reading helpers.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+
+"""
+__docformat__ = "restructuredtext en"
+
+import os
+import sys
+
+import numpy
+import pytest
+
+h5py = pytest.importorskip("h5py")
+from polar2grid.viirs.io import HDF5Reader  # noqa: E402
+
+RADIANCE_PATH = "All_Data/VIIRS-M1-SDR_All/Radiance"
+AGGR_PATH = "Data_Products/VIIRS-M1-SDR/VIIRS-M1-SDR_Aggr"
+
+
+@pytest.fixture
+def h5_filename(tmpdir):
+    filename = str(tmpdir.join("SVM01_npp_d20210101_t1200000_e1201250_b00001_c20210101130000000000_noaa_ops.h5"))
+    with h5py.File(filename, "w") as h:
+        # SDR global attributes are 2D arrays of strings
+        h.attrs["Platform_Short_Name"] = numpy.array([[b"NPP"]])
+        h.attrs["Distributor"] = numpy.array([[b"noaa"]])
+        radiance = h.create_dataset(RADIANCE_PATH, data=numpy.arange(12, dtype=numpy.float32).reshape((3, 4)))
+        radiance.attrs["units"] = "W m-2 sr-1 um-1"
+        aggr = h.create_dataset(AGGR_PATH, data=numpy.zeros((1,), dtype=numpy.uint8))
+        aggr.attrs["AggregateBeginningDate"] = numpy.array([[b"20210101"]])
+        # names with periods in them
+        aggr.attrs["Version.Number"] = numpy.array([[b"A1"]])
+        dotted = h.create_dataset("All_Data/VIIRS-M1-SDR_All/Dotted.Name", data=numpy.ones((2,), dtype=numpy.int8))
+        dotted.attrs["Flag.Meanings"] = "good bad"
+    return filename
+
+
+class TestHDF5Reader(object):
+    def test_names(self, h5_filename):
+        h = HDF5Reader(h5_filename)
+        assert h.filename == os.path.basename(h5_filename)
+        assert h.filepath == os.path.realpath(h5_filename)
+
+    def test_global_attributes(self, h5_filename):
+        h = HDF5Reader(h5_filename)
+        assert h[".Platform_Short_Name"] == b"NPP"
+        assert h[".Distributor"] == b"noaa"
+        with pytest.raises(KeyError):
+            h[".Missing_Attribute"]
+
+    def test_variables(self, h5_filename):
+        h = HDF5Reader(h5_filename)
+        radiance = h[RADIANCE_PATH]
+        assert isinstance(radiance, h5py.Dataset)
+        numpy.testing.assert_array_equal(radiance[:], numpy.arange(12, dtype=numpy.float32).reshape((3, 4)))
+        # leading slashes are ignored
+        assert h["/" + RADIANCE_PATH] is radiance
+
+    def test_variable_attributes(self, h5_filename):
+        h = HDF5Reader(h5_filename)
+        assert h[RADIANCE_PATH + ".units"] == "W m-2 sr-1 um-1"
+        assert h[AGGR_PATH + ".AggregateBeginningDate"][0][0] == b"20210101"
+        # periods in the attribute name
+        assert h[AGGR_PATH + ".Version.Number"][0][0] == b"A1"
+        # periods in the variable name and the attribute name
+        assert h["All_Data/VIIRS-M1-SDR_All/Dotted.Name.Flag.Meanings"] == "good bad"
+        numpy.testing.assert_array_equal(h["All_Data/VIIRS-M1-SDR_All/Dotted.Name"][:], [1, 1])
+        with pytest.raises(KeyError):
+            h[RADIANCE_PATH + ".missing_attr"]
+
+    def test_contains(self, h5_filename):
+        h = HDF5Reader(h5_filename)
+        assert RADIANCE_PATH in h
+        assert RADIANCE_PATH + ".units" in h
+        assert ".Platform_Short_Name" in h
+        assert AGGR_PATH + ".Version.Number" in h
+        assert "All_Data/VIIRS-M2-SDR_All/Radiance" not in h
+        assert RADIANCE_PATH + ".scale_factor" not in h
+        assert ".Missing_Attribute" not in h
+
+    def test_lazy_lookup(self, h5_filename):
+        """Keys are only looked up when requested and are remembered after that."""
+        h = HDF5Reader(h5_filename)
+        assert h.file_items == {}
+        radiance = h[RADIANCE_PATH]
+        assert list(h.file_items.keys()) == [RADIANCE_PATH]
+        assert h[RADIANCE_PATH] is radiance
+        # missing keys aren't remembered
+        assert "missing" not in h
+        assert "missing" not in h.file_items
+
+
+def main():
+    return pytest.main([os.path.realpath(__file__)])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -42,6 +42,74 @@ Documentation: http://www.ssec.wisc.edu/software/polar2grid/
 """
 __docformat__ = "restructuredtext en"
 
+import numpy
+import pytest
+
+
+def _iterative_dnb_saturation(dnb_data, max_val):
+    max_val = max_val.copy()
+    steps = 0
+    while float(numpy.count_nonzero(dnb_data > max_val)) / dnb_data.size > 0.005:
+        max_val *= 1.1
+        steps += 1
+    return steps, max_val
+
+
+class TestDynamicDNB(object):
+    @pytest.mark.parametrize("dtype", [numpy.float32, numpy.float64])
+    @pytest.mark.parametrize("bright_scale", [0.5, 5.0, 1e4])
+    def test_saturation_steps_match_loop(self, dtype, bright_scale):
+        from polar2grid.viirs.swath import dnb_saturation_steps
+        rs = numpy.random.RandomState(42)
+        dnb_data = rs.lognormal(-7.0, 2.0, size=(200, 300)).astype(dtype)
+        dnb_data[:20] *= bright_scale
+        dnb_data[50, :10] = numpy.nan
+        max_val = rs.uniform(1e-4, 1e-2, size=dnb_data.shape).astype(dtype)
+        expected_steps, expected_max = _iterative_dnb_saturation(dnb_data, max_val)
+
+        steps = dnb_saturation_steps(dnb_data, max_val, max_saturation=0.005, step=1.1)
+        assert steps == expected_steps
+        for _ in range(steps):
+            max_val *= 1.1
+        numpy.testing.assert_array_equal(max_val, expected_max)
+
+
+class TestCatalogedFiles(object):
+    def test_load_cataloged_files(self, tmpdir):
+        """Files known by the file catalog are sorted without being opened."""
+        from datetime import datetime, timedelta
+        from polar2grid.core.file_catalog import FileCatalog
+        from polar2grid.viirs import guidebook
+        from polar2grid.viirs.swath import Frontend
+
+        catalog = FileCatalog(str(tmpdir.join("catalog.json")))
+        file_paths = []
+        begin_time = datetime(2021, 1, 1, 12, 0, 0)
+        for idx in range(2):
+            # these aren't HDF5 files so opening them would fail
+            for file_type, prefix in ((guidebook.FILE_TYPE_M01, "SVM01"), (guidebook.FILE_TYPE_GMTCO, "GMTCO")):
+                fn = tmpdir.join("{}_npp_{:d}.h5".format(prefix, idx))
+                fn.write_binary(b"fake VIIRS SDR contents")
+                catalog.update(str(fn), file_type=file_type, instrument="viirs", satellite="npp",
+                               begin_time=begin_time + timedelta(seconds=idx * 85),
+                               end_time=begin_time + timedelta(seconds=(idx + 1) * 85))
+                file_paths.append(str(fn))
+        unknown_fn = tmpdir.join("unknown.h5")
+        unknown_fn.write_binary(b"not a VIIRS file")
+        catalog.update(str(unknown_fn), file_type=None)
+
+        frontend = Frontend.__new__(Frontend)
+        frontend.file_catalog = catalog
+        frontend._load_files(list(reversed(file_paths)) + [str(unknown_fn)])
+        assert sorted(frontend.file_readers.keys()) == sorted([guidebook.FILE_TYPE_M01, guidebook.FILE_TYPE_GMTCO])
+        m01_reader = frontend.file_readers[guidebook.FILE_TYPE_M01]
+        assert m01_reader.filepaths == [str(tmpdir.join("SVM01_npp_0.h5")), str(tmpdir.join("SVM01_npp_1.h5"))]
+        assert m01_reader.satellite == "npp"
+        assert frontend.begin_time == begin_time
+        assert frontend.end_time == begin_time + timedelta(seconds=170)
+        assert not any(fr.file_handle.is_open for fr in m01_reader.file_readers)
+
+
 if __name__ == '__main__':
     import sys
     import pytest
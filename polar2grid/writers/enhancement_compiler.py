@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+# Copyright (C) 2021 Space Science and Engineering Center (SSEC),
+#  University of Wisconsin-Madison.
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This file is part of the polar2grid software package. Polar2grid takes
+# satellite observation data, remaps it, and writes it to a file format for
+# input into another program.
+# Documentation: http://www.ssec.wisc.edu/software/polar2grid/
+"""Compile SatPy enhancement chains in to fewer dask operations.
+
+SatPy's `Enhancer` looks up the enhancement operations for every dataset
+that is saved and applies them one at a time, each adding its own layers to
+the dask graph. The `CompilingEnhancer` resolves the chain once per unique
+set of dataset identifying fields and replaces each run of consecutive
+crude stretches (with fixed limits), gamma corrections, and inversions with
+a single ``map_blocks`` call of a numpy kernel. Other operations (data
+dependent stretches, thresholds, colormaps, etc) are applied as usual.
+
+The kernel's parameters come from running the fused operations on a one
+pixel version of the image so the output data type and enhancement history
+are the same as applying the operations one at a time. Compiled chains are
+saved to a cache file (by default next to the enhancement configuration
+files) and reused by later runs as long as the configuration files haven't
+changed.
+
+:author:       David Hoese (davidh)
+:contact:      david.hoese@ssec.wisc.edu
+:organization: Space Science and Engineering Center (SSEC)
+:copyright:    Copyright (c) 2021 University of Wisconsin SSEC. All rights reserved.
+:license:      GNU GPLv3
+"""
+__docformat__ = "restructuredtext en"
+
+import os
+import pickle
+import logging
+
+import numpy
+
+try:
+    from satpy.enhancements.enhancer import Enhancer
+except ImportError:
+    from satpy.writers import Enhancer
+
+LOG = logging.getLogger(__name__)
+
+ENHANCEMENT_CACHE_FILENAME = ".p2g_compiled_enhancements.pkl"
+DEFAULT_MATCH_KEYS = ("name", "reader", "platform_name", "sensor", "standard_name", "units")
+
+
+def get_default_cache_filename():
+    """Cache file from ``P2G_ENHANCEMENT_CACHE`` or in the enhancement configuration directory."""
+    cache_fn = os.environ.get("P2G_ENHANCEMENT_CACHE")
+    if cache_fn is None and os.environ.get("PPP_CONFIG_DIR"):
+        cache_fn = os.path.join(os.environ["PPP_CONFIG_DIR"], "enhancements", ENHANCEMENT_CACHE_FILENAME)
+    return cache_fn
+
+
+def is_elementwise(operation):
+    """Check if an enhancement operation can be fused in to a `FusedOperations` kernel."""
+    method_name = getattr(operation["method"], "__name__", "")
+    if method_name == "stretch":
+        if operation.get("args"):
+            return False
+        kwargs = operation.get("kwargs", {})
+        # linear and histogram stretches depend on all of the data
+        return kwargs.get("stretch") in ("crude", "crude-stretch") and \
+            kwargs.get("min_stretch") is not None and kwargs.get("max_stretch") is not None
+    return method_name in ("gamma", "invert")
+
+
+def _run_operations(img, operations):
+    for operation in operations:
+        operation["method"](img, *operation.get("args", []), **operation.get("kwargs", {}))
+
+
+def _band_array(value, dims):
+    """Convert a scalar or per-band enhancement parameter to a numpy array that broadcasts against the data."""
+    band_dims = getattr(value, "dims", ())
+    value = numpy.asarray(getattr(value, "values", value))
+    if "bands" not in band_dims:
+        return value
+    shape = [1] * len(dims)
+    shape[dims.index("bands")] = value.size
+    return value.reshape(shape)
+
+
+def _enhance_block(block, kernel_steps, out_dtype):
+    for kind, first, second in kernel_steps:
+        if kind == "linear":
+            block = block * first + second
+        else:
+            block = numpy.clip(block, 0, None) ** first
+    return block.astype(out_dtype, copy=False)
+
+
+class FusedOperations(object):
+    """Crude stretch, gamma, and invert operations applied to each chunk of the data with one numpy kernel."""
+    def __init__(self, operations):
+        self.operations = operations
+
+    @property
+    def names(self):
+        return [operation.get("name", getattr(operation["method"], "__name__", "")) for operation in self.operations]
+
+    def _kernel_steps(self, history, dims, dtype):
+        """Numpy versions of the operations from the enhancement history they added.
+
+        Stretches and inversions record a scale and offset, gamma corrections record the gamma.
+        """
+        steps = []
+        for entry in history:
+            if "gamma" in entry:
+                gamma = entry["gamma"]
+                gamma_dtype = dtype if numpy.issubdtype(dtype, numpy.floating) else numpy.float32
+                gamma = numpy.array(gamma, dtype=gamma_dtype)
+                if "bands" in dims and gamma.ndim:
+                    shape = [1] * len(dims)
+                    shape[dims.index("bands")] = gamma.size
+                    gamma = gamma.reshape(shape)
+                steps.append(("gamma", 1.0 / gamma, None))
+            else:
+                steps.append(("linear", _band_array(entry["scale"], dims), _band_array(entry["offset"], dims)))
+                dtype = numpy.result_type(numpy.zeros(1, dtype=dtype) * steps[-1][1] + steps[-1][2])
+        return steps
+
+    def __call__(self, img):
+        import dask.array as da
+        import xarray as xr
+        from trollimage.xrimage import XRImage
+
+        data = img.data
+        if not isinstance(data.data, da.Array):
+            _run_operations(img, self.operations)
+            return
+        if "bands" in data.dims:
+            # per-band parameters are applied to every band in each chunk
+            data = data.chunk({"bands": -1})
+        dims = data.dims
+        band_coords = {"bands": data.coords["bands"].values} if "bands" in data.coords else {}
+
+        # kernel parameters, resulting data type, and enhancement history from a one pixel version of the image
+        history = list(data.attrs.get("enhancement_history", []))
+        template_attrs = dict(data.attrs)
+        template_attrs["enhancement_history"] = list(history)
+        template_shape = tuple(data.shape[idx] if dim == "bands" else 1 for idx, dim in enumerate(dims))
+        template = XRImage(xr.DataArray(numpy.zeros(template_shape, dtype=data.dtype), dims=dims,
+                                        coords=band_coords, attrs=template_attrs))
+        _run_operations(template, self.operations)
+        out_dtype = template.data.dtype
+        new_history = template.data.attrs.get("enhancement_history", [])[len(history):]
+        kernel_steps = self._kernel_steps(new_history, dims, data.dtype)
+
+        new_data = data.data.map_blocks(_enhance_block, kernel_steps, out_dtype, dtype=out_dtype, token="enhance")
+        img.data = xr.DataArray(new_data, dims=dims, coords=data.coords, attrs=template.data.attrs)
+
+
+class CompilingEnhancer(Enhancer):
+    """SatPy `Enhancer` that compiles each dataset's enhancement chain once and fuses element-wise steps.
+
+    Pass an instance as the ``enhance`` keyword argument of SatPy image writers. One instance should be shared
+    by every writer and area in a run so chains are only compiled once.
+    """
+    def __init__(self, enhancement_config_file=None, cache_filename=None):
+        super(CompilingEnhancer, self).__init__(enhancement_config_file)
+        self.cache_filename = cache_filename
+        self._pipelines = {}
+        self._cache_modified = False
+        self._config_signature = None
+        self._num_sensor_configs = None
+        if self.cache_filename:
+            self._load_cache()
+
+    def _get_config_signature(self):
+        config_files = self.enhancement_config_file or []
+        if isinstance(config_files, str):
+            config_files = [config_files]
+        config_files = list(config_files) + list(self.sensor_enhancement_configs)
+        signature = []
+        for config_file in config_files:
+            try:
+                st = os.stat(config_file)
+                signature.append((str(config_file), st.st_size, st.st_mtime))
+            except (TypeError, OSError):
+                signature.append((repr(config_file), None, None))
+        return tuple(signature)
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_filename, "rb") as cache_file:
+                self._pipelines = pickle.load(cache_file)
+            LOG.debug("Loaded %d compiled enhancements from '%s'", len(self._pipelines), self.cache_filename)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            self._pipelines = {}
+
+    def save_cache(self):
+        """Save compiled enhancement chains to the cache file if any new chains were compiled."""
+        if not self.cache_filename or not self._cache_modified:
+            return
+        # chains compiled from older versions of the configuration files won't be used again
+        pipelines = dict((key, pipeline) for key, pipeline in self._pipelines.items()
+                         if key[0] == self._config_signature)
+        tmp_fn = self.cache_filename + ".{:d}.tmp".format(os.getpid())
+        try:
+            with open(tmp_fn, "wb") as cache_file:
+                pickle.dump(pipelines, cache_file)
+            os.replace(tmp_fn, self.cache_filename)
+            self._cache_modified = False
+        except (IOError, OSError, pickle.PicklingError, AttributeError, TypeError):
+            LOG.debug("Could not save compiled enhancements to '%s'", self.cache_filename, exc_info=True)
+            if os.path.isfile(tmp_fn):
+                os.remove(tmp_fn)
+
+    def _pipeline_key(self, info):
+        # sensor configuration files are added as new sensors are enhanced
+        if self._num_sensor_configs != len(self.sensor_enhancement_configs):
+            self._num_sensor_configs = len(self.sensor_enhancement_configs)
+            self._config_signature = self._get_config_signature()
+        match_keys = getattr(self.enhancement_tree, "match_keys", None) or DEFAULT_MATCH_KEYS
+        key = []
+        for match_key in match_keys:
+            value = info.get(match_key)
+            if isinstance(value, (set, frozenset, list, tuple)):
+                value = tuple(sorted(str(x) for x in value))
+            elif value is not None and not isinstance(value, (str, int, float)):
+                value = str(value)
+            key.append(value)
+        return (self._config_signature,) + tuple(key)
+
+    def compile(self, operations):
+        """Group consecutive element-wise operations in to `FusedOperations`."""
+        steps = []
+        run = []
+        for operation in operations:
+            if is_elementwise(operation):
+                run.append(operation)
+                continue
+            if run:
+                steps.append(FusedOperations(run) if len(run) > 1 else run[0])
+                run = []
+            steps.append(operation)
+        if run:
+            steps.append(FusedOperations(run) if len(run) > 1 else run[0])
+        return steps
+
+    def get_pipeline(self, **info):
+        """Get the compiled enhancement steps for a dataset."""
+        key = self._pipeline_key(info)
+        pipeline = self._pipelines.get(key)
+        if pipeline is None:
+            operations = self.enhancement_tree.find_match(**info)["operations"]
+            pipeline = self._pipelines[key] = self.compile(operations)
+            self._cache_modified = True
+            LOG.debug("Compiled enhancements for %s: %s", info.get("name"),
+                      [step.names if isinstance(step, FusedOperations) else step.get("name") for step in pipeline])
+        return pipeline
+
+    def apply(self, img, **info):
+        for step in self.get_pipeline(**info):
+            if isinstance(step, FusedOperations):
+                step(img)
+            else:
+                _run_operations(img, [step])